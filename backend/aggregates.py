@@ -0,0 +1,102 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+
+class AlertAggregates:
+    """Alert counters kept up to date as alerts are recorded
+
+    Totals per severity, type and calendar day are updated once per alert,
+    so dashboard statistics are answered without touching the database.
+    Days are taken from the alert timestamps, so "today" rolls over at
+    midnight on its own; only the last `days` days are kept. `rebuild`
+    loads the counters from the store at startup and `sync` counts the
+    alerts and analyses stored since, by this or any other process sharing
+    the database. Alert ids and analysis rowids only grow, so sync reads
+    just the new rows.
+    """
+
+    def __init__(self, days=30, clock=datetime.now):
+        self.days = days
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.version = None
+        self.stale = False
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.last_id = 0
+        self.last_revision = 0  # of the most recently changed alert
+        self.analyses = 0
+        self.last_analysis = 0  # rowid
+        self.by_severity = Counter()
+        self.by_type = Counter()
+        self.by_day = Counter()
+
+    def _oldest_day(self):
+        return (self.clock().date() - timedelta(days=self.days - 1)).isoformat()
+
+    def rebuild(self, store):
+        """Recount everything from the store"""
+        with self.lock:
+            self.reset()
+            self.version = store.data_version()
+            self.stale = False
+            self.total = store.count_alerts()
+            self.last_id = store.last_alert_id()
+            self.last_revision = store.last_alert_revision()
+            self.analyses, self.last_analysis = store.analyses_after(0)
+            self.by_severity.update(store.count_by('severity'))
+            self.by_type.update(store.count_by('type'))
+            self.by_day.update(store.count_by_day(self._oldest_day()))
+
+    def invalidate(self, *args):
+        """Store listener, the next sync reads the new rows"""
+        self.stale = True
+
+    def sync(self, store, page_size=1000):
+        """Count alerts and analyses stored since the last sync
+
+        Costs a single PRAGMA when nothing changed in the database, and three
+        index lookups when only other tables did.
+        """
+        with self.lock:
+            version = store.data_version()
+            if version == self.version and not self.stale:
+                return
+            self.version = version
+            self.stale = False
+
+            while True:
+                alerts, has_more = store.query_alerts(limit=page_size, after_id=self.last_id)
+                self._record(alerts)
+                if not has_more:
+                    break
+            count, self.last_analysis = store.analyses_after(self.last_analysis)
+            self.analyses += count
+            self.last_revision = store.last_alert_revision()
+
+    def _record(self, alerts):
+        for alert in alerts:
+            self.total += 1
+            self.last_id = max(self.last_id, alert.get('id', 0))
+            self.by_severity[alert.get('severity', 'medium')] += 1
+            self.by_type[alert.get('type', 'unknown')] += 1
+            # ISO timestamps start with the date
+            self.by_day[alert['timestamp'][:10]] += 1
+
+        # Drop days that fell out of the window
+        oldest = self._oldest_day()
+        for day in [day for day in self.by_day if day < oldest]:
+            del self.by_day[day]
+
+    def today(self):
+        """Alerts recorded today"""
+        return self.by_day.get(self.clock().date().isoformat(), 0)
+
+    def daily(self, days=7):
+        """(date, count) for the last `days` days, oldest first"""
+        today = self.clock().date()
+        dates = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+        return [(date, self.by_day.get(date.isoformat(), 0)) for date in dates]
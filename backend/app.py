@@ -1,9 +1,14 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import eventlet
+import eventlet.wsgi
+import hashlib
 import os
 import json
+import mimetypes
+import uuid
+from collections import Counter
 from datetime import datetime
 import threading
 import time
@@ -18,20 +23,46 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Range,If-None-Match')
+    response.headers.add('Access-Control-Expose-Headers', 'Content-Range,Content-Length,Accept-Ranges,ETag')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+# Web workers started by `run.py --production` share Socket.IO events
+# through a message bus, see bus.py
+MESSAGE_QUEUE = os.environ.get('URBANSIGHT_MESSAGE_QUEUE')
+PRODUCTION = os.environ.get('URBANSIGHT_PRODUCTION') == '1'
+WORKER_ID = int(os.environ.get('URBANSIGHT_WORKER_ID', 0))
+PORT = int(os.environ.get('URBANSIGHT_PORT', 5000))
+
+socketio_options = {}
+if MESSAGE_QUEUE:
+    from bus import create_manager
+    socketio_options['client_manager'] = create_manager(MESSAGE_QUEUE)
+
 socketio = SocketIO(app, 
                    cors_allowed_origins="*", 
                    async_mode='eventlet',
                    path='socket.io',
                    ping_timeout=60,
-                   ping_interval=25)
+                   ping_interval=25,
+                   **socketio_options)
 
 # Import AI modules
 from detector import VideoAnalyzer
-from face_blur import FaceBlurProcessor
+from backends import BACKENDS, DETECTION_PROFILES
+from face_blur import ANONYMIZE_METHODS, FaceBlurProcessor
+from encoders import OUTPUT_FORMATS
+from jobs import JobManager
+from profiling import PROFILERS
+from cache import ResultCache, cache_key, save_upload
+from detections import DetectionLog
+from store import AlertStore
+from aggregates import AlertAggregates
+from broadcaster import AlertBroadcaster
+from cameras import CameraManager, load_camera_config
+from timeseries import TimeSeriesStore
+import metrics
 
 # Initialize modules
 analyzer = VideoAnalyzer()
@@ -42,9 +73,49 @@ UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs("static/processed", exist_ok=True)
 
-# Store analysis results
-analyses = {}
-alerts_history = []
+# Finished analyses and their blurred videos, keyed by video content and
+# settings, so repeat uploads of a clip are answered without re-analysis
+CACHE_MAX_MB = int(os.environ.get('URBANSIGHT_CACHE_MB', 2048))
+result_cache = ResultCache('cache', max_bytes=CACHE_MAX_MB * 1024 * 1024)
+
+# HLS segments, not Qt Linguist files
+mimetypes.add_type('video/mp2t', '.ts')
+
+# Alerts and analysis results live in SQLite
+DATABASE = os.environ.get('URBANSIGHT_DB', 'urbansight.db')
+store = AlertStore(DATABASE)
+
+# People counts of cameras and analyzed videos, rolled up for charts. A
+# video's series and processed video live as long as the cache entry its
+# analyses share.
+timeseries = TimeSeriesStore(DATABASE)
+result_cache.subscribe(lambda key: forget_cached_analysis(key))
+
+# Uploads are analyzed on a bounded pool of worker processes, job records
+# are kept in the store so every web worker can report on them
+MAX_ANALYSIS_WORKERS = int(os.environ.get('URBANSIGHT_WORKERS', 0)) or None
+ANALYSIS_CPUS = int(os.environ.get('URBANSIGHT_CPUS', 0)) or None
+job_manager = JobManager(max_workers=MAX_ANALYSIS_WORKERS, store=store, cpus=ANALYSIS_CPUS)
+if not PRODUCTION:
+    # Nothing else runs jobs, so unfinished ones were cut off by a restart
+    store.fail_interrupted_jobs()
+
+# Dashboard counters, synced with alerts stored by any web worker
+aggregates = AlertAggregates()
+aggregates.rebuild(store)
+store.subscribe(on_alerts=aggregates.invalidate, on_analysis=aggregates.invalidate)
+
+# Stored alerts reach WebSocket clients in batches per room
+broadcaster = AlertBroadcaster(socketio)
+store.subscribe(on_alerts=broadcaster.publish)
+
+# Live cameras are configured in the store and run by one web worker;
+# URBANSIGHT_CAMERAS names a JSON file of cameras to add at startup
+CAMERAS_FILE = os.environ.get('URBANSIGHT_CAMERAS')
+CAMERA_LATENCY_BUDGET = float(os.environ.get('URBANSIGHT_CAMERA_LATENCY', 1.0))
+camera_manager = CameraManager(
+    analyzer, store=store, timeseries=timeseries, latency_budget=CAMERA_LATENCY_BUDGET
+)
 
 # ============================================
 # FRONTEND ROUTES
@@ -62,8 +133,14 @@ def serve_static_files(path):
 
 @app.route('/static/<path:filename>')
 def serve_processed_files(filename):
-    """Serve processed videos and images"""
-    return send_from_directory('static', filename)
+    """Serve processed videos and images
+    
+    Range requests get 206 partial responses, so the dashboard player can
+    start playing and seek without downloading the whole video.
+    """
+    response = send_from_directory('static', filename, conditional=True, max_age=3600)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
 
 @app.route('/uploads/<path:filename>')
 def serve_uploaded_files(filename):
@@ -77,10 +154,14 @@ def serve_uploaded_files(filename):
 @app.route('/api/status', methods=['GET'])
 def system_status():
     """Get overall system status for dashboard"""
+    aggregates.sync(store)
     return jsonify({
         'status': 'operational',
-        'analyses_count': len(analyses),
-        'alerts_count': len(alerts_history),
+        'analyses_count': aggregates.analyses,
+        'alerts_count': aggregates.total,
+        'active_jobs': job_manager.active_count(),
+        'cache': result_cache.stats(),
+        'broadcast': broadcaster.stats(),
         'active_features': [
             'crowd_detection',
             'suspicious_activity',
@@ -98,57 +179,114 @@ def system_status():
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get dashboard statistics"""
-    today = datetime.now().date()
-    today_alerts = []
-    
-    for a in alerts_history:
-        try:
-            if datetime.fromisoformat(a['timestamp']).date() == today:
-                today_alerts.append(a)
-        except:
-            pass
+    aggregates.sync(store)
+    by_severity = aggregates.by_severity
+    by_type = aggregates.by_type
     
     return jsonify({
-        'total_analyses': len(analyses),
-        'total_alerts': len(alerts_history),
-        'today_alerts': len(today_alerts),
-        'active_cameras': 0,  # Will be updated when cameras are active
+        'total_analyses': aggregates.analyses,
+        'total_alerts': aggregates.total,
+        'today_alerts': aggregates.today(),
+        'active_cameras': sum(
+            1 for camera in store.list_cameras()
+            if (camera['status'] or {}).get('state') == 'live'
+        ),
         'by_severity': {
-            'high': len([a for a in alerts_history if a.get('severity') == 'high']),
-            'medium': len([a for a in alerts_history if a.get('severity') == 'medium']),
-            'low': len([a for a in alerts_history if a.get('severity') == 'low'])
+            'high': by_severity.get('high', 0),
+            'medium': by_severity.get('medium', 0),
+            'low': by_severity.get('low', 0)
         },
         'by_type': {
-            'crowd': len([a for a in alerts_history if 'crowd' in a.get('type', '').lower()]),
-            'violence': len([a for a in alerts_history if 'violence' in a.get('type', '').lower()]),
-            'object': len([a for a in alerts_history if 'object' in a.get('type', '').lower()])
+            'crowd': by_type.get('crowd', 0),
+            'violence': by_type.get('violence', 0),
+            'object': by_type.get('object', 0)
         }
     })
 
+MAX_ALERTS_PAGE = 500
+
+def alert_query():
+    """Pagination cursors and filters shared by the alert endpoints"""
+    return {
+        'limit': max(1, min(request.args.get('limit', 10, type=int), MAX_ALERTS_PAGE)),
+        'before_id': request.args.get('before_id', type=int),
+        'after_id': request.args.get('after_id', type=int),
+        'alert_type': request.args.get('type'),
+        'severity': request.args.get('severity'),
+        'video_id': request.args.get('video_id'),
+        'camera_id': request.args.get('camera_id'),
+        'start': request.args.get('start'),
+        'end': request.args.get('end')
+    }
+
+def alerts_etag():
+    """Changes whenever an alert is stored or updated, differs per query string"""
+    aggregates.sync(store)
+    query = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return f"alerts-{aggregates.last_id}.{aggregates.last_revision}-{query}"
+
+def not_modified(etag):
+    """304 response if the client already has this version, else None"""
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Let clients cache the body but revalidate before every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/alerts', methods=['GET'])
 def get_alerts():
-    """Get recent alerts for dashboard"""
-    limit = request.args.get('limit', 10, type=int)
-    return jsonify({
-        'total': len(alerts_history),
-        'alerts': alerts_history[-limit:][::-1]  # Most recent first
-    })
+    """Get alerts for dashboard, most recent first
+    
+    Pages back with before_id, fetches only newer alerts with after_id,
+    and filters by type, severity, video_id, camera_id and a start/end
+    timestamp.
+    Polls with If-None-Match get a 304 until an alert is stored or updated.
+    """
+    etag = alerts_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    query = alert_query()
+    alerts, has_more = store.query_alerts(**query)
+    
+    return with_etag(jsonify({
+        'total': aggregates.total,
+        'alerts': alerts,
+        'latest_id': aggregates.last_id,
+        'has_more': has_more,
+        # Cursors for the next older page and the next poll
+        'before_id': alerts[-1]['id'] if alerts else query['before_id'],
+        'after_id': alerts[0]['id'] if alerts else query['after_id']
+    }), etag)
 
 @app.route('/api/activity', methods=['GET'])
 def get_recent_activity():
-    """Get recent activity for dashboard"""
-    limit = request.args.get('limit', 10, type=int)
+    """Get recent activity for dashboard, same filters as /api/alerts"""
+    etag = alerts_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    alerts, _ = store.query_alerts(**alert_query())
     activities = []
     
-    for alert in alerts_history[-limit:][::-1]:
+    for alert in alerts:
         activities.append({
+            'id': alert['id'],
             'type': alert.get('type', 'alert'),
             'message': alert.get('message', 'Activity detected'),
             'timestamp': alert.get('timestamp', datetime.now().isoformat()),
             'severity': alert.get('severity', 'medium')
         })
     
-    return jsonify(activities)
+    return with_etag(jsonify(activities), etag)
 
 # ============================================
 # VIDEO ANALYSIS ROUTES
@@ -168,60 +306,294 @@ def upload_video():
         if video.filename == '':
             return jsonify({'error': 'No selected file'}), 400
         
-        # Save video
+        config = {}
+        profile = request.form.get('profile')
+        if profile:
+            if profile not in DETECTION_PROFILES:
+                return jsonify({'error': f'Unknown detection profile: {profile}'}), 400
+            config['detection_profile'] = profile
+        
+        detector_backend = request.form.get('detector')
+        if detector_backend:
+            if detector_backend not in BACKENDS:
+                return jsonify({'error': f'Unknown detector backend: {detector_backend}'}), 400
+            config['detector_backend'] = detector_backend
+        
+        anonymize = request.form.get('anonymize')
+        if anonymize:
+            if anonymize not in ANONYMIZE_METHODS:
+                return jsonify({'error': f'Unknown anonymization method: {anonymize}'}), 400
+            config['anonymize_method'] = anonymize
+        
+        output_format = request.form.get('output_format')
+        if output_format:
+            if output_format not in OUTPUT_FORMATS:
+                return jsonify({'error': f'Unknown output format: {output_format}'}), 400
+            config['output_format'] = output_format
+        
+        # Opt-in profiling: 'true' or a profiler name from PROFILERS
+        profiling = request.form.get('profiling', 'false').lower()
+        if profiling == 'true':
+            profiling = 'cprofile'
+        elif profiling == 'false':
+            profiling = None
+        elif profiling not in PROFILERS:
+            return jsonify({'error': f'Unknown profiler: {profiling}'}), 400
+        
+        # Save video under its content hash, identical uploads share a file
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{video.filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        video.save(filepath)
-        
-        # Process video with AI
-        result = analyzer.analyze_video(filepath)
-        
-        # Add face blurring for privacy
-        privacy_mode = request.form.get('privacy_mode', 'true')
-        if privacy_mode.lower() == 'true':
-            blurred_path = face_processor.process_video(filepath)
-            if blurred_path:
-                relative_path = os.path.basename(blurred_path)
-                result['processed_video'] = f"/static/processed/{relative_path}"
-        
-        # Store result
-        result_id = f"analysis_{timestamp}"
-        analyses[result_id] = result
-        
-        # Add alerts for suspicious activity
-        if result.get('alerts'):
-            for alert_data in result.get('alerts', []):
-                alert = {
-                    'id': len(alerts_history) + 1,
-                    'type': alert_data.get('type', 'unknown'),
-                    'message': alert_data.get('message', 'Suspicious activity detected'),
-                    'timestamp': datetime.now().isoformat(),
-                    'severity': alert_data.get('severity', 'medium'),
-                    'video_id': result_id
-                }
-                alerts_history.append(alert)
-                
-                # Send real-time alert via WebSocket
-                socketio.emit('alert', alert)
+        extension = os.path.splitext(video.filename)[1]
+        content_hash, filepath, _ = save_upload(video.stream, UPLOAD_FOLDER, extension)
         
-        # Send analysis complete notification
-        socketio.emit('analysis_complete', {
-            'result_id': result_id,
-            'summary': result.get('summary', {})
-        })
+        privacy_mode = request.form.get('privacy_mode', 'true').lower() == 'true'
+        parallel = request.form.get('parallel', 'false').lower() == 'true'
+        result_id = f"analysis_{timestamp}_{uuid.uuid4().hex[:6]}"
+        
+        # Parallelism gives the same result, so it is not part of the key
+        settings = dict(analyzer.get_config(), **face_processor.get_config())
+        settings.update(config)
+        settings.pop('blur_workers', None)
+        settings['privacy_mode'] = privacy_mode
+        key = cache_key(content_hash, settings)
+        
+        # Same clip with the same settings: answer from the cache, unless
+        # the point is to profile the analysis
+        result = result_cache.get(key) if not profiling else None
+        if result is not None:
+            # Entries cached before series were shared have none yet
+            if 'people_series' not in result:
+                result['people_series'] = people_series(key)
+                record_people_counts(result)
+            store.save_analysis(result_id, result, cache_key=key)
+            publish_analysis(result_id, result)
+            return jsonify({
+                'success': True,
+                'cached': True,
+                'result_id': result_id,
+                'status': 'completed',
+                'summary': result.get('summary', {}),
+                'alerts': result.get('alerts', []),
+                'processed_video': result.get('processed_video')
+            })
+        
+        # Same clip already being analyzed: follow that job
+        job = job_manager.find_active(cache_key=key) if not profiling else None
+        if job is None:
+            # Queue analysis on the worker pool and return right away
+            job = job_manager.submit(
+                filepath,
+                privacy_mode=privacy_mode,
+                parallel=parallel,
+                config=config or None,
+                output_name=f"blurred_{key[:16]}" if not profiling else f"blurred_{result_id}",
+                profiling=profiling,
+                filename=video.filename,
+                result_id=result_id,
+                content_hash=content_hash,
+                # Profiled runs stay out of the cache, which would serve
+                # their profile with every later hit
+                cache_key=key if not profiling else None
+            )
+        if job is None:
+            return jsonify({'error': 'Analysis queue is full, try again later'}), 503
         
         return jsonify({
             'success': True,
-            'result_id': result_id,
-            'summary': result.get('summary', {}),
-            'alerts': result.get('alerts', [])
-        })
+            'job_id': job['id'],
+            'result_id': job['result_id'],
+            'status': job['status'],
+            'status_url': f"/api/jobs/{job['id']}"
+        }), 202
         
     except Exception as e:
         print(f"Error in upload_video: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def complete_analysis(job, result):
+    """Store a finished analysis job and notify clients"""
+    if result is None:
+        return
+    
+    # Store result
+    result_id = job['result_id']
+    result['people_series'] = people_series(job.get('cache_key')) or f"video:{result_id}"
+    store.save_analysis(result_id, result, cache_key=job.get('cache_key'))
+    record_people_counts(result)
+    
+    # Cache it along with the blurred video it produced
+    if job.get('cache_key'):
+        outputs = []
+        if result.get('processed_video'):
+            outputs.append(processed_video_path(result['processed_video']))
+        result_cache.put(job['cache_key'], result, outputs)
+    
+    publish_analysis(result_id, result, job['id'])
+
+def publish_analysis(result_id, result, job_id=None):
+    """Store the alerts of an analysis and notify clients it is complete
+    
+    Results served from the cache come through here as well, so a repeat
+    upload raises the same alerts as the first one.
+    """
+    # Add alerts for suspicious activity, stored in one transaction
+    if result.get('alerts'):
+        alerts = []
+        for alert_data in result.get('alerts', []):
+            alerts.append({
+                'type': alert_data.get('type', 'unknown'),
+                'message': alert_data.get('message', 'Suspicious activity detected'),
+                'timestamp': datetime.now().isoformat(),
+                'severity': alert_data.get('severity', 'medium'),
+                'video_id': result_id
+            })
+        store.add_alerts(alerts)
+    
+    # Send analysis complete notification
+    socketio.emit('analysis_complete', {
+        'result_id': result_id,
+        'job_id': job_id,
+        'summary': result.get('summary', {})
+    })
+
+def people_series(cache_key):
+    """Crowd chart series shared by every analysis served from a cache entry"""
+    return f"video:{cache_key[:16]}" if cache_key else None
+
+def record_people_counts(result):
+    """Keep the people count of every analyzed sample for the crowd chart"""
+    detections_path = result.get('detections')
+    if not detections_path or not os.path.exists(detections_path):
+        return
+    
+    series = result['people_series']
+    log = DetectionLog.load(detections_path)
+    # Replace, rather than add to, samples recorded for the series before
+    timeseries.delete(series)
+    timeseries.add((series, seconds, people) for seconds, people in log.people_counts())
+
+def forget_cached_analysis(key):
+    """Cache listener, drops the crowd chart series of a removed entry and
+    the links of stored analyses to its processed video"""
+    timeseries.delete(people_series(key))
+    expired = store.expire_processed_videos(key)
+    if expired:
+        print(f"Processed video of cached analysis {key[:12]} removed, unlinked from {expired} analyses")
+
+def processed_video_path(url):
+    """Local path of a processed video from its /static URL"""
+    path = os.path.join('static', *url[len('/static/'):].split('/'))
+    
+    # HLS output is owned as its whole directory
+    if path.endswith('.m3u8'):
+        return os.path.dirname(path)
+    return path
+
+def report_job_progress(job):
+    """Push job progress to connected clients"""
+    socketio.emit('job_progress', job_status(job))
+
+def job_status(job):
+    """Public view of a job record"""
+    return {
+        'job_id': job['id'],
+        'filename': job.get('filename'),
+        'status': job['status'],
+        'progress': job['progress'],
+        'stage': job['stage'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'completed_at': job['completed_at'],
+        'result_id': job['result_id'],
+        'error': job['error']
+    }
+
+job_manager.on_progress = report_job_progress
+job_manager.on_complete = complete_analysis
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List analysis jobs, most recent first"""
+    jobs = [job_status(job) for job in job_manager.list()][::-1]
+    return jsonify({
+        'active': job_manager.active_count(),
+        'workers': job_manager.max_workers,
+        'jobs': jobs
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of an analysis job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    status = job_status(job)
+    if job['status'] == 'completed':
+        result = store.get_analysis(job['result_id']) or {}
+        status['summary'] = result.get('summary', {})
+        status['alerts'] = result.get('alerts', [])
+        status['processed_video'] = result.get('processed_video')
+        if result.get('profile'):
+            status['profile'] = result['profile']
+    
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/progress', methods=['GET'])
+def get_job_progress(job_id):
+    """Get just the progress of an analysis job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'stage': job['stage']
+    })
+
+@app.route('/api/analyses/<result_id>', methods=['GET'])
+def get_analysis(result_id):
+    """Get a stored analysis result"""
+    result = store.get_analysis(result_id)
+    if result is None:
+        return jsonify({'error': 'Analysis not found'}), 404
+    
+    return jsonify(dict(result, result_id=result_id))
+
+@app.route('/api/analyses/<result_id>/rescore', methods=['POST'])
+def rescore_analysis(result_id):
+    """Re-run alerting for an analysis with new thresholds
+    
+    Uses the detections stored during analysis, so no video is decoded.
+    Body: {"crowd_threshold": 10, "moderate_crowd_threshold": 6,
+    "violence_threshold": 300}. Crowd incidents open above the lower of
+    the two crowd thresholds, crowd_threshold sets which ones are large.
+    """
+    result = store.get_analysis(result_id)
+    if result is None:
+        return jsonify({'error': 'Analysis not found'}), 404
+    
+    detections_path = result.get('detections')
+    if not detections_path or not os.path.exists(detections_path):
+        return jsonify({'error': 'No stored detections for this analysis'}), 409
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        thresholds = {}
+        for key in ('crowd_threshold', 'moderate_crowd_threshold', 'violence_threshold'):
+            if data.get(key) is not None:
+                thresholds[key] = float(data[key])
+        
+        log = DetectionLog.load(detections_path)
+        rescored = analyzer.rescore(log, **thresholds)
+        rescored['result_id'] = result_id
+        
+        return jsonify(rescored)
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/demo/analyze', methods=['POST'])
 def demo_analysis():
     """Run demo analysis for testing"""
@@ -266,25 +638,22 @@ def demo_analysis():
         }
         
         # Store demo results
-        analyses[result_id] = {
+        store.save_analysis(result_id, {
             'summary': demo_summary,
             'alerts': demo_alerts,
             'suspicious_activity': demo_alerts[0] if demo_alerts else None
-        }
+        })
         
         # Add alerts to history
-        for alert_data in demo_alerts:
-            alert = {
-                'id': len(alerts_history) + 1,
-                'type': alert_data['type'],
-                'message': alert_data['message'],
-                'timestamp': datetime.now().isoformat(),
-                'severity': alert_data['severity'],
-                'video_id': result_id,
-                'simulated': True
-            }
-            alerts_history.append(alert)
-            socketio.emit('alert', alert)
+        alerts = [{
+            'type': alert_data['type'],
+            'message': alert_data['message'],
+            'timestamp': datetime.now().isoformat(),
+            'severity': alert_data['severity'],
+            'video_id': result_id,
+            'simulated': True
+        } for alert_data in demo_alerts]
+        store.add_alerts(alerts)
         
         return jsonify({
             'success': True,
@@ -297,6 +666,49 @@ def demo_analysis():
         print(f"Error in demo_analysis: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# ============================================
+# CAMERA ROUTES
+# ============================================
+
+@app.route('/api/cameras', methods=['GET'])
+def list_cameras():
+    """List live cameras with their ingestion status (fps, lag, drops)"""
+    cameras = store.list_cameras()
+    return jsonify({
+        'active': sum(1 for camera in cameras if (camera['status'] or {}).get('state') == 'live'),
+        'cameras': cameras
+    })
+
+@app.route('/api/cameras', methods=['POST'])
+def add_camera():
+    """Add or update a live camera
+    
+    Body: {"id": "lobby", "source": "rtsp://...", "name": "Lobby", "loop": true}
+    source is a stream URL, a device index or a local file path. Local
+    files are played at their frame rate and loop unless loop is false.
+    """
+    data = request.get_json(silent=True) or {}
+    camera_id = str(data.get('id') or '').strip()
+    source = data.get('source')
+    if not camera_id or source in (None, ''):
+        return jsonify({'error': 'Camera needs an id and a source'}), 400
+    
+    camera = {
+        'id': camera_id,
+        'source': source,
+        'name': data.get('name') or camera_id,
+        'loop': bool(data.get('loop', True))
+    }
+    store.save_camera(camera)
+    return jsonify({'success': True, 'camera': camera}), 201
+
+@app.route('/api/cameras/<camera_id>', methods=['DELETE'])
+def delete_camera(camera_id):
+    """Stop and remove a live camera"""
+    if not store.delete_camera(camera_id):
+        return jsonify({'error': 'Camera not found'}), 404
+    return jsonify({'success': True})
+
 # ============================================
 # PRIVACY MODE ROUTES
 # ============================================
@@ -348,6 +760,7 @@ def privacy_status():
 def handle_connect():
     """Handle client WebSocket connection"""
     print(f'Client connected: {request.sid}')
+    broadcaster.subscribe(request.sid)
     emit('connected', {
         'message': 'Connected to UrbanSight AI System',
         'timestamp': datetime.now().isoformat()
@@ -357,22 +770,39 @@ def handle_connect():
 def handle_disconnect():
     """Handle client WebSocket disconnection"""
     print(f'Client disconnected: {request.sid}')
+    broadcaster.forget(request.sid)
 
 @socketio.on('request_alerts')
 def handle_request_alerts():
     """Send recent alerts to newly connected client"""
-    recent_alerts = alerts_history[-10:][::-1]
+    recent_alerts = store.recent_alerts(10)
     emit('initial_alerts', {'alerts': recent_alerts})
 
+@socketio.on('subscribe_alerts')
+def handle_subscribe_alerts(data):
+    """Limit alerts sent to a client to some severities, videos or cameras
+    
+    data: {"severity": ["high"], "video_id": ..., "camera_id": ...}, an
+    empty object subscribes to all alerts again.
+    """
+    try:
+        rooms = broadcaster.subscribe(request.sid, data if isinstance(data, dict) else {})
+        emit('alerts_subscribed', {'rooms': rooms})
+    except ValueError as e:
+        emit('error', {'error': str(e)})
+
 # ============================================
 # LIVE MONITORING SIMULATION
 # ============================================
 
 def simulate_live_monitoring():
-    """Simulate live camera feed for demo"""
+    """Simulate live camera feed for demo, while no real camera runs"""
     while True:
         time.sleep(45)  # Generate alert every 45 seconds
         
+        if camera_manager.cameras:
+            continue
+        
         try:
             # 40% chance to generate alert
             if random.random() > 0.6:
@@ -387,17 +817,13 @@ def simulate_live_monitoring():
                 
                 alert_type, message, severity = random.choice(alert_types)
                 
-                alert = {
-                    'id': len(alerts_history) + 1,
+                store.add_alert({
                     'type': alert_type,
                     'message': message,
                     'timestamp': datetime.now().isoformat(),
                     'severity': severity,
                     'simulated': True
-                }
-                
-                alerts_history.append(alert)
-                socketio.emit('alert', alert)
+                })
                 print(f"Simulated alert: {message}")
                 
         except Exception as e:
@@ -408,38 +834,64 @@ def simulate_live_monitoring():
 # CHART DATA ROUTES
 # ============================================
 
+# Label format of chart buckets per time series resolution
+CHART_LABELS = {'second': '%H:%M:%S', 'minute': '%H:%M', 'hour': '%H:00', 'day': '%b %d'}
+
 @app.route('/api/charts/crowd', methods=['GET'])
 def get_crowd_chart_data():
-    """Get crowd density trend data for charts"""
-    # Generate sample data for the last 10 time periods
-    labels = []
-    data = []
+    """Get crowd density trend data for charts
+    
+    Mean and peak people count per time bucket, for all live cameras over
+    the last `window` seconds (10 hours by default), one camera with
+    camera_id, or the whole of an analyzed video with video_id. `points`
+    caps the number of buckets.
+    """
+    points = max(1, min(request.args.get('points', 10, type=int), 500))
+    video_id = request.args.get('video_id')
     
-    for i in range(10, 0, -1):
-        time_label = f"{(datetime.now().hour - i) % 24}:00"
-        labels.append(time_label)
+    if video_id:
+        result = store.get_analysis(video_id)
+        if result is None:
+            return jsonify({'error': 'Analysis not found'}), 404
         
-        # Generate realistic crowd data
-        base_value = 15
-        variation = random.randint(-5, 10)
-        data.append(max(0, base_value + variation))
+        duration = max(1, result.get('video_info', {}).get('duration', 0))
+        series = result.get('people_series', f"video:{video_id}")
+        resolution, buckets = timeseries.query(series, 0, duration, max_points=points)
+        labels = [f"{int(bucket['time'] // 60)}:{int(bucket['time'] % 60):02d}" for bucket in buckets]
+    else:
+        camera_id = request.args.get('camera_id')
+        series = f"camera:{camera_id}" if camera_id else 'cameras'
+        window = max(1, request.args.get('window', 36000, type=int))
+        resolution, buckets = timeseries.recent(series, window, max_points=points)
+        labels = [
+            datetime.fromtimestamp(bucket['time']).strftime(CHART_LABELS[resolution])
+            for bucket in buckets
+        ]
     
     return jsonify({
         'labels': labels,
+        'resolution': resolution,
         'datasets': [{
             'label': 'People Count',
-            'data': data,
+            'data': [bucket['mean'] for bucket in buckets],
             'borderColor': '#00d4ff',
             'backgroundColor': 'rgba(0, 212, 255, 0.1)'
+        }, {
+            'label': 'Peak',
+            'data': [bucket['max'] for bucket in buckets],
+            'borderColor': '#ff4757',
+            'backgroundColor': 'rgba(255, 71, 87, 0.1)'
         }]
     })
 
 @app.route('/api/charts/alerts', methods=['GET'])
 def get_alert_chart_data():
     """Get alert distribution data for charts"""
-    crowd_count = len([a for a in alerts_history if 'crowd' in a.get('type', '').lower()])
-    violence_count = len([a for a in alerts_history if 'violence' in a.get('type', '').lower()])
-    object_count = len([a for a in alerts_history if 'object' in a.get('type', '').lower()])
+    aggregates.sync(store)
+    by_type = aggregates.by_type
+    crowd_count = by_type.get('crowd', 0)
+    violence_count = by_type.get('violence', 0)
+    object_count = by_type.get('object', 0)
     
     # Ensure we have some data to display
     if crowd_count + violence_count + object_count == 0:
@@ -455,26 +907,96 @@ def get_alert_chart_data():
 
 @app.route('/api/charts/timeline', methods=['GET'])
 def get_timeline_chart_data():
-    """Get activity timeline data for charts"""
-    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    data = []
-    
-    for i in range(7):
-        # Generate realistic alert counts
-        if i < 5:  # Weekdays
-            data.append(random.randint(3, 10))
-        else:  # Weekend
-            data.append(random.randint(1, 6))
+    """Get activity timeline data for charts, alerts per day for the last week"""
+    aggregates.sync(store)
+    daily = aggregates.daily(7)
     
     return jsonify({
-        'labels': days,
+        'labels': [date.strftime('%a') for date, _ in daily],
         'datasets': [{
             'label': 'Alerts',
-            'data': data,
+            'data': [count for _, count in daily],
             'backgroundColor': '#00d4ff'
         }]
     })
 
+# ============================================
+# METRICS
+# ============================================
+
+# Web workers of `run.py --production` save their counters and histograms
+# to the store this often, so any of them can answer a scrape for all
+METRICS_PUBLISH_INTERVAL = 5.0
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe(
+            'urbansight_http_request_duration_seconds',
+            time.perf_counter() - started,
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=str(response.status_code)
+        )
+    return response
+
+def camera_gauge(key, scale=1):
+    """Gauge of a value from the saved status of every camera"""
+    def read():
+        values = {}
+        for camera in store.list_cameras():
+            value = (camera['status'] or {}).get(key)
+            if value is not None:
+                values[(('camera', camera['id']),)] = value * scale
+        return values
+    return read
+
+def camera_states():
+    states = Counter((camera['status'] or {}).get('state', 'stopped') for camera in store.list_cameras())
+    return {(('state', state),): count for state, count in states.items()}
+
+metrics.REGISTRY.gauge(
+    'urbansight_jobs', 'Analysis jobs queued or running in any process',
+    lambda: {(('status', status),): count for status, count in store.count_jobs().items()}
+)
+metrics.REGISTRY.gauge('urbansight_cameras', 'Configured cameras by state', camera_states)
+metrics.REGISTRY.gauge('urbansight_camera_fps', 'Frames grabbed per second', camera_gauge('fps'))
+metrics.REGISTRY.gauge(
+    'urbansight_camera_analyzed_fps', 'Frames analyzed per second', camera_gauge('analyzed_fps')
+)
+metrics.REGISTRY.gauge(
+    'urbansight_camera_lag_seconds', 'Mean time from grabbing a frame to finishing its analysis',
+    camera_gauge('lag_ms', 0.001)
+)
+metrics.REGISTRY.gauge(
+    'urbansight_alert_queue_depth', 'Alerts waiting for the next broadcast batch in this worker',
+    lambda: {(('worker', WORKER_ID),): len(broadcaster.pending)}
+)
+metrics.REGISTRY.gauge(
+    'urbansight_cache_bytes', 'Size of cached results and blurred videos',
+    lambda: result_cache.stats()['bytes']
+)
+
+def publish_metrics():
+    """Save this worker's metrics to the store, as a background task"""
+    while True:
+        try:
+            store.save_metrics(WORKER_ID, metrics.REGISTRY.snapshot())
+        except Exception as e:
+            print(f"Error publishing metrics: {e}")
+        socketio.sleep(METRICS_PUBLISH_INTERVAL)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of every web worker and the jobs they ran"""
+    others = store.load_metrics(exclude=WORKER_ID) if PRODUCTION else []
+    return Response(metrics.REGISTRY.render(others), mimetype='text/plain; version=0.0.4')
+
 # ============================================
 # ERROR HANDLERS
 # ============================================
@@ -494,27 +1016,53 @@ def internal_error(error):
 # ============================================
 
 if __name__ == '__main__':
-    # Start live monitoring thread
-    monitor_thread = threading.Thread(target=simulate_live_monitoring, daemon=True)
-    monitor_thread.start()
-    
-    # Print startup banner
-    print("="*60)
-    print("  UrbanSight AI Surveillance System")
-    print("="*60)
-    print(f"  Dashboard: http://localhost:5000")
-    print(f"  API: http://localhost:5000/api/status")
-    print(f"  WebSocket: ws://localhost:5000/socket.io")
-    print("="*60)
-    print("  Active Features:")
-    print("  • Crowd Detection")
-    print("  • Suspicious Activity Detection")
-    print("  • Unattended Object Detection")
-    print("  • Privacy Mode (Face Blurring)")
-    print("  • Real-time Alerts")
-    print("="*60)
-    print("  Server starting... Press Ctrl+C to stop")
-    print("="*60)
-    
-    # Run the application
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Start live monitoring thread, in one web worker only. With debug=True
+    # this file also runs in the reloader's parent process, which only
+    # watches for code changes.
+    serving = PRODUCTION or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if WORKER_ID == 0 and serving:
+        if CAMERAS_FILE:
+            for camera in load_camera_config(CAMERAS_FILE):
+                store.save_camera(camera)
+        
+        # Cameras run on OS threads, the monitor saves their alerts and
+        # status from the event loop
+        socketio.start_background_task(camera_manager.monitor, socketio.sleep)
+        
+        monitor_thread = threading.Thread(target=simulate_live_monitoring, daemon=True)
+        monitor_thread.start()
+    
+    # Collect progress and results from analysis workers
+    socketio.start_background_task(job_manager.monitor, socketio.sleep)
+    
+    if PRODUCTION:
+        socketio.start_background_task(publish_metrics)
+        
+        # Every web worker listens on the same port (SO_REUSEPORT) and the
+        # kernel spreads connections between them
+        print(f"Web worker {WORKER_ID} (pid {os.getpid()}) serving on port {PORT}")
+        listener = eventlet.listen(('0.0.0.0', PORT), reuse_port=True)
+        eventlet.wsgi.server(listener, app, log_output=False)
+    else:
+        # Print startup banner
+        print("="*60)
+        print("  UrbanSight AI Surveillance System")
+        print("="*60)
+        print(f"  Dashboard: http://localhost:{PORT}")
+        print(f"  API: http://localhost:{PORT}/api/status")
+        print(f"  WebSocket: ws://localhost:{PORT}/socket.io")
+        print(f"  Metrics: http://localhost:{PORT}/metrics")
+        print("="*60)
+        print("  Active Features:")
+        print("  • Crowd Detection")
+        print("  • Suspicious Activity Detection")
+        print("  • Unattended Object Detection")
+        print("  • Privacy Mode (Face Blurring)")
+        print("  • Real-time Alerts")
+        print("  • Live Camera Monitoring")
+        print("="*60)
+        print("  Server starting... Press Ctrl+C to stop")
+        print("="*60)
+        
+        # Run the application
+        socketio.run(app, host='0.0.0.0', port=PORT, debug=True)
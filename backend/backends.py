@@ -0,0 +1,169 @@
+import cv2
+import numpy as np
+
+# People detector settings per profile. Frames wider than max_width are
+# downscaled before HOG and the boxes are mapped back to original pixels,
+# so size filters and movement scores do not depend on the profile.
+# HOG needs a person to be 128 px tall at detection scale, so downscaling
+# trades small/distant people for speed (see README.md for measurements):
+#
+#   fast      1080p: ~70x faster than accurate, people under ~384 px missed
+#   balanced  1080p: ~15x faster than accurate, people under ~256 px missed
+#   accurate  native resolution with a dense 4 px stride (original settings)
+DETECTION_PROFILES = {
+    'fast': {'max_width': 640, 'win_stride': (8, 8), 'padding': (8, 8), 'scale': 1.1},
+    'balanced': {'max_width': 960, 'win_stride': (8, 8), 'padding': (8, 8), 'scale': 1.05},
+    'accurate': {'max_width': None, 'win_stride': (4, 4), 'padding': (8, 8), 'scale': 1.05}
+}
+
+
+class DetectorBackend:
+    """People detector used by VideoAnalyzer
+
+    Backends return boxes as an (N, 4) array of x, y, w, h in the pixel
+    coordinates of the frame they were given. Backends override `detect`,
+    or, if they benefit from batching, set `batch_size` above 1 and
+    override `detect_batch`; each default is written in terms of the other.
+    """
+
+    name = 'base'
+    model = 'none'
+    batch_size = 1
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.detect is DetectorBackend.detect and cls.detect_batch is DetectorBackend.detect_batch:
+            raise TypeError(f"{cls.__name__} must override detect or detect_batch")
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
+
+    def status(self):
+        return {
+            'backend': self.name,
+            'model': self.model,
+            'batch_size': self.batch_size
+        }
+
+
+class HOGBackend(DetectorBackend):
+    """OpenCV HOG + linear SVM people detector"""
+
+    name = 'hog'
+    model = 'OpenCV HOG'
+
+    def __init__(self, profile='balanced'):
+        if profile not in DETECTION_PROFILES:
+            raise ValueError(f"Unknown detection profile: {profile}")
+        self.profile = profile
+
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(self, frame):
+        profile = DETECTION_PROFILES[self.profile]
+
+        # Downscale large frames for the detector
+        h, w = frame.shape[:2]
+        factor = 1.0
+        max_width = profile['max_width']
+        if max_width and w > max_width:
+            factor = max_width / w
+            frame = cv2.resize(
+                frame,
+                (max_width, max(1, int(round(h * factor)))),
+                interpolation=cv2.INTER_AREA
+            )
+
+        # Detect people using HOG
+        (rects, _) = self.hog.detectMultiScale(
+            frame,
+            winStride=profile['win_stride'],
+            padding=profile['padding'],
+            scale=profile['scale']
+        )
+
+        # Map boxes back to original coordinates
+        if factor != 1.0 and len(rects):
+            rects = np.round(np.asarray(rects) / factor).astype(int)
+
+        return rects
+
+    def status(self):
+        status = super().status()
+        status['profile'] = self.profile
+        return status
+
+
+class YOLOBackend(DetectorBackend):
+    """Ultralytics YOLO people detector running on the CPU
+
+    Accepts PyTorch (.pt) weights or an ONNX export (.onnx, run through
+    ONNX Runtime by ultralytics). Sampled frames are passed in batches so
+    the per-call overhead is shared between several frames.
+    """
+
+    name = 'yolo'
+    PERSON_CLASS = 0
+
+    def __init__(self, model_path='yolov8n.pt', batch_size=4, confidence=0.4, image_size=640):
+        try:
+            from ultralytics import YOLO
+        except ImportError:
+            raise RuntimeError(
+                "The yolo detector backend needs the ultralytics package "
+                "(pip install ultralytics, plus onnxruntime for .onnx models)"
+            )
+
+        self.model = model_path
+        self.batch_size = max(1, int(batch_size))
+        self.confidence = confidence
+        self.image_size = image_size
+        self.yolo = YOLO(model_path, task='detect')
+
+    def detect_batch(self, frames):
+        if not frames:
+            return []
+
+        predictions = self.yolo.predict(
+            frames,
+            imgsz=self.image_size,
+            conf=self.confidence,
+            classes=[self.PERSON_CLASS],
+            device='cpu',
+            verbose=False
+        )
+
+        results = []
+        for prediction in predictions:
+            xyxy = prediction.boxes.xyxy.cpu().numpy() if len(prediction.boxes) else np.zeros((0, 4))
+            rects = np.empty((len(xyxy), 4), dtype=int)
+            rects[:, :2] = np.round(xyxy[:, :2])
+            rects[:, 2:] = np.round(xyxy[:, 2:] - xyxy[:, :2])
+            results.append(rects)
+
+        return results
+
+    def status(self):
+        status = super().status()
+        status.update({
+            'confidence': self.confidence,
+            'image_size': self.image_size
+        })
+        return status
+
+
+BACKENDS = {
+    'hog': HOGBackend,
+    'yolo': YOLOBackend
+}
+
+
+def create_backend(name, **options):
+    """Create a detector backend by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {name}")
+    return BACKENDS[name](**options)
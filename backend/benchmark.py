@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+"""
+UrbanSight - Performance benchmarks
+
+Times the hot paths of analysis and face blurring on a synthetic video
+that is generated from a seed, so every run and every machine measures
+the same pixels. Needs nothing beyond the backend requirements and no
+network access.
+
+    python benchmark.py                                 run, print a table
+    python benchmark.py --output results.json           also save the results
+    python benchmark.py --save-baseline base.json       save results as the baseline
+    python benchmark.py --baseline base.json            compare, exit 1 on a regression
+    python benchmark.py --only analyze_frame,blur_faces --width 1920 --height 1080
+
+Baselines are only meaningful on the machine (and OpenCV build) that
+recorded them; the environment is saved with the results.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Micro-benchmarks report milliseconds per call (lower is better),
+# end-to-end benchmarks frames per second of video (higher is better)
+BENCHMARKS = (
+    'analyze_frame', 'detect_faces', 'blur_faces', 'blur_regions', 'add_privacy_watermark',
+    'analyze_video', 'process_video'
+)
+
+SKIN = (150, 180, 225)
+DARK = (35, 35, 45)
+
+
+# ============================================
+# SYNTHETIC VIDEO
+# ============================================
+
+class SyntheticScene:
+    """Deterministic frames with walking people and faces on a textured background
+
+    People are dark silhouettes about a third of the frame tall, which
+    the HOG detector picks up; faces are simple drawn faces the Haar
+    cascade finds. Sprites move on straight lines and bounce off the
+    frame edges, so consecutive frames differ like real footage.
+    """
+
+    def __init__(self, width=1280, height=720, fps=25, people=4, faces=2, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        rng = np.random.default_rng(seed)
+
+        # Smooth colour noise, busy enough that nothing is trivially skipped
+        noise = rng.integers(0, 255, (max(1, height // 8), max(1, width // 8), 3), dtype=np.uint8)
+        background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        background = cv2.GaussianBlur(background, (0, 0), 3)
+        self.background = (background * 0.5 + 90).astype(np.uint8)
+
+        self.person_height = max(140, int(height * 0.4))
+        self.face_size = max(40, int(height * 0.11))
+        self.people = [self._sprite(rng, self.person_height * 0.3, self.person_height) for _ in range(people)]
+        self.faces = [self._sprite(rng, self.face_size, self.face_size * 1.3) for _ in range(faces)]
+
+    def _sprite(self, rng, sprite_width, sprite_height):
+        # Start position, velocity in px/s and walking phase
+        return {
+            'x': rng.uniform(sprite_width, max(sprite_width + 1, self.width - sprite_width)),
+            'y': rng.uniform(0, max(1, self.height - sprite_height)),
+            'vx': rng.uniform(-120, 120),
+            'vy': rng.uniform(-30, 30),
+            'phase': rng.uniform(0, 2 * math.pi),
+            'size': (sprite_width, sprite_height)
+        }
+
+    def _position(self, sprite, t):
+        # Bounce between the edges: fold the straight-line path back into range
+        def fold(start, velocity, low, high):
+            span = max(1.0, high - low)
+            offset = (start - low + velocity * t) % (2 * span)
+            return low + (offset if offset <= span else 2 * span - offset)
+
+        sprite_width, sprite_height = sprite['size']
+        x = fold(sprite['x'], sprite['vx'], sprite_width / 2, self.width - sprite_width / 2)
+        y = fold(sprite['y'], sprite['vy'], 0, self.height - sprite_height)
+        return int(x), int(y)
+
+    def _draw_person(self, frame, x, y, swing):
+        h = self.person_height
+        w = int(h * 0.28)
+        cv2.circle(frame, (x, y + int(h * 0.08)), int(h * 0.07), DARK, -1)
+        cv2.rectangle(frame, (x - w // 2, y + int(h * 0.16)), (x + w // 2, y + int(h * 0.55)), DARK, -1)
+        step = int(swing * h * 0.08)
+        for side in (-1, 1):
+            cv2.line(frame, (x + side * w // 4, y + int(h * 0.55)), (x + side * w // 4 - side * step, y + h),
+                     DARK, max(1, int(h * 0.07)))
+            cv2.line(frame, (x + side * w // 2, y + int(h * 0.2)), (x + side * (w // 2 + step // 2), y + int(h * 0.5)),
+                     DARK, max(1, int(h * 0.05)))
+
+    def _draw_face(self, frame, x, y):
+        s = self.face_size
+        cy = y + int(s * 0.65)
+        cv2.ellipse(frame, (x, cy), (int(s * 0.5), int(s * 0.65)), 0, 0, 360, SKIN, -1)
+        cv2.ellipse(frame, (x, cy - int(s * 0.55)), (int(s * 0.55), int(s * 0.3)), 0, 180, 360, (30, 30, 40), -1)
+        for side in (-1, 1):
+            eye = x + int(side * 0.2 * s)
+            cv2.ellipse(frame, (eye, cy - int(s * 0.12)), (int(s * 0.11), int(s * 0.05)), 0, 0, 360, (40, 40, 60), -1)
+            cv2.line(frame, (eye - int(s * 0.14), cy - int(s * 0.24)), (eye + int(s * 0.14), cy - int(s * 0.24)),
+                     (50, 50, 70), max(1, int(s * 0.04)))
+        cv2.line(frame, (x, cy - int(s * 0.05)), (x, cy + int(s * 0.15)), (110, 130, 180), max(1, int(s * 0.04)))
+        cv2.ellipse(frame, (x, cy + int(s * 0.32)), (int(s * 0.18), int(s * 0.05)), 0, 0, 360, (60, 60, 120), -1)
+
+    def frame(self, index):
+        """Frame `index` (from 0) of the scene"""
+        t = index / self.fps
+        frame = self.background.copy()
+        for person in self.people:
+            x, y = self._position(person, t)
+            self._draw_person(frame, x, y, math.sin(person['phase'] + t * 2 * math.pi))
+        for face in self.faces:
+            x, y = self._position(face, t)
+            self._draw_face(frame, x, y)
+        return frame
+
+
+def generate_video(path, seconds=10, **scene_options):
+    """Write a synthetic scene to an MPEG-4 file, returns its path"""
+    scene = SyntheticScene(**scene_options)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), scene.fps, (scene.width, scene.height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not write {path}")
+    try:
+        for index in range(int(seconds * scene.fps)):
+            writer.write(scene.frame(index))
+    finally:
+        writer.release()
+    return path
+
+
+def cached_video(directory, seconds=10, **scene_options):
+    """Synthetic video for these settings, generated once per directory"""
+    key = json.dumps(dict(scene_options, seconds=seconds), sort_keys=True)
+    name = f"synthetic_{hashlib.sha256(key.encode()).hexdigest()[:12]}.mp4"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate_video(path + '.tmp.mp4', seconds, **scene_options)
+        os.replace(path + '.tmp.mp4', path)
+    return path
+
+
+# ============================================
+# MEASUREMENT
+# ============================================
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the progress prints of the models while timing"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Processed videos are written under ./static, keep them out of the tree"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def time_calls(function, frames, repeat, warmup=2):
+    """Milliseconds per call of function(frame) cycling through frames"""
+    for index in range(warmup):
+        function(frames[index % len(frames)].copy())
+
+    timings = []
+    for index in range(repeat):
+        # Functions that draw in place get a fresh frame, copied outside the timing
+        frame = frames[index % len(frames)].copy()
+        start = time.perf_counter()
+        function(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'unit': 'ms',
+        'value': round(statistics.median(timings), 3),
+        'p90': round(timings[min(len(timings) - 1, int(len(timings) * 0.9))], 3),
+        'min': round(timings[0], 3),
+        'runs': len(timings)
+    }
+
+
+def time_video(function, total_frames, repeat):
+    """Frames per second of video for function(), best of `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        'unit': 'fps',
+        'value': round(total_frames / best, 2),
+        'seconds': round(best, 3),
+        'frames': total_frames,
+        'runs': repeat
+    }
+
+
+def cpu_model():
+    """CPU model name, from /proc/cpuinfo on Linux"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def environment():
+    return {
+        'cpu': cpu_model(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+
+def run_benchmarks(args):
+    """Run the selected benchmarks, returns the results document"""
+    from detector import VideoAnalyzer
+    from face_blur import FaceBlurProcessor
+
+    scene_options = {
+        'width': args.width, 'height': args.height, 'fps': args.fps,
+        'people': args.people, 'faces': args.faces, 'seed': args.seed
+    }
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    for name in selected:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark: {name}")
+
+    with quiet():
+        analyzer = VideoAnalyzer()
+        face_processor = FaceBlurProcessor()
+    analyzer.set_profile(args.profile)
+    face_processor.apply_config({'encoder': args.encoder, 'blur_workers': args.blur_workers})
+
+    scene = SyntheticScene(**scene_options)
+    frames = [scene.frame(index) for index in range(0, args.fps * 2, max(1, args.fps // 5))]
+    gray_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    face_boxes = face_processor.detect_faces(gray_frames[0])
+
+    results = {}
+    micro = {
+        # Without a tracker every call is an independent detection
+        'analyze_frame': lambda frame: analyzer.analyze_frame(frame),
+        'detect_faces': lambda frame: face_processor.detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)),
+        'blur_faces': face_processor.blur_faces,
+        'blur_regions': lambda frame: face_processor.blur_regions(frame, face_boxes),
+        'add_privacy_watermark': face_processor.add_privacy_watermark
+    }
+    for name, function in micro.items():
+        if name in selected:
+            print(f"  {name}...", file=sys.stderr)
+            with quiet():
+                results[name] = time_calls(function, frames, args.repeat)
+
+    # What the detectors found, so a speedup from finding nothing shows
+    detections = {
+        'people': int(analyzer.analyze_frame(frames[0])[0]),
+        'faces': len(face_boxes)
+    }
+
+    e2e = [name for name in ('analyze_video', 'process_video') if name in selected]
+    if e2e:
+        video_path = cached_video(args.video_dir, args.seconds, **scene_options)
+        total_frames = int(args.seconds * args.fps)
+
+        with tempfile.TemporaryDirectory() as scratch, working_directory(scratch):
+            for name in e2e:
+                print(f"  {name}...", file=sys.stderr)
+                function = getattr(analyzer if name == 'analyze_video' else face_processor, name)
+                with quiet():
+                    results[name] = time_video(lambda: function(video_path), total_frames, args.video_repeat)
+
+    return {
+        'version': FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'environment': environment(),
+        'settings': dict(
+            scene_options,
+            seconds=args.seconds,
+            profile=args.profile,
+            encoder=args.encoder,
+            blur_workers=args.blur_workers
+        ),
+        'detections': detections,
+        'benchmarks': results
+    }
+
+
+# ============================================
+# BASELINE COMPARISON
+# ============================================
+
+def compare(results, baseline, threshold=0.1):
+    """Compare results with a baseline, returns rows and whether anything regressed
+
+    A benchmark regresses when it got more than `threshold` (a fraction)
+    slower: more milliseconds per call, or fewer frames per second.
+    """
+    rows = []
+    regressed = False
+
+    if results['settings'] != baseline.get('settings'):
+        print("Warning: baseline was recorded with other settings", file=sys.stderr)
+    machine = ('cpu', 'cpus', 'machine', 'opencv')
+    previous_environment = baseline.get('environment', {})
+    if any(results['environment'].get(key) != previous_environment.get(key) for key in machine):
+        print("Warning: baseline was recorded on another machine or OpenCV build, "
+              "timings are not comparable", file=sys.stderr)
+    if results['detections'] != baseline.get('detections'):
+        print("Warning: detections differ from the baseline, results may not be comparable",
+              file=sys.stderr)
+
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None or not previous.get('value'):
+            rows.append((name, current, None, None, 'new'))
+            continue
+
+        if current['unit'] == 'ms':
+            slowdown = current['value'] / previous['value'] - 1
+        else:
+            slowdown = previous['value'] / current['value'] - 1
+
+        if slowdown > threshold:
+            status = 'REGRESSION'
+            regressed = True
+        elif slowdown < -threshold:
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((name, current, previous, slowdown, status))
+
+    return rows, regressed
+
+
+def print_table(results, rows=None):
+    print(f"{'benchmark':<24}{'result':>16}{'baseline':>16}{'change':>10}  status")
+    rows = rows or [(name, current, None, None, '') for name, current in results['benchmarks'].items()]
+    for name, current, previous, slowdown, status in rows:
+        unit = current['unit']
+        value = f"{current['value']:.2f} {unit}"
+        base = f"{previous['value']:.2f} {unit}" if previous else '-'
+        # Positive change is always worse
+        change = f"{slowdown * 100:+.1f}%" if slowdown is not None else '-'
+        print(f"{name:<24}{value:>16}{base:>16}{change:>10}  {status}")
+
+    detections = results['detections']
+    print(f"\nDetections on the first frame: {detections['people']} people, {detections['faces']} faces")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UrbanSight performance benchmarks')
+    parser.add_argument('--only', help=f"comma separated benchmarks out of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--seconds', type=float, default=10, help='length of the end-to-end video')
+    parser.add_argument('--people', type=int, default=4, help='walking person sprites')
+    parser.add_argument('--faces', type=int, default=2, help='face sprites')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', default='balanced', help='detection profile')
+    parser.add_argument('--encoder', default='opencv',
+                        help="encoder for process_video, 'opencv' does not depend on ffmpeg")
+    parser.add_argument('--blur-workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=1,
+                        help='OpenCV threads, 1 keeps results comparable across machines')
+    parser.add_argument('--repeat', type=int, default=10, help='calls per micro-benchmark')
+    parser.add_argument('--video-repeat', type=int, default=1, help='runs per end-to-end benchmark')
+    parser.add_argument('--video-dir', default=os.path.join(tempfile.gettempdir(), 'urbansight-benchmark'),
+                        help='where generated videos are kept between runs')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='compare with a results file, exit 1 on a regression')
+    parser.add_argument('--save-baseline', help='write the results as a new baseline')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed slowdown in percent')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads)
+    print("Running benchmarks...", file=sys.stderr)
+    results = run_benchmarks(args)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    regressed = False
+    rows = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(results, baseline, args.threshold / 100)
+
+    print_table(results, rows)
+    if regressed:
+        print(f"\nRegression: slower than the baseline by more than {args.threshold:g}%")
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import threading
+from collections import Counter
+
+from metrics import inc, timed
+
+ALERT_SEVERITIES = ('low', 'medium', 'high')
+
+# Every connected client is in this room until it subscribes to others
+ALL_ALERTS = 'alerts'
+
+
+def alert_rooms(alert):
+    """Socket.IO rooms an alert is delivered to"""
+    rooms = [ALL_ALERTS, f"alerts:severity:{alert.get('severity', 'medium')}"]
+    if alert.get('video_id'):
+        rooms.append(f"alerts:video:{alert['video_id']}")
+    if alert.get('camera_id'):
+        rooms.append(f"alerts:camera:{alert['camera_id']}")
+    return rooms
+
+
+class AlertBroadcaster:
+    """Pushes stored alerts to Socket.IO clients in small batches
+
+    Alerts published within `window` seconds are sent together as one
+    'alerts_batch' event per room, so each batch is serialized once no
+    matter how many clients receive it. Clients pick rooms per severity,
+    video or camera with `subscribe`; a client in several rooms can get an
+    alert more than once and should drop repeats by id.
+
+    A client whose outgoing queue holds more than `max_queue` packets is
+    skipped instead of buffering more for it. It gets an 'alerts_summary'
+    with what it missed once it has caught up, and can fetch those alerts
+    from /api/alerts with after_id.
+
+    With a message bus between web workers (see bus.py) batches go to the
+    clients of every worker, and each worker skips its own backlogged
+    clients as the batch arrives.
+    """
+
+    def __init__(self, socketio, window=0.25, max_batch=100, max_queue=50, namespace='/'):
+        self.socketio = socketio
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.pending = []
+        self.scheduled = False
+        self.missed = {}  # sid -> {alert id: severity} skipped while backlogged
+        self.latest_id = 0
+
+        self.batches_sent = 0
+        self.alerts_sent = 0
+        self.alerts_skipped = 0
+
+        # Managers from bus.py filter deliveries on every worker
+        manager = socketio.server.manager
+        self.shared = hasattr(manager, 'delivery_filters')
+        if self.shared:
+            manager.delivery_filters['alerts_batch'] = \
+                lambda room, payload: self.backlogged(room, payload['alerts'])
+
+    # Subscriptions
+
+    def subscribe(self, sid, filters=None):
+        """Put a client in the rooms for its filters, return the rooms
+
+        filters may hold 'severity', 'video_id' and 'camera_id', each a
+        single value or a list. Without filters the client gets all alerts.
+        """
+        filters = filters or {}
+        rooms = []
+        for key, prefix in (('severity', 'severity'), ('video_id', 'video'), ('camera_id', 'camera')):
+            values = filters.get(key) or []
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                if key == 'severity' and value not in ALERT_SEVERITIES:
+                    raise ValueError(f"Unknown severity: {value}")
+                rooms.append(f"alerts:{prefix}:{value}")
+        if not rooms:
+            rooms = [ALL_ALERTS]
+
+        server = self.socketio.server
+        for room in server.rooms(sid, namespace=self.namespace):
+            if room == ALL_ALERTS or room.startswith('alerts:'):
+                server.leave_room(sid, room, namespace=self.namespace)
+        for room in rooms:
+            server.enter_room(sid, room, namespace=self.namespace)
+        return rooms
+
+    def forget(self, sid):
+        """Drop the state of a disconnected client"""
+        with self.lock:
+            self.missed.pop(sid, None)
+
+    # Publishing
+
+    def publish(self, alerts):
+        """Queue alerts for the next batch, store listener"""
+        with self.lock:
+            self.pending.extend(alerts)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.socketio.start_background_task(self._flush_after_window)
+
+    def _flush_after_window(self):
+        self.socketio.sleep(self.window)
+        with self.lock:
+            alerts, self.pending = self.pending, []
+            self.scheduled = False
+        self.flush(alerts)
+
+    def flush(self, alerts):
+        """Send alerts to their rooms, one event per room and batch"""
+        with timed('alert_fanout'):
+            self._flush(alerts)
+
+    def _flush(self, alerts):
+        batches = {}
+        for alert in alerts:
+            for room in alert_rooms(alert):
+                batches.setdefault(room, []).append(alert)
+
+        for room, room_alerts in batches.items():
+            # Skip serializing for empty rooms, unless other workers may
+            # have clients in them
+            manager = self.socketio.server.manager
+            if not self.shared and next(manager.get_participants(self.namespace, room), None) is None:
+                continue
+
+            for start in range(0, len(room_alerts), self.max_batch):
+                batch = room_alerts[start:start + self.max_batch]
+                skip = None if self.shared else self.backlogged(room, batch)
+                self.socketio.emit(
+                    'alerts_batch',
+                    {'room': room, 'alerts': batch},
+                    to=room,
+                    skip_sid=skip or None,
+                    namespace=self.namespace
+                )
+                self.batches_sent += 1
+                self.alerts_sent += len(batch)
+                inc('urbansight_alert_batches_total')
+                inc('urbansight_alerts_broadcast_total', len(batch))
+
+        self._send_summaries()
+
+    def backlogged(self, room, alerts):
+        """Local clients in a room too far behind for a batch of alerts
+
+        Records the alerts as missed for those clients.
+        """
+        manager = self.socketio.server.manager
+        skipped = [
+            sid for sid, eio_sid in manager.get_participants(self.namespace, room)
+            if self._queued(eio_sid) > self.max_queue
+        ]
+
+        with self.lock:
+            for alert in alerts:
+                self.latest_id = max(self.latest_id, alert.get('id', 0))
+            for sid in skipped:
+                missed = self.missed.setdefault(sid, {})
+                for alert in alerts:
+                    missed[alert.get('id')] = alert.get('severity', 'medium')
+            self.alerts_skipped += len(skipped) * len(alerts)
+
+        if skipped:
+            inc('urbansight_alerts_skipped_total', len(skipped) * len(alerts))
+            # Summaries go out once these clients catch up
+            self.publish([])
+        return skipped
+
+    def _queued(self, eio_sid):
+        """Packets waiting to be written to a client"""
+        socket = self.socketio.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def _send_summaries(self):
+        """Tell clients that caught up what they missed while backlogged"""
+        manager = self.socketio.server.manager
+        with self.lock:
+            caught_up = []
+            for sid in list(self.missed):
+                eio_sid = manager.eio_sid_from_sid(sid, self.namespace)
+                if eio_sid is None:
+                    del self.missed[sid]
+                elif self._queued(eio_sid) <= self.max_queue:
+                    caught_up.append((sid, self.missed.pop(sid)))
+            waiting = bool(self.missed)
+
+        for sid, missed in caught_up:
+            self.socketio.emit('alerts_summary', {
+                'missed': len(missed),
+                'by_severity': dict(Counter(missed.values())),
+                'latest_id': self.latest_id
+            }, to=sid, namespace=self.namespace, ignore_queue=True)
+
+        # Check on clients still behind even if no new alerts come in
+        if waiting:
+            self.publish([])
+
+    def stats(self):
+        """Broadcast statistics for the status API"""
+        with self.lock:
+            backlogged = len(self.missed)
+        return {
+            'batches_sent': self.batches_sent,
+            'alerts_sent': self.alerts_sent,
+            'alerts_skipped': self.alerts_skipped,
+            'backlogged_clients': backlogged
+        }
@@ -0,0 +1,192 @@
+"""Socket.IO message bus shared by the web worker processes
+
+Each worker's Socket.IO server publishes its emits and room changes on the
+bus and delivers those of the other workers to its own clients, so an
+alert stored by one worker reaches every dashboard. The bus is Redis when
+URBANSIGHT_MESSAGE_QUEUE is a redis:// URL, or a small broker relaying
+lines over a UNIX socket (unix://path) when Redis is not available.
+
+Run the broker with:  python bus.py /path/to/urbansight-bus.sock
+"""
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+
+import socketio
+
+
+class DeliveryFilterMixin:
+    """Lets this worker skip some of its own clients for events from the bus
+
+    `delivery_filters` maps an event name to a function called with the
+    room and payload of each emit before it is delivered to local clients;
+    it returns the sids to leave out.
+    """
+
+    def _handle_emit(self, message):
+        delivery_filter = getattr(self, 'delivery_filters', {}).get(message.get('event'))
+        if delivery_filter is not None and not message.get('binary'):
+            skip = delivery_filter(message.get('room'), message['data'][0])
+            if skip:
+                skip_sid = message.get('skip_sid') or []
+                if not isinstance(skip_sid, list):
+                    skip_sid = [skip_sid]
+                message = dict(message, skip_sid=skip_sid + skip)
+        super()._handle_emit(message)
+
+
+class UnixSocketManager(DeliveryFilterMixin, socketio.PubSubManager):
+    """Socket.IO client manager talking to a BusBroker over a UNIX socket"""
+
+    name = 'unix'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        self.path = url[len('unix://'):]
+        self.delivery_filters = {}
+        self.publisher = None
+        self.publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _publish(self, data):
+        line = (json.dumps(data) + '\n').encode()
+        with self.publish_lock:
+            # One reconnect in case the broker restarted
+            for attempt in range(2):
+                try:
+                    if self.publisher is None:
+                        self.publisher = self._connect()
+                    self.publisher.sendall(line)
+                    return
+                except OSError:
+                    if self.publisher is not None:
+                        self.publisher.close()
+                        self.publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect()
+                with sock, sock.makefile('rb') as reader:
+                    for line in reader:
+                        yield line
+            except OSError as e:
+                self._get_logger().error(f"Message bus connection failed: {e}")
+            self.server.sleep(1)
+
+
+class RedisManager(DeliveryFilterMixin, socketio.RedisManager):
+    """Socket.IO Redis client manager with delivery filters"""
+
+    def __init__(self, *args, **kwargs):
+        self.delivery_filters = {}
+        super().__init__(*args, **kwargs)
+
+
+def create_manager(url, channel='urbansight'):
+    """Client manager for a message queue URL"""
+    if url.startswith('unix://'):
+        return UnixSocketManager(url, channel=channel)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisManager(url, channel=channel)
+    raise ValueError(f"Unsupported message queue: {url}")
+
+
+class BusBroker:
+    """Relays every line received on a UNIX socket to all connections
+
+    Each connection has a bounded outgoing queue; a worker that stops
+    reading is disconnected instead of holding up the others, and
+    reconnects when it can.
+    """
+
+    def __init__(self, path, max_queue=10000):
+        self.path = path
+        self.max_queue = max_queue
+        self.clients = {}  # connection -> outgoing queue
+        self.lock = threading.Lock()
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        os.chmod(self.path, 0o600)
+        server.listen()
+        print(f"Message bus listening on {self.path}")
+
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        outgoing = queue.Queue(self.max_queue)
+        with self.lock:
+            self.clients[conn] = outgoing
+        threading.Thread(target=self._write, args=(conn, outgoing), daemon=True).start()
+
+        try:
+            with conn.makefile('rb') as reader:
+                for line in reader:
+                    self._relay(line)
+        except OSError:
+            pass
+        finally:
+            self._drop(conn)
+
+    def _relay(self, line):
+        with self.lock:
+            clients = list(self.clients.items())
+
+        for conn, outgoing in clients:
+            try:
+                outgoing.put_nowait(line)
+            except queue.Full:
+                print("Message bus client fell behind, disconnecting it")
+                self._drop(conn)
+
+    def _write(self, conn, outgoing):
+        try:
+            while True:
+                line = outgoing.get()
+                if line is None:
+                    break
+                conn.sendall(line)
+        except OSError:
+            pass
+        finally:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        with self.lock:
+            outgoing = self.clients.pop(conn, None)
+        if outgoing is None:
+            return
+
+        # Wake the writer so it exits
+        try:
+            outgoing.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python bus.py SOCKET_PATH")
+        sys.exit(1)
+    BusBroker(sys.argv[1]).serve_forever()
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+# Bump when a code change alters analysis results or processed videos, so
+# results cached by older versions are not served
+CACHE_VERSION = 2
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(stream, folder, extension=''):
+    """Stream an upload to disk while hashing it
+
+    The file is stored once under its SHA-256, so repeat uploads of the
+    same clip share a single copy. Returns (sha256, path, size).
+    """
+    os.makedirs(folder, exist_ok=True)
+    temp_path = os.path.join(folder, f".upload_{uuid.uuid4().hex}")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+    content_hash = digest.hexdigest()
+    path = os.path.join(folder, content_hash + extension.lower())
+    if os.path.exists(path):
+        # Already stored, keep the existing copy
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, path)
+
+    return content_hash, path, size
+
+
+def cache_key(content_hash, config):
+    """Cache key for a video analyzed with the given settings"""
+    settings = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(f"{CACHE_VERSION}:{content_hash}:{settings}".encode()).hexdigest()
+
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    outputs TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_used_at ON entries (used_at);
+"""
+
+
+class ResultCache:
+    """On-disk cache of analysis results and the files they produced
+
+    Each entry is a JSON file holding the result plus the paths of the
+    outputs it owns (such as the blurred video). When the total size of
+    entries and their outputs passes `max_bytes`, the least recently used
+    entries are deleted together with their outputs.
+
+    Sizes and last use of every entry are kept in a SQLite index next to
+    the entries, so eviction and statistics never read the entries
+    themselves, and web workers sharing the directory share the index.
+
+    Listeners registered with `subscribe` receive the key of every entry
+    removed, to drop data kept elsewhere for it.
+    """
+
+    def __init__(self, root='cache', max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.remove_listeners = []
+        os.makedirs(root, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(INDEX_SCHEMA)
+        self._index_existing()
+
+    def subscribe(self, on_remove):
+        """Register a callback for the key of every removed entry"""
+        self.remove_listeners.append(on_remove)
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def _index_existing(self):
+        """Index entries written before the index existed"""
+        with self.lock:
+            indexed = {row[0] for row in self.db.execute('SELECT key FROM entries')}
+        for name in os.listdir(self.root):
+            key, extension = os.path.splitext(name)
+            if extension != '.json' or key in indexed:
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+                self._index(key, entry['outputs'], os.path.getmtime(path))
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def _index(self, key, outputs, used_at):
+        size = os.path.getsize(self._entry_path(key))
+        for output in outputs:
+            if os.path.isdir(output):
+                for folder, _, files in os.walk(output):
+                    size += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+            elif os.path.exists(output):
+                size += os.path.getsize(output)
+
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries (key, size, outputs, used_at) VALUES (?, ?, ?, ?)',
+                (key, size, json.dumps(outputs), used_at)
+            )
+
+    def get(self, key):
+        """Return the cached result for a key, or None"""
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # An entry is only useful while all of its outputs still exist
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            self._remove(key, entry['outputs'])
+            self.misses += 1
+            return None
+
+        # Last use orders entries for eviction
+        with self.lock, self.db:
+            self.db.execute('UPDATE entries SET used_at = ? WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        return entry['result']
+
+    def put(self, key, result, outputs=()):
+        """Store a result and take ownership of its output files"""
+        entry = {
+            'key': key,
+            'created_at': time.time(),
+            'outputs': [output for output in outputs if output],
+            'result': result
+        }
+
+        path = self._entry_path(key)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f, default=str)
+        os.replace(temp_path, path)
+        self._index(key, entry['outputs'], time.time())
+
+        self.evict()
+
+    def _remove(self, key, outputs):
+        for output in outputs:
+            if os.path.isdir(output):
+                shutil.rmtree(output, ignore_errors=True)
+            elif os.path.exists(output):
+                os.remove(output)
+        path = self._entry_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+        for listener in self.remove_listeners:
+            try:
+                listener(key)
+            except Exception as e:
+                print(f"Error removing data of cached analysis {key[:12]}: {e}")
+
+    def _total(self):
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits"""
+        total = self._total()
+        if total <= self.max_bytes:
+            return total
+
+        with self.lock:
+            rows = self.db.execute('SELECT key, size, outputs FROM entries ORDER BY used_at').fetchall()
+        for key, size, outputs in rows:
+            if total <= self.max_bytes:
+                break
+            print(f"Evicting cached analysis {key[:12]} ({size} bytes)")
+            self._remove(key, json.loads(outputs))
+            total -= size
+
+        return total
+
+    def stats(self):
+        """Cache statistics for the status API"""
+        with self.lock:
+            entries, size = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+            ).fetchone()
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,470 @@
+import copy
+import json
+import os
+from collections import deque
+from datetime import datetime
+
+import cv2
+
+try:
+    # The web server monkey-patches threading into green threads, which
+    # would run decoding and detection on its event loop. Camera workers
+    # need OS threads; OpenCV releases the GIL while it decodes and detects.
+    from eventlet.patcher import original
+    threading = original('threading')
+    time = original('time')
+except ImportError:
+    import threading
+    import time
+
+# Event engine frame numbers for cameras are hundredths of a second since
+# the camera started, live streams have no frame count to go by
+CLOCK_RATE = 100
+
+
+def parse_source(source):
+    """VideoCapture argument for a source: device index, URL or file path"""
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+def is_file_source(source):
+    """Local files are read at their own frame rate and may loop"""
+    return isinstance(source, str) and '://' not in source
+
+
+def load_camera_config(path):
+    """Camera configurations from a JSON file holding a list of
+    {"id": ..., "source": ..., "name": ..., "loop": ...}
+    """
+    with open(path) as f:
+        cameras = json.load(f)
+    for camera in cameras:
+        if not camera.get('id') or camera.get('source') in (None, ''):
+            raise ValueError(f"Camera needs an id and a source: {camera}")
+    return cameras
+
+
+class RateMeter:
+    """Events per second over the last `size` events"""
+
+    def __init__(self, size=50):
+        self.times = deque(maxlen=size)
+
+    def tick(self, now):
+        self.times.append(now)
+
+    def rate(self, now):
+        # A source that stopped delivering has no rate
+        if len(self.times) < 2 or now - self.times[-1] > 5:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0] or 1e-9)
+
+
+class Camera:
+    """One video source, the latest frame grabbed from it and its analysis state
+
+    Only the grabber thread touches the capture and only one analysis
+    worker at a time touches the tracker, gate and event engine.
+    """
+
+    def __init__(self, config, analyzer):
+        self.id = config['id']
+        self.config = config
+        self.name = config.get('name') or self.id
+        self.source = parse_source(config['source'])
+        self.loop = config.get('loop', True)
+        self.is_file = is_file_source(self.source)
+
+        self.started = time.monotonic()
+        self.started_at = datetime.now()
+        self.stopping = threading.Event()
+        self.thread = None
+
+        # Newest (frame, grabbed_at) waiting for analysis, older ones are dropped
+        self.pending = None
+        self.queued = False
+        self.busy = False
+        self.next_sample = 0.0
+
+        self.tracker = analyzer.create_tracker()
+        self.gate = analyzer.create_gate()
+        self.events = analyzer.create_event_engine(CLOCK_RATE, live=True)
+        self.open_alerts = {}  # alert type -> stored record of its running incident
+
+        self.state = 'connecting'
+        self.error = None
+        self.source_fps = 0.0
+        self.resolution = None
+        self.frames_grabbed = 0
+        self.frames_analyzed = 0
+        self.frames_dropped = 0  # replaced by a newer frame before analysis
+        self.frames_stale = 0  # older than the latency budget when analysis started
+        self.reconnects = 0
+        self.loops = 0
+        self.people = 0
+        self.alerts = 0
+        self.last_frame_at = None
+        self.grab_rate = RateMeter()
+        self.analysis_rate = RateMeter()
+        self.lags = deque(maxlen=50)
+
+    def open(self):
+        """Open the source, None if it cannot be opened"""
+        # Hardware decoding when the platform has it, software otherwise
+        cap = cv2.VideoCapture(
+            self.source, cv2.CAP_ANY,
+            [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        )
+        if not cap.isOpened():
+            cap.release()
+            return None
+
+        self.source_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.resolution = [int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))]
+        return cap
+
+    def stats(self):
+        """Status of the camera for the cameras API"""
+        now = time.monotonic()
+        lags = list(self.lags)
+        return {
+            'id': self.id,
+            'name': self.name,
+            'state': self.state,
+            'error': self.error,
+            'resolution': self.resolution,
+            'source_fps': round(self.source_fps, 2),
+            'fps': round(self.grab_rate.rate(now), 2),
+            'analyzed_fps': round(self.analysis_rate.rate(now), 2),
+            # Seconds from grabbing a frame to finishing its analysis
+            'lag_ms': round(sum(lags) / len(lags) * 1000) if lags else None,
+            'max_lag_ms': round(max(lags) * 1000) if lags else None,
+            'frames_grabbed': self.frames_grabbed,
+            'frames_analyzed': self.frames_analyzed,
+            'frames_dropped': self.frames_dropped,
+            'frames_stale': self.frames_stale,
+            'reconnects': self.reconnects,
+            'loops': self.loops,
+            'people': self.people,
+            'alerts': self.alerts,
+            'last_frame_at': self.last_frame_at,
+            'started_at': self.started_at.isoformat()
+        }
+
+
+class CameraManager:
+    """Runs live analysis for a set of cameras
+
+    Every camera has a grabber thread that reads its source as fast as it
+    delivers frames, so nothing piles up in the decoder, and keeps only
+    the latest frame due for analysis (one every `sample_interval` of the
+    analyzer). A small pool of analysis threads, shared by all cameras,
+    runs detection and alerting on those frames. A frame is dropped when a
+    newer one arrives before it was analyzed, or when it is older than
+    `latency_budget` seconds by the time a worker gets to it, so lag stays
+    bounded however many cameras share the CPU. Sources that fail are
+    reopened with exponential backoff; local files are read at their own
+    frame rate and loop, as stand-ins for live streams.
+
+    With a `store` the cameras to run are read from it and their status
+    and alerts written to it by `poll`, which must run on the web server's
+    event loop (see `monitor`). With a `timeseries` store `poll` also
+    records the people count of every analyzed frame per camera
+    ('camera:<id>'), and the total of all live cameras once per poll
+    ('cameras').
+    """
+
+    def __init__(self, analyzer, store=None, timeseries=None, workers=None, latency_budget=1.0,
+                 min_backoff=1.0, max_backoff=30.0):
+        self.analyzer = analyzer
+        self.store = store
+        self.timeseries = timeseries
+        self.workers = workers or os.cpu_count() or 1
+        self.latency_budget = latency_budget
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.cameras = {}
+        self.ready = deque()  # cameras with a frame waiting for a worker
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+        self.alerts = []
+        self.alert_updates = []  # stored alerts whose incident has ended
+        self.samples = []  # (series, Unix time, people) not recorded yet
+        self.threads = []
+
+    # Cameras
+
+    def add(self, config):
+        """Start ingesting a camera, config as in load_camera_config"""
+        with self.lock:
+            if config['id'] in self.cameras:
+                raise ValueError(f"Camera already running: {config['id']}")
+            camera = Camera(config, self.analyzer)
+            self.cameras[camera.id] = camera
+
+        self._start_workers()
+        camera.thread = threading.Thread(target=self._grab, args=(camera,), daemon=True)
+        camera.thread.start()
+        print(f"Camera {camera.id} started: {camera.source}")
+        return camera
+
+    def remove(self, camera_id):
+        """Stop a camera, its grabber exits after the current frame"""
+        with self.lock:
+            camera = self.cameras.pop(camera_id, None)
+            if camera is None:
+                return False
+            camera.stopping.set()
+            camera.pending = None
+        print(f"Camera {camera_id} stopped")
+        return True
+
+    def sync(self, configs):
+        """Run exactly these cameras, restarting those whose config changed"""
+        wanted = {config['id']: config for config in configs}
+        for camera_id, camera in list(self.cameras.items()):
+            config = wanted.get(camera_id)
+            if config is None or config != camera.config:
+                self.remove(camera_id)
+        for camera_id, config in wanted.items():
+            if camera_id not in self.cameras:
+                self.add(config)
+
+    def stop(self):
+        for camera_id in list(self.cameras):
+            self.remove(camera_id)
+        with self.lock:
+            self.frame_ready.notify_all()
+
+    def active_count(self):
+        """Cameras currently delivering frames"""
+        return sum(1 for camera in list(self.cameras.values()) if camera.state == 'live')
+
+    def stats(self):
+        return {camera.id: camera.stats() for camera in list(self.cameras.values())}
+
+    # Grabbing
+
+    def _grab(self, camera):
+        """Grabber thread: read a source until the camera is removed"""
+        backoff = self.min_backoff
+        while not camera.stopping.is_set():
+            cap = camera.open()
+            if cap is None:
+                camera.error = f"Could not open {camera.source}"
+            else:
+                camera.state = 'live'
+                camera.error = None
+                try:
+                    if self._read(camera, cap):
+                        backoff = self.min_backoff
+                except cv2.error as e:
+                    camera.error = str(e)
+                finally:
+                    cap.release()
+
+            if camera.stopping.is_set():
+                break
+            camera.state = 'reconnecting'
+            camera.reconnects += 1
+            print(f"Camera {camera.id} reconnecting in {backoff:.0f}s: {camera.error or 'stream ended'}")
+            camera.stopping.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+        camera.state = 'stopped'
+
+    def _read(self, camera, cap):
+        """Grab frames until the stream fails, returns the number grabbed"""
+        interval = self.analyzer.sample_interval
+        # Files are paced to their frame rate like a live source
+        frame_time = 1.0 / camera.source_fps if camera.is_file and camera.source_fps > 0 else 0
+        next_frame = time.monotonic()
+        grabbed = 0
+
+        while not camera.stopping.is_set():
+            if frame_time:
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    camera.stopping.wait(delay)
+                # Do not race to catch up after a stall
+                next_frame = max(next_frame + frame_time, time.monotonic() - frame_time)
+
+            # grab() decodes without the colour conversion of retrieve(),
+            # which only frames due for analysis pay for
+            if not cap.grab():
+                if camera.is_file and camera.loop and grabbed:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    camera.loops += 1
+                    continue
+                return grabbed
+
+            now = time.monotonic()
+            grabbed += 1
+            camera.frames_grabbed += 1
+            camera.grab_rate.tick(now)
+
+            if now < camera.next_sample:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                return grabbed
+            camera.next_sample = max(camera.next_sample + interval, now)
+            camera.last_frame_at = datetime.now().isoformat()
+            self._offer(camera, frame, now)
+
+        return grabbed
+
+    def _offer(self, camera, frame, grabbed_at):
+        """Hand a frame to the analysis workers, replacing an unanalyzed one"""
+        with self.lock:
+            if camera.stopping.is_set():
+                return
+            if camera.pending is not None:
+                camera.frames_dropped += 1
+            camera.pending = (frame, grabbed_at)
+            if not camera.busy and not camera.queued:
+                camera.queued = True
+                self.ready.append(camera)
+                self.frame_ready.notify()
+
+    # Analysis
+
+    def _start_workers(self):
+        with self.lock:
+            missing = self.workers - len(self.threads)
+            for _ in range(missing):
+                thread = threading.Thread(target=self._analyze_frames, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+    def _analyze_frames(self):
+        """Analysis worker thread: analyze the latest frame of ready cameras"""
+        # Detector backends are not shared between threads
+        analyzer = copy.copy(self.analyzer)
+        analyzer.backend_key = None
+
+        while True:
+            with self.lock:
+                while not self.ready:
+                    self.frame_ready.wait()
+                camera = self.ready.popleft()
+                camera.queued = False
+                pending, camera.pending = camera.pending, None
+                camera.busy = True
+
+            try:
+                if pending is not None:
+                    self._analyze(analyzer, camera, *pending)
+            except Exception as e:
+                print(f"Error analyzing camera {camera.id}: {e}")
+            finally:
+                with self.lock:
+                    camera.busy = False
+                    # A newer frame arrived while this one was analyzed
+                    if camera.pending is not None and not camera.queued:
+                        camera.queued = True
+                        self.ready.append(camera)
+                        self.frame_ready.notify()
+
+    def _analyze(self, analyzer, camera, frame, grabbed_at):
+        if time.monotonic() - grabbed_at > self.latency_budget:
+            camera.frames_stale += 1
+            return
+
+        timestamp = grabbed_at - camera.started
+        people_count, _, movement_scores = analyzer.analyze_frame(
+            frame, camera.tracker, camera.gate, timestamp
+        )
+        signals = analyzer.alert_signals(people_count, movement_scores)
+        alerts = camera.events.update(int(timestamp * CLOCK_RATE), signals)
+
+        done = time.monotonic()
+        camera.frames_analyzed += 1
+        camera.people = people_count
+        camera.analysis_rate.tick(done)
+        camera.lags.append(done - grabbed_at)
+
+        if self.timeseries is not None:
+            sampled_at = camera.started_at.timestamp() + timestamp
+            with self.lock:
+                self.samples.append((f"camera:{camera.id}", sampled_at, people_count))
+
+        if alerts:
+            self._emit(camera, alerts)
+
+    def _emit(self, camera, alerts):
+        """Queue incident alerts of a camera for the store
+
+        An incident is stored when it starts; when it ends, the message of
+        that alert is updated with its final duration and peak.
+        """
+        records = []
+        updates = []
+        for alert in alerts:
+            message = f"{camera.name}: {alert['message']}"
+            if alert['status'] == 'ended':
+                record = camera.open_alerts.pop(alert['type'], None)
+                if record is not None:
+                    record['message'] = f"{message} (ended)"
+                    updates.append(record)
+                continue
+
+            started = camera.started_at.timestamp() + alert['timestamp']
+            record = {
+                'type': alert['type'],
+                'message': message,
+                'severity': alert['severity'],
+                'timestamp': datetime.fromtimestamp(started).isoformat(),
+                'camera_id': camera.id
+            }
+            camera.open_alerts[alert['type']] = record
+            records.append(record)
+
+        camera.alerts += len(records)
+        with self.lock:
+            self.alerts.extend(records)
+            self.alert_updates.extend(updates)
+
+    # Web server side
+
+    def poll(self):
+        """Apply camera changes from the store, save alerts and statuses"""
+        if self.store is None:
+            return
+
+        self.sync([
+            {key: value for key, value in camera.items() if key != 'status'}
+            for camera in self.store.list_cameras()
+        ])
+
+        with self.lock:
+            alerts, self.alerts = self.alerts, []
+            updates, self.alert_updates = self.alert_updates, []
+            samples, self.samples = self.samples, []
+        if alerts:
+            self.store.add_alerts(alerts)
+        if updates:
+            # Records were stored by this or an earlier poll and have their ids
+            self.store.update_alert_messages(updates)
+        if self.timeseries is not None:
+            # One total per poll for the all-cameras chart, from each live
+            # camera's latest count, rather than every camera's own samples
+            live = [camera for camera in list(self.cameras.values()) if camera.state == 'live']
+            if live:
+                samples.append(('cameras', time.time(), sum(camera.people for camera in live)))
+            self.timeseries.add(samples)
+
+        self.store.save_camera_statuses(self.stats())
+
+    def monitor(self, sleep=time.sleep, interval=1.0):
+        """Poll forever, intended to run as a background task"""
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error in camera monitor: {e}")
+            sleep(interval)
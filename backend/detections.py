@@ -0,0 +1,104 @@
+import numpy as np
+
+from sampler import FrameSampler
+
+FORMAT_VERSION = 1
+
+
+class DetectionLog:
+    """Per-sample detections of one video, kept as columns
+
+    Every analyzed sample contributes its frame number, people count, the
+    detected boxes and the speeds of the tracks it continued. Boxes and
+    speeds are stored flat with per-sample offsets, so a whole video fits
+    in a handful of arrays that save to a single .npz file and load back
+    without any per-sample parsing.
+    """
+
+    def __init__(self, fps=0, total_frames=0):
+        self.fps = fps
+        self.total_frames = total_frames
+        self.frames = []
+        self.people = []
+        self.box_counts = []
+        self.boxes = []
+        self.track_counts = []
+        self.track_ids = []
+        self.speeds = []
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, frame_number, rects, people_count, movement_scores):
+        """Record one analyzed sample"""
+        rects = np.asarray(rects, dtype=np.int32).reshape(-1, 4)
+
+        self.frames.append(frame_number)
+        self.people.append(people_count)
+        self.box_counts.append(len(rects))
+        self.boxes.extend(rects.tolist())
+        self.track_counts.append(len(movement_scores))
+        self.track_ids.extend(movement_scores.keys())
+        self.speeds.extend(movement_scores.values())
+
+    def samples(self):
+        """Yield (frame_number, people_count, movement_scores) per sample"""
+        track_ids = np.asarray(self.track_ids, dtype=np.int64).tolist()
+        speeds = np.asarray(self.speeds, dtype=np.float64).tolist()
+
+        offset = 0
+        for frame_number, people_count, count in zip(self.frames, self.people, self.track_counts):
+            movement_scores = dict(zip(track_ids[offset:offset + count], speeds[offset:offset + count]))
+            offset += count
+            yield int(frame_number), int(people_count), movement_scores
+
+    def people_counts(self):
+        """Yield (seconds into the video, people count) per sample"""
+        fps = self.fps if self.fps > 0 else FrameSampler.DEFAULT_FPS
+        for frame_number, people_count in zip(np.asarray(self.frames).tolist(), np.asarray(self.people).tolist()):
+            yield frame_number / fps, people_count
+
+    def video_info(self):
+        return {
+            'fps': self.fps,
+            'total_frames': self.total_frames,
+            'duration': self.total_frames / self.fps if self.fps > 0 else 0
+        }
+
+    def save(self, path):
+        """Write the log to a compressed .npz file"""
+        np.savez_compressed(
+            path,
+            version=FORMAT_VERSION,
+            fps=self.fps,
+            total_frames=self.total_frames,
+            frames=np.asarray(self.frames, dtype=np.int32),
+            people=np.asarray(self.people, dtype=np.int32),
+            box_counts=np.asarray(self.box_counts, dtype=np.int32),
+            boxes=np.asarray(self.boxes, dtype=np.int32).reshape(-1, 4),
+            track_counts=np.asarray(self.track_counts, dtype=np.int32),
+            track_ids=np.asarray(self.track_ids, dtype=np.int32),
+            speeds=np.asarray(self.speeds, dtype=np.float64)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Read a log written by save"""
+        with np.load(path) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported detection log version: {int(data['version'])}")
+
+            log = cls(int(data['fps']), int(data['total_frames']))
+            for name in ('frames', 'people', 'box_counts', 'boxes', 'track_counts', 'track_ids', 'speeds'):
+                setattr(log, name, data[name])
+        return log
+
+    @classmethod
+    def concatenate(cls, logs):
+        """Join the logs of consecutive video segments"""
+        joined = cls(logs[0].fps, logs[0].total_frames)
+        for log in logs:
+            for name in ('frames', 'people', 'box_counts', 'track_counts', 'track_ids', 'speeds'):
+                getattr(joined, name).extend(getattr(log, name))
+            joined.boxes.extend(np.asarray(log.boxes).reshape(-1, 4).tolist())
+        return joined
@@ -3,6 +3,55 @@ import numpy as np
 from collections import defaultdict, deque
 from datetime import datetime
 import os
+import copy
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pipeline import FrameConsumer, VideoPipeline
+from sampler import FrameSampler
+from motion import MotionGate
+from backends import DETECTION_PROFILES, create_backend
+from tracker import MultiObjectTracker
+from detections import DetectionLog
+from events import EventEngine, EventRule
+from metrics import REGISTRY, timed
+
+# Settings that only affect alerting, not detection
+ALERT_SETTINGS = (
+    'crowd_threshold', 'violence_threshold', 'object_time_threshold',
+    'moderate_crowd_threshold', 'alert_exit_ratio', 'alert_min_duration', 'alert_cooldown'
+)
+
+# Analyzer reused by segment workers in the same process
+_segment_analyzer = None
+
+def _analyze_segment(video_path, start_frame, end_frame, fps, config):
+    """Analyze frames (start_frame, end_frame] in a worker process"""
+    global _segment_analyzer
+    if _segment_analyzer is None:
+        _segment_analyzer = VideoAnalyzer()
+    _segment_analyzer.apply_config(config)
+    REGISTRY.reset()
+    
+    consumer = _segment_analyzer.create_consumer()
+    
+    # Start a few samples early so tracks crossing the boundary are picked
+    # up with the same history a serial run would have
+    consumer.sampler.start(fps)
+    warmup_samples = _segment_analyzer.track_max_age + 1
+    warmup_start = max(0, start_frame - warmup_samples * consumer.sampler.max_stride())
+    consumer.emit_after = start_frame
+    
+    outputs = VideoPipeline(video_path, warmup_start, end_frame).run([consumer])
+    if outputs is None:
+        return {"error": "Could not open video"}
+    
+    results = outputs[0]
+    results['detection_log'] = consumer.log
+    results['metrics'] = REGISTRY.snapshot()  # stage timings of this segment
+    return results
 
 class VideoAnalyzer:
     def __init__(self):
@@ -10,32 +59,110 @@ class VideoAnalyzer:
         
         # Detection thresholds
         self.crowd_threshold = 8
-        self.violence_threshold = 50  # Pixel movement threshold
+        self.violence_threshold = 250  # Average tracked speed, px/s
         self.object_time_threshold = 5  # seconds
+        self.moderate_crowd_threshold = 5
+        
+        # Alert events: an incident ends once its signal drops below
+        # alert_exit_ratio of the threshold that started it, must last
+        # alert_min_duration seconds, and restarts within alert_cooldown
+        # seconds are merged into it
+        self.alert_exit_ratio = 0.7
+        self.alert_min_duration = 0.5
+        self.alert_cooldown = 10.0
+        
+        # Detector speed/recall trade-off, see DETECTION_PROFILES
+        self.detection_profile = 'balanced'
+        
+        # Frame sampling: analyze one frame every sample_interval seconds,
+        # or adapt between the min/max intervals based on activity
+        self.sample_interval = 0.2
+        self.adaptive_sampling = False
+        self.min_sample_interval = 0.1
+        self.max_sample_interval = 1.0
         
-        # Tracking variables
-        self.person_tracks = defaultdict(list)
-        self.frame_count = 0
+        # Motion gating: skip the detector on frames where less than this
+        # fraction of a downscaled thumbnail changed
+        self.motion_gating = True
+        self.motion_threshold = 0.002
         
-        # Load HOG descriptor for people detection
-        self.hog = cv2.HOGDescriptor()
-        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        # Tracking: unmatched tracks survive this many samples
+        self.track_max_age = 3
+        
+        # People detector: 'hog' (OpenCV) or 'yolo' (ultralytics, batched)
+        self.detector_backend = 'hog'
+        self.yolo_model = 'yolov8n.pt'
+        self.batch_size = 4
+        self.backend = None
+        self.backend_key = None
+        self.get_backend()
         
         print("Video Analyzer initialized successfully!")
     
-    def analyze_video(self, video_path):
-        """Analyze video for suspicious activities"""
+    def analyze_video(self, video_path, detections_path=None):
+        """Analyze video for suspicious activities
+        
+        With `detections_path` the per-sample detections are saved there
+        so the video can later be re-scored with other thresholds.
+        """
         print(f"Analyzing video: {video_path}")
         
+        consumer = self.create_consumer()
+        outputs = VideoPipeline(video_path).run([consumer])
+        if outputs is None:
+            return {"error": "Could not open video"}
+        
+        if detections_path:
+            self.save_detections(consumer.log, outputs[0], detections_path)
+        return outputs[0]
+    
+    def analyze_video_parallel(self, video_path, workers=None, min_segment_seconds=30,
+                               detections_path=None, on_progress=None):
+        """Analyze video as time segments spread over several processes
+        
+        `on_progress(done, total)` is called as each segment finishes.
+        """
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             return {"error": "Could not open video"}
         
-        # Video properties
         fps = int(cap.get(cv2.CAP_PROP_FPS))
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
         
-        # Analysis results
+        workers = workers or os.cpu_count() or 1
+        segments = self.plan_segments(total_frames, fps, workers, min_segment_seconds)
+        if len(segments) <= 1:
+            # Too short, or no CPUs to spare: shows as one segment
+            results = self.analyze_video(video_path, detections_path)
+            if 'error' not in results:
+                results['summary']['segments'] = 1
+            return results
+        
+        print(f"Analyzing video in {len(segments)} segments: {video_path}")
+        
+        config = self.get_config()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(segments)),
+            mp_context=multiprocessing.get_context('spawn')
+        ) as pool:
+            futures = [
+                pool.submit(_analyze_segment, video_path, start, end, fps, config)
+                for start, end in segments
+            ]
+            for done, _ in enumerate(as_completed(futures), 1):
+                if on_progress:
+                    on_progress(done, len(futures))
+            parts = [future.result() for future in futures]
+        
+        for part in parts:
+            if 'error' in part:
+                return part
+        log = DetectionLog.concatenate([part.pop('detection_log') for part in parts])
+        for part in parts:
+            REGISTRY.merge(part.pop('metrics'))
+        
+        # Stitch segments back together in timestamp order
         results = {
             'video_info': {
                 'fps': fps,
@@ -45,108 +172,282 @@ class VideoAnalyzer:
             'alerts': [],
             'summary': {}
         }
+        # Incidents can span segments, so alerting runs over the joined
+        # detections rather than merging per-segment alerts
+        results['alerts'], results['events'] = self.score_log(log)
+        results['sampling'] = self.merge_stats(
+            [part['sampling'] for part in parts],
+            'sample_rate', 'frames_sampled', 'frames_seen'
+        )
+        if parts[0].get('motion_gate'):
+            results['motion_gate'] = self.merge_stats(
+                [part['motion_gate'] for part in parts],
+                'hit_rate', 'frames_reused', 'frames_checked'
+            )
+        results['summary'] = self.generate_summary(results)
+        results['summary']['segments'] = len(segments)
         
-        frame_number = 0
-        prev_positions = {}
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_number += 1
-            
-            # Process every 5th frame for speed
-            if frame_number % 5 != 0:
-                continue
-            
-            # Analyze frame
-            people_count, positions, movement_scores = self.analyze_frame(frame, prev_positions)
-            
-            # Check for alerts
-            alerts = self.check_alerts(people_count, movement_scores, frame_number, fps)
-            if alerts:
-                results['alerts'].extend(alerts)
-            
-            # Update previous positions
-            prev_positions = positions
+        if detections_path:
+            self.save_detections(log, results, detections_path)
         
-        cap.release()
+        return results
+    
+    def plan_segments(self, total_frames, fps, workers, min_segment_seconds=30):
+        """Split a video into (start, end] frame ranges for parallel analysis"""
+        if total_frames <= 0 or fps <= 0:
+            return [(0, None)]
         
-        # Generate summary
-        results['summary'] = self.generate_summary(results)
+        min_frames = max(1, int(min_segment_seconds * fps))
+        count = max(1, min(workers, total_frames // min_frames))
+        
+        length = -(-total_frames // count)
+        
+        segments = []
+        for start in range(0, total_frames, length):
+            segments.append((start, min(start + length, total_frames)))
+        segments[-1] = (segments[-1][0], None)  # read to the real end
+        
+        return segments
+    
+    def merge_stats(self, parts, rate_key, numerator, denominator):
+        """Combine per-segment statistics by summing their counters"""
+        merged = dict(parts[0])
+        for key, value in merged.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                merged[key] = sum(part[key] for part in parts)
         
+        total = merged[denominator]
+        merged[rate_key] = round(merged[numerator] / total, 4) if total else 0
+        return merged
+    
+    def get_config(self):
+        """Settings that must match between processes analyzing one video"""
+        return {
+            'crowd_threshold': self.crowd_threshold,
+            'violence_threshold': self.violence_threshold,
+            'track_max_age': self.track_max_age,
+            'object_time_threshold': self.object_time_threshold,
+            'moderate_crowd_threshold': self.moderate_crowd_threshold,
+            'alert_exit_ratio': self.alert_exit_ratio,
+            'alert_min_duration': self.alert_min_duration,
+            'alert_cooldown': self.alert_cooldown,
+            'detection_profile': self.detection_profile,
+            'detector_backend': self.detector_backend,
+            'yolo_model': self.yolo_model,
+            'batch_size': self.batch_size,
+            'sample_interval': self.sample_interval,
+            'adaptive_sampling': self.adaptive_sampling,
+            'min_sample_interval': self.min_sample_interval,
+            'max_sample_interval': self.max_sample_interval,
+            'motion_gating': self.motion_gating,
+            'motion_threshold': self.motion_threshold
+        }
+    
+    def apply_config(self, config):
+        """Apply settings produced by get_config"""
+        for key, value in config.items():
+            setattr(self, key, value)
+    
+    def detection_key(self):
+        """Short hash of the settings that affect detections
+        
+        Thresholds and alert event settings only matter for alerting, so
+        videos analyzed with other ones share their stored detections.
+        """
+        config = self.get_config()
+        for key in ALERT_SETTINGS:
+            config.pop(key)
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+    
+    def detections_path(self, video_path):
+        """Where the detections of a video are stored, next to the video"""
+        return f"{os.path.splitext(video_path)[0]}.{self.detection_key()}.npz"
+    
+    def save_detections(self, log, results, path):
+        """Save a detection log and link it from the analysis results"""
+        log.save(path)
+        results['detections'] = path
+    
+    def rescore(self, log, crowd_threshold=None, violence_threshold=None, moderate_crowd_threshold=None):
+        """Re-run alerting on stored detections with other thresholds
+        
+        Only the alert events and generate_summary run, so this takes
+        milliseconds instead of a full pass over the video. Crowd incidents
+        open above the lower of moderate_crowd_threshold and
+        crowd_threshold; crowd_threshold also separates large crowds from
+        moderate ones.
+        """
+        scorer = copy.copy(self)
+        if crowd_threshold is not None:
+            scorer.crowd_threshold = crowd_threshold
+        if violence_threshold is not None:
+            scorer.violence_threshold = violence_threshold
+        if moderate_crowd_threshold is not None:
+            scorer.moderate_crowd_threshold = moderate_crowd_threshold
+        
+        results = {
+            'video_info': log.video_info(),
+            'alerts': [],
+            'summary': {}
+        }
+        results['alerts'], results['events'] = scorer.score_log(log)
+        results['summary'] = scorer.generate_summary(results)
+        results['thresholds'] = {
+            'crowd': scorer.crowd_threshold,
+            'moderate_crowd': scorer.moderate_crowd_threshold,
+            'violence': scorer.violence_threshold
+        }
         return results
     
-    def analyze_frame(self, frame, prev_positions=None):
-        """Detect people and analyze movement"""
-        # Detect people using HOG
-        (rects, _) = self.hog.detectMultiScale(
-            frame,
-            winStride=(4, 4),
-            padding=(8, 8),
-            scale=1.05
+    def score_log(self, log):
+        """Alerts and event statistics for a whole detection log"""
+        engine = self.create_event_engine(log.fps)
+        alerts = []
+        for frame_number, people_count, movement_scores in log.samples():
+            alerts.extend(engine.update(frame_number, self.alert_signals(people_count, movement_scores)))
+        alerts.extend(engine.finish())
+        alerts.sort(key=lambda alert: alert['frame'])
+        return alerts, engine.stats()
+    
+    def create_sampler(self):
+        """Create a frame sampler from the sampling settings"""
+        return FrameSampler(
+            interval=self.sample_interval,
+            adaptive=self.adaptive_sampling,
+            min_interval=self.min_sample_interval,
+            max_interval=self.max_sample_interval
         )
+    
+    def create_gate(self):
+        """Create a motion gate, or None when gating is disabled"""
+        if not self.motion_gating:
+            return None
+        return MotionGate(threshold=self.motion_threshold)
+    
+    def create_consumer(self):
+        """Create a pipeline stage that analyzes frames for this analyzer"""
+        return AnalysisConsumer(self, self.create_sampler(), self.create_gate())
+    
+    def set_profile(self, name):
+        """Select one of DETECTION_PROFILES"""
+        if name not in DETECTION_PROFILES:
+            raise ValueError(f"Unknown detection profile: {name}")
+        self.detection_profile = name
+    
+    def get_backend(self):
+        """Detector backend for the current settings, created on first use"""
+        if self.detector_backend == 'hog':
+            key = ('hog', self.detection_profile)
+            options = {'profile': self.detection_profile}
+        else:
+            key = (self.detector_backend, self.yolo_model, self.batch_size)
+            options = {'model_path': self.yolo_model, 'batch_size': self.batch_size}
+        
+        if key != self.backend_key:
+            self.backend = create_backend(self.detector_backend, **options)
+            self.backend_key = key
+        
+        return self.backend
+    
+    def detect_people(self, frame):
+        """Run the people detector on a frame, boxes are in frame pixels"""
+        with timed('detect_people'):
+            return self.get_backend().detect(frame)
+    
+    def create_tracker(self):
+        """Create a multi-object tracker for one video or camera"""
+        return MultiObjectTracker(max_age=self.track_max_age)
+    
+    def analyze_frame(self, frame, tracker=None, gate=None, timestamp=0.0):
+        """Detect people and analyze movement
         
+        Pass the same tracker for consecutive frames of a video so people
+        keep their track ids and get a speed. With a motion gate, frames
+        that barely changed since the last detection reuse that detection
+        instead of running the detector.
+        """
+        rects = self.detect_frame(frame, gate)
+        return self.analyze_detections(rects, tracker, timestamp)
+    
+    def detect_frame(self, frame, gate=None):
+        """Detect people, or reuse the last detections if the gate allows"""
+        rects = gate.check(frame) if gate is not None else None
+        if rects is None:
+            rects = self.detect_people(frame)
+            if gate is not None:
+                gate.store(rects)
+        return rects
+    
+    def analyze_detections(self, rects, tracker=None, timestamp=0.0):
+        """Turn detected boxes into a people count, positions and movement
+        
+        positions maps track ids to box centers and movement_scores maps
+        the ids of tracks with a reliable velocity to their speed in px/s.
+        """
         people_count = len(rects)
-        positions = {}
-        movement_scores = {}
-        
-        # Process each detected person
-        for i, (x, y, w, h) in enumerate(rects):
-            # Filter small detections
-            if w * h < 2000:
-                continue
-                
-            # Calculate center point
-            center_x = x + w // 2
-            center_y = y + h // 2
-            positions[i] = (center_x, center_y)
-            
-            # Calculate movement
-            if prev_positions and i in prev_positions:
-                prev_x, prev_y = prev_positions[i]
-                movement = np.sqrt((center_x - prev_x)**2 + (center_y - prev_y)**2)
-                movement_scores[i] = movement
+        rects = np.asarray(rects, dtype=int).reshape(-1, 4)
+        
+        # Filter small detections
+        rects = rects[rects[:, 2] * rects[:, 3] >= 2000]
+        
+        if tracker is None:
+            tracker = self.create_tracker()
+        track_ids, velocities, matched = tracker.update(rects, timestamp)
+        
+        centers = rects[:, :2] + rects[:, 2:] // 2
+        speeds = np.hypot(velocities[:, 0], velocities[:, 1])
+        
+        positions = {int(t): (int(x), int(y)) for t, (x, y) in zip(track_ids, centers)}
+        movement_scores = {int(t): float(v) for t, v, m in zip(track_ids, speeds, matched) if m}
         
         return people_count, positions, movement_scores
     
-    def check_alerts(self, people_count, movement_scores, frame_number, fps):
-        """Generate alerts based on analysis"""
-        alerts = []
+    def alert_signals(self, people_count, movement_scores):
+        """Values the alert rules watch for one analyzed sample"""
+        return {
+            'crowd': people_count,
+            # Average tracked speed, no tracks means no movement
+            'violence': float(np.mean(list(movement_scores.values()))) if movement_scores else 0.0
+        }
+    
+    def create_event_engine(self, fps, live=False):
+        """Create the alert event engine for one video, or a live one for a camera"""
+        def describe_crowd(incident):
+            people = int(incident.peak)
+            duration = f"{incident.duration:.1f}s"
+            if people > self.crowd_threshold:
+                severity = 'high' if people > 15 else 'medium'
+                return f'Large crowd detected: up to {people} people for {duration}', severity
+            return f'Moderate crowd: up to {people} people for {duration}', 'low'
         
-        # Crowd alert
-        if people_count > self.crowd_threshold:
-            severity = 'high' if people_count > 15 else 'medium'
-            alerts.append({
-                'type': 'crowd',
-                'message': f'Large crowd detected: {people_count} people',
-                'severity': severity,
-                'frame': frame_number,
-                'timestamp': frame_number / fps if fps > 0 else 0
-            })
-        elif people_count > 5:
-            alerts.append({
-                'type': 'crowd',
-                'message': f'Moderate crowd: {people_count} people',
-                'severity': 'low',
-                'frame': frame_number,
-                'timestamp': frame_number / fps if fps > 0 else 0
-            })
-        
-        # Suspicious movement alert
-        if movement_scores:
-            avg_movement = np.mean(list(movement_scores.values()))
-            if avg_movement > self.violence_threshold:
-                alerts.append({
-                    'type': 'violence',
-                    'message': 'Suspicious rapid movement detected',
-                    'severity': 'medium',
-                    'frame': frame_number,
-                    'timestamp': frame_number / fps if fps > 0 else 0
-                })
-        
-        return alerts
+        def describe_movement(incident):
+            return (
+                f'Suspicious rapid movement detected for {incident.duration:.1f}s '
+                f'(peak {incident.peak:.0f} px/s)',
+                'medium'
+            )
+        
+        # A crowd_threshold below the moderate one still opens incidents
+        crowd_enter = min(self.moderate_crowd_threshold, self.crowd_threshold)
+        rules = [
+            EventRule(
+                'crowd',
+                enter=crowd_enter,
+                exit=crowd_enter * self.alert_exit_ratio,
+                min_duration=self.alert_min_duration,
+                cooldown=self.alert_cooldown,
+                describe=describe_crowd
+            ),
+            EventRule(
+                'violence',
+                enter=self.violence_threshold,
+                exit=self.violence_threshold * self.alert_exit_ratio,
+                min_duration=self.alert_min_duration,
+                cooldown=self.alert_cooldown,
+                describe=describe_movement
+            )
+        ]
+        return EventEngine(rules, fps, live=live)
     
     def generate_summary(self, results):
         """Generate analysis summary"""
@@ -162,17 +463,162 @@ class VideoAnalyzer:
             'duration': round(results['video_info']['duration'], 2),
             'total_alerts': total_alerts,
             'alert_types': alert_types,
+            'sampling': results.get('sampling', {}),
+            'motion_gate': results.get('motion_gate', {}),
             'description': f'Analysis complete. Detected {total_alerts} incidents.'
         }
     
     def get_model_status(self):
         """Get model status for dashboard"""
+        backend = self.get_backend()
         return {
             'status': 'operational',
-            'model': 'OpenCV HOG',
+            'model': backend.model,
+            'backend': backend.status(),
             'features': ['crowd_detection', 'violence_detection'],
+            'detection_profile': self.detection_profile,
+            'profiles': list(DETECTION_PROFILES),
             'thresholds': {
                 'crowd': self.crowd_threshold,
                 'violence': self.violence_threshold
             }
-        }
\ No newline at end of file
+        }
+
+
+class _BatchSlot:
+    """Placeholder for detections of a frame still waiting in a batch"""
+    
+    def __init__(self, index):
+        self.index = index
+
+
+class AnalysisConsumer(FrameConsumer):
+    """Pipeline stage that runs people detection and alerting on frames"""
+    
+    def __init__(self, analyzer, sampler, gate=None):
+        self.analyzer = analyzer
+        self.sampler = sampler
+        self.gate = gate
+        self.results = None
+        self.tracker = None
+        self.fps = 0
+        self.emit_after = 0  # frames up to this only seed movement tracking
+        self.backend = None
+        self.pending = []  # (frame_number, frame) waiting for a batch
+        self.log = None
+        self.events = None
+    
+    def start(self, video_info):
+        self.fps = video_info['fps']
+        total_frames = video_info['total_frames']
+        
+        # Analysis results
+        self.results = {
+            'video_info': {
+                'fps': self.fps,
+                'total_frames': total_frames,
+                'duration': total_frames / self.fps if self.fps > 0 else 0
+            },
+            'alerts': [],
+            'summary': {}
+        }
+        self.tracker = self.analyzer.create_tracker()
+        self.sampler.start(self.fps)
+        self.backend = self.analyzer.get_backend()
+        self.pending = []
+        self.log = DetectionLog(self.fps, total_frames)
+        self.events = self.analyzer.create_event_engine(self.fps)
+    
+    def wants(self, frame_number):
+        # Warm-up frames before a segment do not count towards its stats
+        if self.emit_after and frame_number == self.emit_after + 1:
+            self.flush()
+            self.sampler.reset_stats()
+            if self.gate is not None:
+                self.gate.reset_stats()
+        
+        # Only sampled frames are decoded and analyzed
+        return self.sampler.should_sample(frame_number)
+    
+    def consume(self, frame, frame_number):
+        if self.backend.batch_size > 1:
+            # Later stages may draw on the frame before the batch runs
+            self.pending.append((frame_number, frame.copy()))
+            self.sampler.record(frame_number)
+            if len(self.pending) >= self.backend.batch_size:
+                self.flush()
+            return
+        
+        # Analyze frame
+        rects = self.analyzer.detect_frame(frame, self.gate)
+        people_count, positions, movement_scores = self.analyzer.analyze_detections(
+            rects, self.tracker, self.timestamp(frame_number)
+        )
+        self.sampler.record(frame_number, active=people_count > 0)
+        self.process(frame_number, rects, people_count, positions, movement_scores)
+    
+    def flush(self):
+        """Run the detector on the buffered frames as one batch"""
+        if not self.pending:
+            return
+        
+        # Decide which frames need the detector. A gated frame reuses the
+        # detections of the last frame before it that was detected, which
+        # may itself still be waiting in this batch.
+        batch = []
+        sources = []
+        for frame_number, frame in self.pending:
+            cached = self.gate.check(frame) if self.gate is not None else None
+            if cached is None:
+                cached = _BatchSlot(len(batch))
+                batch.append(frame)
+                if self.gate is not None:
+                    self.gate.store(cached)
+            sources.append(cached)
+        
+        with timed('detect_people'):
+            detections = self.backend.detect_batch(batch) if batch else []
+        
+        def resolve(source):
+            return detections[source.index] if isinstance(source, _BatchSlot) else source
+        
+        if self.gate is not None:
+            self.gate.detections = resolve(self.gate.detections)
+        
+        for (frame_number, _), source in zip(self.pending, sources):
+            rects = resolve(source)
+            people_count, positions, movement_scores = self.analyzer.analyze_detections(
+                rects, self.tracker, self.timestamp(frame_number)
+            )
+            self.sampler.observe(people_count > 0)
+            self.process(frame_number, rects, people_count, positions, movement_scores)
+        
+        self.pending = []
+    
+    def timestamp(self, frame_number):
+        """Video time of a frame in seconds"""
+        return frame_number / self.sampler.fps
+    
+    def process(self, frame_number, rects, people_count, positions, movement_scores):
+        """Alerting and bookkeeping for one analyzed frame"""
+        # Check for alerts
+        if frame_number > self.emit_after:
+            self.log.add(frame_number, rects, people_count, movement_scores)
+            signals = self.analyzer.alert_signals(people_count, movement_scores)
+            self.results['alerts'].extend(self.events.update(frame_number, signals))
+    
+    def finish(self):
+        self.flush()
+        
+        # Incidents still open at the end of the video
+        self.results['alerts'].extend(self.events.finish())
+        self.results['alerts'].sort(key=lambda alert: alert['frame'])
+        self.results['events'] = self.events.stats()
+        
+        # Generate summary
+        self.results['sampling'] = self.sampler.stats()
+        if self.gate is not None:
+            self.results['motion_gate'] = self.gate.stats()
+        self.results['summary'] = self.analyzer.generate_summary(self.results)
+        
+        return self.results
\ No newline at end of file
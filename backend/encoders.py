@@ -0,0 +1,211 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+# Containers the ffmpeg encoder can write:
+#   mp4   H.264 with the moov atom moved to the front (+faststart), so
+#         playback starts before the whole file has downloaded
+#   fmp4  fragmented MP4, playable while it is still being written
+#   hls   a .m3u8 playlist with short MPEG-TS segments
+OUTPUT_FORMATS = ('mp4', 'fmp4', 'hls')
+
+
+def find_ffmpeg():
+    """Path of the ffmpeg binary, or None if there is none
+
+    URBANSIGHT_FFMPEG takes precedence, then ffmpeg on the PATH, then the
+    binary bundled with the imageio-ffmpeg package if it is installed.
+    """
+    path = os.environ.get('URBANSIGHT_FFMPEG') or shutil.which('ffmpeg')
+    if path:
+        return path
+
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+class VideoEncoder:
+    """Writes processed frames to a video file
+
+    `open` receives the output path without an extension and returns the
+    path of the file to link to, which depends on the container.
+    """
+
+    name = 'base'
+
+    def open(self, base_path, fps, width, height):
+        raise NotImplementedError
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def status(self):
+        return {'encoder': self.name}
+
+
+class OpenCVEncoder(VideoEncoder):
+    """MPEG-4 Part 2 through cv2.VideoWriter, needs nothing but OpenCV"""
+
+    name = 'opencv'
+
+    def __init__(self, extension='.mp4'):
+        self.extension = extension
+        self.writer = None
+
+    def open(self, base_path, fps, width, height):
+        output_path = base_path + self.extension
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        return output_path
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class FFmpegEncoder(VideoEncoder):
+    """H.264 through an ffmpeg subprocess fed with raw BGR frames"""
+
+    name = 'ffmpeg'
+
+    def __init__(self, crf=23, preset='veryfast', output_format='mp4',
+                 segment_seconds=4, ffmpeg_path=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        if self.ffmpeg_path is None:
+            raise RuntimeError(
+                "The ffmpeg encoder needs an ffmpeg binary on the PATH "
+                "(or set URBANSIGHT_FFMPEG)"
+            )
+
+        self.crf = crf
+        self.preset = preset
+        self.output_format = output_format
+        self.segment_seconds = segment_seconds
+        self.process = None
+        self.log = None
+
+    def _output_args(self, base_path):
+        if self.output_format == 'hls':
+            # Segments and playlist share a directory per video
+            os.makedirs(base_path, exist_ok=True)
+            output_path = os.path.join(base_path, 'index.m3u8')
+            return output_path, [
+                '-f', 'hls',
+                '-hls_time', str(self.segment_seconds),
+                '-hls_playlist_type', 'vod',
+                '-hls_segment_filename', os.path.join(base_path, 'segment_%04d.ts'),
+                output_path
+            ]
+
+        output_path = base_path + '.mp4'
+        if self.output_format == 'fmp4':
+            movflags = '+frag_keyframe+empty_moov+default_base_moof'
+        else:
+            movflags = '+faststart'
+        return output_path, ['-movflags', movflags, output_path]
+
+    def open(self, base_path, fps, width, height):
+        fps = fps if fps > 0 else 25
+        output_path, output_args = self._output_args(base_path)
+
+        command = [
+            self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f"{width}x{height}", '-r', str(fps),
+            '-i', '-',
+            '-an',
+            # yuv420p needs even dimensions
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+            # Regular keyframes keep seeking and segmenting cheap
+            '-g', str(int(fps * 2))
+        ] + output_args
+
+        # Errors go to a file, a full stderr pipe would stall the encoder
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self.log
+        )
+        return output_path
+
+    def _error(self):
+        self.log.seek(0)
+        message = self.log.read().decode(errors='replace').strip()
+        return RuntimeError(f"ffmpeg failed: {message or 'exit code ' + str(self.process.returncode)}")
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+        except (BrokenPipeError, OSError):
+            self.process.wait()
+            raise self._error()
+
+    def close(self):
+        if self.process is None:
+            return
+
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self.process.wait()
+
+        try:
+            if returncode != 0:
+                raise self._error()
+        finally:
+            self.log.close()
+            self.process = None
+
+    def status(self):
+        return {
+            'encoder': self.name,
+            'crf': self.crf,
+            'preset': self.preset,
+            'output_format': self.output_format
+        }
+
+
+ENCODERS = {
+    'opencv': OpenCVEncoder,
+    'ffmpeg': FFmpegEncoder
+}
+
+
+def create_encoder(name='auto', **options):
+    """Create an encoder by name
+
+    'auto' picks ffmpeg when a binary is available and falls back to
+    OpenCV otherwise. The options only apply to the ffmpeg encoder.
+    """
+    if name == 'auto':
+        name = 'ffmpeg' if find_ffmpeg() is not None else 'opencv'
+        if name == 'opencv':
+            print("ffmpeg not found, writing MPEG-4 with OpenCV instead")
+
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {name}")
+    if name == 'opencv':
+        return OpenCVEncoder()
+    return FFmpegEncoder(**options)
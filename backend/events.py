@@ -0,0 +1,172 @@
+from sampler import FrameSampler
+
+
+class EventRule:
+    """When a signal turns into an incident
+
+    An incident starts when the signal rises above `enter` and lasts while
+    it stays above `exit`, so a value hovering around the threshold does
+    not start and stop it on every sample. Incidents that start again
+    within `cooldown` seconds of ending are merged into one, and incidents
+    shorter than `min_duration` seconds are dropped as noise.
+
+    `describe(incident)` returns the (message, severity) of the alert.
+    """
+
+    def __init__(self, alert_type, enter, exit=None, min_duration=0.0, cooldown=0.0,
+                 describe=None):
+        self.alert_type = alert_type
+        self.enter = enter
+        self.exit = enter if exit is None else exit
+        self.min_duration = min_duration
+        self.cooldown = cooldown
+        self.describe = describe or (lambda incident: (f"{alert_type} detected", 'medium'))
+
+
+class Incident:
+    """One stretch of time a rule was triggered"""
+
+    def __init__(self, frame_number, timestamp, value):
+        self.start_frame = frame_number
+        self.start = timestamp
+        self.end_frame = frame_number
+        self.end = timestamp
+        self.peak = value
+        self.peak_frame = frame_number
+        self.samples = 1
+        self.reported = False  # start already alerted in live mode
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def extend(self, frame_number, timestamp, value):
+        self.end_frame = frame_number
+        self.end = timestamp
+        self.samples += 1
+        if value > self.peak:
+            self.peak = value
+            self.peak_frame = frame_number
+
+
+class EventEngine:
+    """Turns per-sample signals into one alert per incident
+
+    Feed it the signal values of every analyzed sample with `update`; it
+    returns the alerts of incidents that are over, which is only once
+    their cooldown has passed. `finish` returns whatever is still open at
+    the end of the video.
+
+    A `live` engine, for cameras, cannot wait for an incident to be over:
+    it returns an alert with status 'started' as soon as an incident has
+    lasted `min_duration`, and one with status 'ended' for the same
+    incident once it is over.
+    """
+
+    def __init__(self, rules, fps, live=False):
+        self.rules = {rule.alert_type: rule for rule in rules}
+        self.fps = fps if fps > 0 else FrameSampler.DEFAULT_FPS
+        self.live = live
+        self.active = {}  # incidents whose signal is still above exit
+        self.ending = {}  # incidents waiting out their cooldown
+        self.triggers = 0
+        self.incidents = 0
+        self.suppressed = 0
+
+    def update(self, frame_number, signals):
+        """Process the signal values of one sample, return the alerts it caused"""
+        timestamp = frame_number / self.fps
+        alerts = []
+
+        for alert_type, value in signals.items():
+            rule = self.rules[alert_type]
+            if value > rule.enter:
+                self.triggers += 1
+
+            incident = self.active.get(alert_type)
+            if incident is not None:
+                if value > rule.exit:
+                    incident.extend(frame_number, timestamp, value)
+                    alerts.extend(self._start(rule, incident))
+                    continue
+                # Below the exit level, the incident ends unless it restarts
+                # within the cooldown
+                del self.active[alert_type]
+                self.ending[alert_type] = incident
+
+            elif value > rule.enter:
+                ended = self.ending.pop(alert_type, None)
+                if ended is not None and timestamp - ended.end <= rule.cooldown:
+                    ended.extend(frame_number, timestamp, value)
+                    self.active[alert_type] = incident = ended
+                else:
+                    if ended is not None:
+                        alerts.extend(self._close(rule, ended))
+                    self.active[alert_type] = incident = Incident(frame_number, timestamp, value)
+                alerts.extend(self._start(rule, incident))
+                continue
+
+            ended = self.ending.get(alert_type)
+            if ended is not None and timestamp - ended.end > rule.cooldown:
+                del self.ending[alert_type]
+                alerts.extend(self._close(rule, ended))
+
+        return alerts
+
+    def finish(self):
+        """Close all incidents at the end of the video"""
+        alerts = []
+        for incidents in (self.ending, self.active):
+            for alert_type, incident in incidents.items():
+                alerts.extend(self._close(self.rules[alert_type], incident))
+            incidents.clear()
+        return sorted(alerts, key=lambda alert: alert['frame'])
+
+    def _start(self, rule, incident):
+        """Live mode: alert once an incident has lasted long enough"""
+        if not self.live or incident.reported or incident.duration < rule.min_duration:
+            return []
+        incident.reported = True
+        self.incidents += 1
+        return [self._alert(rule, incident, 'started')]
+
+    def _close(self, rule, incident):
+        if self.live:
+            if not incident.reported:
+                self.suppressed += 1
+                return []
+            return [self._alert(rule, incident, 'ended')]
+
+        if incident.duration < rule.min_duration:
+            self.suppressed += 1
+            return []
+
+        self.incidents += 1
+        return [self._alert(rule, incident)]
+
+    def _alert(self, rule, incident, status=None):
+        message, severity = rule.describe(incident)
+        alert = {
+            'type': rule.alert_type,
+            'message': message,
+            'severity': severity,
+            'frame': incident.start_frame,
+            'timestamp': incident.start,
+            'end_frame': incident.end_frame,
+            'end_timestamp': incident.end,
+            'duration': round(incident.duration, 2),
+            'peak': round(incident.peak, 2),
+            'peak_frame': incident.peak_frame,
+            'samples': incident.samples
+        }
+        if status:
+            alert['status'] = status
+        return alert
+
+    def stats(self):
+        """Alerting statistics for the analysis results"""
+        return {
+            'triggered_samples': self.triggers,
+            'incidents': self.incidents,
+            'suppressed': self.suppressed
+        }
@@ -0,0 +1,435 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import metrics
+from detections import DetectionLog
+from pipeline import FrameConsumer, VideoPipeline
+from profiling import FrameTimer, create_profiler, save_profile
+
+# Per-process state for pool workers
+_progress_queue = None
+_cpu_budget = None  # (shared count of claimed CPUs, CPUs available)
+_analyzer = None
+_face_processor = None
+_default_config = None
+_default_privacy_config = None
+
+
+def _init_worker(progress_queue, claimed_cpus=None, cpus=None):
+    """Initializer for analysis worker processes"""
+    global _progress_queue, _cpu_budget
+    _progress_queue = progress_queue
+    if claimed_cpus is not None:
+        _cpu_budget = (claimed_cpus, cpus)
+
+
+def _claim_cpus(wanted=None, minimum=0):
+    """Claim CPUs that no running job uses, returns how many were claimed
+
+    At most `wanted` (all free CPUs by default), and at least `minimum`
+    even if that oversubscribes the budget.
+    """
+    if _cpu_budget is None:
+        # Not started by a JobManager: every CPU but this process's is free
+        free = (os.cpu_count() or 1) - 1
+        if wanted is not None:
+            free = min(free, wanted)
+        return max(minimum, free)
+
+    claimed, cpus = _cpu_budget
+    with claimed.get_lock():
+        count = cpus - claimed.value
+        if wanted is not None:
+            count = min(count, wanted)
+        count = max(minimum, count)
+        claimed.value += count
+    return count
+
+
+def _release_cpus(count):
+    if _cpu_budget is not None and count:
+        claimed, _ = _cpu_budget
+        with claimed.get_lock():
+            claimed.value -= count
+
+
+def _report_progress(job_id, progress, stage):
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, progress, stage))
+
+
+def _get_models():
+    """Load the AI models once per worker process"""
+    global _analyzer, _face_processor, _default_config, _default_privacy_config
+
+    if _analyzer is None:
+        from detector import VideoAnalyzer
+        from face_blur import FaceBlurProcessor
+
+        _analyzer = VideoAnalyzer()
+        _face_processor = FaceBlurProcessor()
+        _default_config = _analyzer.get_config()
+        _default_privacy_config = _face_processor.get_config()
+
+    return _analyzer, _face_processor
+
+
+class ProgressConsumer(FrameConsumer):
+    """Pipeline stage that reports how far through the video a job is"""
+
+    def __init__(self, job_id, stage='analyzing', report_every=2):
+        self.job_id = job_id
+        self.stage = stage
+        self.report_every = report_every  # percent
+        self.total_frames = 0
+        self.last_reported = 0
+
+    def start(self, video_info):
+        self.total_frames = video_info['total_frames']
+        self.last_reported = 0
+        _report_progress(self.job_id, 0, self.stage)
+
+    def wants(self, frame_number):
+        # Progress only needs frame numbers, never pixels
+        return False
+
+    def skip(self, frame_number):
+        if self.total_frames <= 0:
+            return
+
+        progress = min(99, int(frame_number * 100 / self.total_frames))
+        if progress - self.last_reported >= self.report_every:
+            self.last_reported = progress
+            _report_progress(self.job_id, progress, self.stage)
+
+
+def run_analysis_job(job_id, filepath, privacy_mode=True, parallel=False, config=None, output_name=None,
+                     profiling=None):
+    """Analyze an uploaded video inside a worker process
+
+    With `parallel` the analysis is split into time segments spread over
+    several processes, which pays off for long archival files; face
+    blurring then needs its own pass over the video. `config` overrides
+    analyzer and face blur settings (see VideoAnalyzer.get_config and
+    FaceBlurProcessor.get_config) for this job only. `output_name` names
+    the blurred video, without extension.
+
+    `profiling` names a profiler from profiling.PROFILERS to run the job
+    under; the result then links the profile and per-frame timings.
+    """
+    analyzer, face_processor = _get_models()
+
+    config = config or {}
+    privacy_config = {key: value for key, value in config.items() if key in _default_privacy_config}
+    analysis_config = {key: value for key, value in config.items() if key not in _default_privacy_config}
+    analyzer.apply_config(dict(_default_config, **analysis_config))
+    face_processor.apply_config(dict(_default_privacy_config, **privacy_config))
+
+    print(f"[{job_id}] Analyzing video: {filepath}")
+
+    # Stage timings of this job only, the web process merges them into its own
+    metrics.REGISTRY.reset()
+    started = time.perf_counter()
+
+    # This process runs on one CPU of the budget whether or not one is free
+    own_cpu = _claim_cpus(1, minimum=1)
+    try:
+        if not profiling:
+            result = _analyze(job_id, filepath, analyzer, face_processor, privacy_mode, parallel, output_name)
+        else:
+            profiler = create_profiler(profiling)
+            timer = FrameTimer()
+            profiler.start()
+            try:
+                result = _analyze(
+                    job_id, filepath, analyzer, face_processor, privacy_mode, parallel, output_name, timer
+                )
+            finally:
+                profiler.stop()
+    finally:
+        _release_cpus(own_cpu)
+
+    if 'error' in result:
+        return result
+
+    result['performance'] = metrics.performance(
+        metrics.REGISTRY.snapshot(),
+        time.perf_counter() - started,
+        result.get('video_info', {}).get('total_frames', 0)
+    )
+
+    if profiling:
+        log = DetectionLog.load(result['detections']) if result.get('detections') else None
+        result['profile'] = save_profile(job_id, profiler, timer, log)
+
+    _report_progress(job_id, 100, 'finalizing')
+    return result
+
+
+def _analyze(job_id, filepath, analyzer, face_processor, privacy_mode, parallel, output_name, timer=None):
+    """Run the analysis and face blurring passes of a job
+
+    A `timer` is added as the last stage of the pipeline run in this
+    process.
+    """
+    extra = [timer] if timer is not None else []
+
+    # Per-sample detections are kept next to the upload for re-scoring
+    detections_path = analyzer.detections_path(filepath)
+
+    if parallel:
+        _report_progress(job_id, 0, 'analyzing')
+        # Segments run on this job's CPU, which idles meanwhile, and on
+        # every CPU other jobs leave free. With none free it runs serially.
+        extra = _claim_cpus()
+        try:
+            result = analyzer.analyze_video_parallel(
+                filepath,
+                workers=1 + extra,
+                detections_path=detections_path,
+                on_progress=lambda done, total: _report_progress(
+                    job_id, min(99, done * 100 // total), 'analyzing'
+                )
+            )
+        finally:
+            _release_cpus(extra)
+        if 'error' in result:
+            return result
+
+        blurred_path = None
+        blur_consumer = None
+        if privacy_mode:
+            blur_consumer = face_processor.create_consumer(filepath, output_name)
+            outputs = VideoPipeline(filepath).run([
+                ProgressConsumer(job_id, stage='blurring'),
+                blur_consumer
+            ] + extra)
+            blurred_path = outputs[1] if outputs else None
+    else:
+        # Decode once: analysis runs first, then face blurring for privacy
+        # draws on the same frames
+        consumers = [analyzer.create_consumer(), ProgressConsumer(job_id)]
+        blur_consumer = None
+        if privacy_mode:
+            blur_consumer = face_processor.create_consumer(filepath, output_name)
+            consumers.append(blur_consumer)
+
+        outputs = VideoPipeline(filepath).run(consumers + extra)
+        if outputs is None:
+            return {"error": "Could not open video"}
+
+        result = outputs[0]
+        analyzer.save_detections(consumers[0].log, result, detections_path)
+        blurred_path = outputs[2] if privacy_mode else None
+
+    if blurred_path:
+        # HLS output is a playlist inside a directory per video
+        relative_path = os.path.relpath(blurred_path, 'static/processed').replace(os.sep, '/')
+        result['processed_video'] = f"/static/processed/{relative_path}"
+        result['privacy'] = blur_consumer.stats()
+
+    return result
+
+
+class JobManager:
+    """Runs analysis jobs on a bounded pool of worker processes
+
+    Job state lives in the web process. Workers report progress through a
+    queue which `monitor` drains, calling `on_progress(job)` for each update
+    and `on_complete(job, result)` once a job finishes.
+
+    With a `store` every change to a job record is also saved there, so
+    web processes sharing the store can look up each other's jobs.
+
+    `cpus` is the number of CPUs this manager may keep busy, all of them by
+    default. Every running job claims one of them; a parallel job also
+    claims the ones left free when it starts and runs that many more
+    segments, and its result's summary says how many segments it used.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, on_progress=None, on_complete=None,
+                 store=None, cpus=None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.cpus = cpus or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.store = store
+
+        self.jobs = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+
+        # Spawned workers do not inherit the web server's green threads
+        self.context = multiprocessing.get_context('spawn')
+        self.progress_queue = self.context.SimpleQueue()
+        self.claimed_cpus = self.context.Value('i', 0)
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self.context,
+                initializer=_init_worker,
+                initargs=(self.progress_queue, self.claimed_cpus, self.cpus)
+            )
+        return self.executor
+
+    def _save(self, job):
+        if self.store is not None:
+            self.store.save_job(job)
+
+    def active_count(self):
+        """Number of jobs queued or running"""
+        if self.store is not None:
+            return len(self.store.active_jobs())
+        with self.lock:
+            return len(self.futures)
+
+    def submit(self, filepath, privacy_mode=True, parallel=False, config=None,
+               output_name=None, profiling=None, **metadata):
+        """Queue a video for analysis, returns the job record
+
+        `profiling` runs the job under a profiler, see run_analysis_job.
+        Returns None when the queue is full.
+        """
+        with self.lock:
+            if len(self.futures) >= self.max_pending:
+                return None
+
+            job_id = f"job_{uuid.uuid4().hex[:12]}"
+            job = {
+                'id': job_id,
+                'status': 'queued',
+                'progress': 0,
+                'stage': 'queued',
+                'filepath': filepath,
+                'privacy_mode': privacy_mode,
+                'parallel': parallel,
+                'config': config or {},
+                'profiling': profiling,
+                'created_at': datetime.now().isoformat(),
+                'started_at': None,
+                'completed_at': None,
+                'result_id': None,
+                'error': None
+            }
+            job.update(metadata)
+            self.jobs[job_id] = job
+
+            self.futures[job_id] = self._get_executor().submit(
+                run_analysis_job, job_id, filepath, privacy_mode, parallel, config, output_name, profiling
+            )
+
+        self._save(job)
+        return job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.get_job(job_id)
+        return job
+
+    def list(self):
+        if self.store is not None:
+            return self.store.list_jobs()
+        return list(self.jobs.values())
+
+    def find_active(self, **fields):
+        """First queued or running job whose fields match, or None"""
+        with self.lock:
+            for job_id in self.futures:
+                job = self.jobs[job_id]
+                if all(job.get(key) == value for key, value in fields.items()):
+                    return job
+
+        if self.store is not None:
+            for job in self.store.active_jobs():
+                if all(job.get(key) == value for key, value in fields.items()):
+                    return job
+        return None
+
+    def poll(self):
+        """Apply queued progress updates and collect finished jobs"""
+        updated = {}
+
+        while not self.progress_queue.empty():
+            job_id, progress, stage = self.progress_queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] in ('completed', 'failed'):
+                continue
+
+            if job['status'] == 'queued':
+                job['status'] = 'running'
+                job['started_at'] = datetime.now().isoformat()
+            job['progress'] = progress
+            job['stage'] = stage
+            updated[job_id] = job
+
+        with self.lock:
+            done = [job_id for job_id, future in self.futures.items() if future.done()]
+            finished = [(job_id, self.futures.pop(job_id)) for job_id in done]
+
+        for job in updated.values():
+            self._save(job)
+            if self.on_progress:
+                self.on_progress(job)
+
+        for job_id, future in finished:
+            job = self.jobs[job_id]
+            job['completed_at'] = datetime.now().isoformat()
+
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error in analysis job {job_id}: {e}")
+                job['status'] = 'failed'
+                job['stage'] = 'failed'
+                job['error'] = str(e)
+                result = None
+
+            if result is not None and 'error' in result:
+                job['status'] = 'failed'
+                job['stage'] = 'failed'
+                job['error'] = result['error']
+            elif result is not None:
+                job['status'] = 'completed'
+                job['stage'] = 'completed'
+                job['progress'] = 100
+
+            performance = (result or {}).get('performance')
+            if performance:
+                metrics.REGISTRY.merge(performance.pop('metrics'))
+                metrics.inc('urbansight_analyzed_frames_total', performance['frames'])
+
+            if self.on_complete:
+                try:
+                    self.on_complete(job, result)
+                except Exception as e:
+                    print(f"Error completing job {job_id}: {e}")
+                    job['status'] = 'failed'
+                    job['error'] = str(e)
+
+            metrics.inc('urbansight_analyses_total', status=job['status'])
+            self._save(job)
+            if self.on_progress:
+                self.on_progress(job)
+
+    def monitor(self, sleep=time.sleep, interval=0.5):
+        """Poll forever, intended to run as a background task"""
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error in job monitor: {e}")
+            sleep(interval)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
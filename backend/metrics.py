@@ -0,0 +1,245 @@
+import bisect
+import sys
+import time
+from contextlib import contextmanager
+
+if 'eventlet' in sys.modules:
+    # Stages are timed on OS threads (blur workers, cameras) as well as on
+    # the web server's green threads; a green lock cannot be shared by both
+    from eventlet.patcher import original
+    threading = original('threading')
+else:
+    import threading
+
+# Histogram upper bounds in seconds, from watermarking a frame (~0.1 ms)
+# to detecting people at native 1080p (~2 s)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = 'urbansight_stage_duration_seconds'
+
+# Metrics recorded by the application, name -> (type, help)
+METRICS = {
+    STAGE_SECONDS: ('histogram', 'Time per call of a processing stage (decode, detect_people, '
+                                 'detect_faces, blur, watermark, encode, alert_fanout)'),
+    'urbansight_http_request_duration_seconds': ('histogram', 'Time to handle an HTTP request'),
+    'urbansight_analyses_total': ('counter', 'Analysis jobs finished, by status'),
+    'urbansight_analyzed_frames_total': ('counter', 'Video frames read by finished analysis jobs'),
+    'urbansight_alerts_broadcast_total': ('counter', 'Alerts sent to Socket.IO rooms'),
+    'urbansight_alert_batches_total': ('counter', 'Alert batches sent to Socket.IO rooms'),
+    'urbansight_alerts_skipped_total': ('counter', 'Alert deliveries skipped for backlogged clients')
+}
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, data):
+        for index, count in enumerate(data['counts']):
+            self.counts[index] += count
+        self.sum += data['sum']
+        self.count += data['count']
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry:
+    """Counters and histograms of one process, and gauges read when rendered
+
+    Counters and histograms are keyed by name and labels and created on
+    first use. A snapshot is plain JSON, so the metrics of analysis worker
+    processes and other web workers can be merged into one registry or
+    into one rendering.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        self.gauges = {}  # name -> (help, function returning {labels: value})
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, help, function):
+        """Register a gauge; function() returns a value or {labels dict as tuple: value}"""
+        self.gauges[name] = (help, function)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, dict(labels), histogram.snapshot()]
+                    for (name, labels), histogram in self.histograms.items()
+                ]
+            }
+
+    def merge(self, snapshot):
+        """Add the counters and histograms of a snapshot to this registry"""
+        with self.lock:
+            for name, labels, value in snapshot.get('counters', []):
+                key = self._key(name, labels)
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, data in snapshot.get('histograms', []):
+                key = self._key(name, labels)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.merge(data)
+
+    def render(self, snapshots=()):
+        """Prometheus text format, with other processes' snapshots added"""
+        combined = MetricsRegistry()
+        combined.merge(self.snapshot())
+        for snapshot in snapshots:
+            combined.merge(snapshot)
+
+        lines = []
+        families = {}
+        for (name, labels), value in combined.counters.items():
+            families.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in combined.histograms.items():
+            families.setdefault(name, []).append((labels, histogram))
+
+        for name in sorted(families):
+            kind, help = METRICS.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(families[name], key=lambda item: item[0]):
+                if isinstance(value, Histogram):
+                    lines.extend(_histogram_lines(name, labels, value))
+                else:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for name, (help, function) in sorted(self.gauges.items()):
+            try:
+                values = function()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+                continue
+            if not isinstance(values, dict):
+                values = {(): values}
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(values.items()):
+                if value is not None:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        yield f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}"
+    yield f"{name}_sum{_labels(labels)} {_number(histogram.sum)}"
+    yield f"{name}_count{_labels(labels)} {histogram.count}"
+
+
+# Metrics of this process
+REGISTRY = MetricsRegistry()
+
+
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def timed(stage):
+    """Record the time spent in a block as one call of a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+
+
+def performance(snapshot, wall_seconds, frames):
+    """Per-analysis performance block from the snapshot of one job
+
+    The snapshot is kept under 'metrics' so the web process can merge it
+    into its own registry.
+    """
+    stages = {}
+    for name, labels, data in snapshot.get('histograms', []):
+        if name != STAGE_SECONDS:
+            continue
+        histogram = Histogram()
+        histogram.merge(data)
+        stages[labels['stage']] = {
+            'calls': histogram.count,
+            'seconds': round(histogram.sum, 3),
+            'mean_ms': round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0,
+            'p95_ms': round(histogram.quantile(0.95) * 1000, 3) if histogram.count else 0,
+            'share': round(histogram.sum / wall_seconds, 3) if wall_seconds > 0 else 0
+        }
+
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'frames': frames,
+        'fps': round(frames / wall_seconds, 2) if wall_seconds > 0 else 0,
+        'stages': stages,
+        'metrics': snapshot
+    }
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap change detector that decides whether a frame needs detection
+
+    Each frame is shrunk to a small grayscale thumbnail and compared with
+    the thumbnail of the last frame that was run through the detector. If
+    fewer than `threshold` of the pixels changed by more than
+    `pixel_delta`, the previous detections are reused. Detection is forced
+    every `max_reuse` gated frames so slow changes are never missed.
+    """
+
+    def __init__(self, threshold=0.002, pixel_delta=20, width=160, max_reuse=25):
+        self.threshold = threshold  # fraction of changed pixels
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.max_reuse = max_reuse
+
+        self.reference = None
+        self.current = None
+        self.detections = None
+        self.reused_in_a_row = 0
+        self.last_score = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames_checked = 0
+        self.frames_reused = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / w))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Smooth out sensor noise so it does not count as motion
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def check(self, frame):
+        """Return the cached detections if the frame has not changed, else None"""
+        self.frames_checked += 1
+        self.current = self._thumbnail(frame)
+
+        if self.reference is None or self.detections is None \
+                or self.reference.shape != self.current.shape:
+            return None
+
+        if self.reused_in_a_row >= self.max_reuse:
+            return None
+
+        diff = cv2.absdiff(self.current, self.reference)
+        self.last_score = np.count_nonzero(diff > self.pixel_delta) / diff.size
+
+        if self.last_score >= self.threshold:
+            return None
+
+        self.reused_in_a_row += 1
+        self.frames_reused += 1
+        return self.detections
+
+    def store(self, detections):
+        """Remember fresh detections for the frame passed to the last check"""
+        self.reference = self.current
+        self.detections = detections
+        self.reused_in_a_row = 0
+
+    def stats(self):
+        """Gate statistics for the analysis summary"""
+        return {
+            'threshold': self.threshold,
+            'frames_checked': self.frames_checked,
+            'frames_reused': self.frames_reused,
+            'detector_runs': self.frames_checked - self.frames_reused,
+            'hit_rate': round(self.frames_reused / self.frames_checked, 4) if self.frames_checked else 0
+        }
@@ -0,0 +1,99 @@
+import time
+
+import cv2
+
+from metrics import STAGE_SECONDS, observe
+
+
+class FrameConsumer:
+    """Base class for stages that receive frames from a VideoPipeline"""
+
+    def start(self, video_info):
+        """Called once with the video properties before the first frame"""
+        pass
+
+    def wants(self, frame_number):
+        """Whether this stage needs the decoded pixels of a frame"""
+        return True
+
+    def consume(self, frame, frame_number):
+        """Called with each frame the stage wants (frame numbers start at 1)"""
+        pass
+
+    def skip(self, frame_number):
+        """Called instead of consume for frames the stage did not want"""
+        pass
+
+    def finish(self):
+        """Called after the last frame, returns the stage result"""
+        return None
+
+
+class VideoPipeline:
+    def __init__(self, video_path, start_frame=0, end_frame=None):
+        self.video_path = video_path
+        self.start_frame = start_frame  # frames before this are skipped
+        self.end_frame = end_frame  # last frame number to decode
+
+    def run(self, consumers):
+        """Decode the video once and fan every frame out to the consumers
+
+        Frames are only retrieved when at least one consumer wants them.
+        Consumers are called in list order for each frame. A consumer may
+        modify the frame in place, so stages that only read frames (such
+        as analysis) must come before stages that draw on them (such as
+        face blurring).
+
+        Returns the list of consumer results, or None if the video could
+        not be opened.
+        """
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            return None
+
+        video_info = {
+            'path': self.video_path,
+            'fps': int(cap.get(cv2.CAP_PROP_FPS)),
+            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        }
+
+        for consumer in consumers:
+            consumer.start(video_info)
+
+        frame_number = 0
+        if self.start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            # Seeking can land off target on some codecs, so number frames
+            # from where the decoder actually is
+            frame_number = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+        try:
+            while self.end_frame is None or frame_number < self.end_frame:
+                # grab() advances the stream without the colour conversion
+                # and copy that retrieve() does, so frames nobody wants are
+                # cheap to pass over
+                start = time.perf_counter()
+                if not cap.grab():
+                    break
+
+                frame_number += 1
+                wanted = [consumer.wants(frame_number) for consumer in consumers]
+
+                frame = None
+                if any(wanted):
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                observe(STAGE_SECONDS, time.perf_counter() - start, stage='decode')
+
+                for consumer, wants in zip(consumers, wanted):
+                    if wants:
+                        consumer.consume(frame, frame_number)
+                    else:
+                        consumer.skip(frame_number)
+        finally:
+            cap.release()
+
+        return [consumer.finish() for consumer in consumers]
@@ -0,0 +1,223 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+from collections import Counter
+
+if 'eventlet' in sys.modules:
+    # The sampler must be a real thread to interrupt the work it samples
+    from eventlet.patcher import original
+    threading = original('threading')
+else:
+    import threading
+
+from pipeline import FrameConsumer
+
+PROFILE_FOLDER = os.path.join('static', 'profiles')
+
+
+class FrameTimer(FrameConsumer):
+    """Last stage of a profiled pipeline, times every frame
+
+    Consumers are called in list order for each frame, so the time from
+    one frame to the next covers decoding it and every stage before this
+    one. Stages that hand frames to threads (parallel face blurring) are
+    only counted up to the hand-off.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.times = []  # seconds
+        self.last = None
+
+    def start(self, video_info):
+        self.last = time.perf_counter()
+
+    def wants(self, frame_number):
+        return False
+
+    def skip(self, frame_number):
+        now = time.perf_counter()
+        self.frames.append(frame_number)
+        self.times.append(now - self.last)
+        self.last = now
+
+
+class DeterministicProfiler:
+    """cProfile around a job, saved as a pstats file
+
+    Only the thread that starts it is profiled: the decode loop, analysis
+    and serial face blurring, not blur or segment workers.
+    """
+
+    name = 'cprofile'
+    extension = '.prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        self.profiler.dump_stats(path)
+
+    def hotspots(self, limit=15):
+        """Functions with the most time spent in their own code"""
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        return [{
+            'function': pstats.func_std_string(function),
+            'calls': calls,
+            'self_seconds': round(self_time, 4),
+            'cumulative_seconds': round(cumulative, 4)
+        } for function, (_, calls, self_time, cumulative, _) in rows]
+
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread, saved as speedscope JSON
+
+    A background thread records all stacks every `interval` seconds, so
+    blur worker threads are covered too and the job runs at close to full
+    speed. Open the file at https://www.speedscope.app.
+    """
+
+    name = 'sampling'
+    extension = '.speedscope.json'
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = {}  # thread name -> Counter of stacks, root first
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                name = names.get(ident, str(ident))
+                self.stacks.setdefault(name, Counter())[tuple(reversed(stack))] += 1
+
+    def save(self, path):
+        frames = []
+        index = {}
+        profiles = []
+        for name, stacks in self.stacks.items():
+            samples = []
+            weights = []
+            for stack, count in stacks.items():
+                for frame in stack:
+                    if frame not in index:
+                        index[frame] = len(frames)
+                        frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                samples.append([index[frame] for frame in stack])
+                weights.append(round(count * self.interval * 1000, 3))
+            profiles.append({
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round(sum(weights), 3),
+                'samples': samples,
+                'weights': weights
+            })
+
+        with open(path, 'w') as f:
+            json.dump({
+                '$schema': 'https://www.speedscope.app/file-format-schema.json',
+                'exporter': 'urbansight',
+                'name': os.path.basename(path),
+                'shared': {'frames': frames},
+                'profiles': profiles
+            }, f)
+
+    def hotspots(self, limit=15):
+        """Functions seen most often at the top of a stack"""
+        own = Counter()
+        total = Counter()
+        for stacks in self.stacks.values():
+            for stack, count in stacks.items():
+                own[stack[-1]] += count
+                for frame in set(stack):
+                    total[frame] += count
+        return [{
+            'function': f"{file}:{line}({name})",
+            'samples': count,
+            'self_seconds': round(count * self.interval, 4),
+            'cumulative_seconds': round(total[(name, file, line)] * self.interval, 4)
+        } for (name, file, line), count in own.most_common(limit)]
+
+
+PROFILERS = {cls.name: cls for cls in (DeterministicProfiler, SamplingProfiler)}
+
+
+def create_profiler(name):
+    if name not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {name}")
+    return PROFILERS[name]()
+
+
+def save_profile(job_id, profiler, timer, log=None):
+    """Write the profile and per-frame timings of a job
+
+    Returns the profile block for the analysis result, linking both files.
+    `log` is the job's DetectionLog, which adds the people count and
+    number of detected boxes to every analyzed frame.
+    """
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    profile_path = os.path.join(PROFILE_FOLDER, job_id + profiler.extension)
+    frames_path = os.path.join(PROFILE_FOLDER, job_id + '.frames.json')
+    profiler.save(profile_path)
+
+    detections = {}
+    if log is not None:
+        detections = {
+            int(frame): (int(people), int(boxes))
+            for frame, people, boxes in zip(log.frames, log.people, log.box_counts)
+        }
+
+    frames = []
+    for frame_number, seconds in zip(timer.frames, timer.times):
+        entry = {'frame': frame_number, 'ms': round(seconds * 1000, 3)}
+        if frame_number in detections:
+            entry['people'], entry['boxes'] = detections[frame_number]
+        frames.append(entry)
+
+    with open(frames_path, 'w') as f:
+        json.dump({'frames': frames}, f)
+
+    times = sorted(entry['ms'] for entry in frames)
+    return {
+        'profiler': profiler.name,
+        'artifact': '/' + profile_path.replace(os.sep, '/'),
+        'frames': '/' + frames_path.replace(os.sep, '/'),
+        'hotspots': profiler.hotspots(),
+        'frame_ms': {
+            'mean': round(sum(times) / len(times), 3),
+            'p50': times[len(times) // 2],
+            'p95': times[min(len(times) - 1, int(len(times) * 0.95))],
+            'max': times[-1]
+        } if times else {},
+        'slowest_frames': sorted(frames, key=lambda entry: entry['ms'], reverse=True)[:10]
+    }
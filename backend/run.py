@@ -2,15 +2,88 @@
 """
 UrbanSight - Quick Start Script
 Run this file to start the server with one command
+
+    python run.py                            development server
+    python run.py --production --workers 4   several web workers on one port
 """
 
 import os
 import sys
+import argparse
 import subprocess
 import webbrowser
 import time
 
+BUS_SOCKET = 'urbansight-bus.sock'
+
+def run_production(workers, port):
+    """Run several web worker processes sharing one port
+    
+    Workers exchange Socket.IO events through the message bus (Redis if
+    URBANSIGHT_MESSAGE_QUEUE is set, otherwise the UNIX socket broker in
+    bus.py) and share alerts, analyses and job state through the SQLite
+    store. Clients must connect over WebSocket, as the polling transport
+    needs every request of a session to reach the same worker.
+    """
+    from store import AlertStore
+    
+    env = dict(os.environ, URBANSIGHT_PRODUCTION='1', URBANSIGHT_PORT=str(port))
+    # Analysis processes and the CPUs of parallel jobs are split between
+    # the web workers
+    cpus = max(1, (os.cpu_count() or 2) // workers)
+    env.setdefault('URBANSIGHT_WORKERS', str(cpus))
+    env.setdefault('URBANSIGHT_CPUS', str(cpus))
+    
+    processes = []
+    if 'URBANSIGHT_MESSAGE_QUEUE' not in env:
+        socket_path = os.path.abspath(BUS_SOCKET)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        processes.append(subprocess.Popen([sys.executable, 'bus.py', socket_path]))
+        while not os.path.exists(socket_path):
+            if processes[0].poll() is not None:
+                print("❌ Error: message bus failed to start")
+                return
+            time.sleep(0.1)
+        env['URBANSIGHT_MESSAGE_QUEUE'] = f"unix://{socket_path}"
+    
+    # No worker is running yet, so unfinished jobs were cut off
+    store = AlertStore(env.get('URBANSIGHT_DB', 'urbansight.db'))
+    interrupted = store.fail_interrupted_jobs()
+    store.close()
+    if interrupted:
+        print(f"   Marked {interrupted} interrupted job(s) as failed")
+    
+    print(f"🚀 Starting {workers} UrbanSight web workers on port {port}...")
+    for worker_id in range(workers):
+        processes.append(subprocess.Popen(
+            [sys.executable, 'app.py'],
+            env=dict(env, URBANSIGHT_WORKER_ID=str(worker_id))
+        ))
+    
+    try:
+        # Stop everything as soon as one process exits
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("❌ A server process exited, shutting down")
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+
 def main():
+    parser = argparse.ArgumentParser(description='Start the UrbanSight server')
+    parser.add_argument('--production', action='store_true',
+                        help='run several web worker processes without the debugger')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='web worker processes in production mode')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    
     print("="*60)
     print("  UrbanSight AI Surveillance System")
     print("  IIT Roorkee Changeathon Project")
@@ -23,6 +96,10 @@ def main():
         print("   Please run this script from the backend directory.")
         return
     
+    if args.production:
+        run_production(max(1, args.workers), args.port)
+        return
+    
     # Install requirements if needed
     if not os.path.exists('venv'):
         print("📦 Setting up virtual environment...")
@@ -40,10 +117,12 @@ def main():
     print("   Dashboard will open automatically in 3 seconds...")
     print()
     
+    os.environ['URBANSIGHT_PORT'] = str(args.port)
+    
     # Open browser after delay
     def open_browser():
         time.sleep(3)
-        webbrowser.open('http://localhost:5000')
+        webbrowser.open(f'http://localhost:{args.port}')
         print("✅ Dashboard opened in browser")
     
     import threading
@@ -0,0 +1,110 @@
+import math
+
+
+class FrameSampler:
+    """Decides which frames of a video are worth analyzing
+
+    Frames are sampled on a time interval rather than a fixed frame count,
+    so a 15 fps and a 60 fps camera are analyzed at the same rate. In
+    adaptive mode the interval drops to `min_interval` while people are in
+    view and backs off towards `max_interval` during quiet periods.
+    """
+
+    DEFAULT_FPS = 25  # used when the container does not report a frame rate
+
+    def __init__(self, interval=0.2, adaptive=False, min_interval=0.1,
+                 max_interval=1.0, quiet_samples=3):
+        self.interval = interval
+        self.adaptive = adaptive
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.quiet_samples = quiet_samples
+        self.start(self.DEFAULT_FPS)
+
+    def start(self, fps):
+        """Reset for a new video"""
+        self.fps = fps if fps > 0 else self.DEFAULT_FPS
+        self.current_interval = self.interval
+        self.next_time = None
+        self.quiet_count = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Clear the counters without touching the sampling schedule"""
+        self.frames_seen = 0
+        self.frames_sampled = 0
+        self.dense_samples = 0
+        self.sparse_samples = 0
+
+    def max_stride(self):
+        """Largest gap between two samples, in frames"""
+        longest = self.max_interval if self.adaptive else self.interval
+        return int(math.ceil(longest * self.fps)) + 1
+
+    def _next_boundary(self, timestamp):
+        # Samples land on a grid of the current interval so fixed-interval
+        # sampling picks the same frames wherever decoding started
+        return (math.floor(timestamp / self.current_interval + 1e-9) + 1) * self.current_interval
+
+    def should_sample(self, frame_number):
+        """True if this frame should be decoded and analyzed"""
+        self.frames_seen += 1
+        timestamp = frame_number / self.fps
+
+        if self.next_time is None:
+            self.next_time = self._next_boundary((frame_number - 1) / self.fps)
+
+        return timestamp + 1e-9 >= self.next_time
+
+    def record(self, frame_number, active=None):
+        """Register a sampled frame and whether it showed any activity
+
+        Pass active=None when the detections are not known yet (batched
+        detection) and report them later with `observe`.
+        """
+        self.frames_sampled += 1
+
+        if self.adaptive:
+            if self.current_interval < self.interval:
+                self.dense_samples += 1
+            elif self.current_interval > self.interval:
+                self.sparse_samples += 1
+
+        if active is not None:
+            self.observe(active)
+
+        self.next_time = self._next_boundary(frame_number / self.fps)
+
+    def observe(self, active):
+        """Adapt the sampling interval to whether a sample showed activity"""
+        if not self.adaptive:
+            return
+
+        if active:
+            self.quiet_count = 0
+            self.current_interval = self.min_interval
+        else:
+            self.quiet_count += 1
+            if self.quiet_count >= self.quiet_samples:
+                self.current_interval = min(self.max_interval, self.current_interval * 2)
+
+    def stats(self):
+        """Sampling statistics for the analysis result"""
+        stats = {
+            'mode': 'adaptive' if self.adaptive else 'fixed',
+            'interval': self.interval,
+            'frames_seen': self.frames_seen,
+            'frames_sampled': self.frames_sampled,
+            'frames_skipped': self.frames_seen - self.frames_sampled,
+            'sample_rate': round(self.frames_sampled / self.frames_seen, 4) if self.frames_seen else 0
+        }
+
+        if self.adaptive:
+            stats.update({
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval,
+                'dense_samples': self.dense_samples,
+                'sparse_samples': self.sparse_samples
+            })
+
+        return stats
@@ -0,0 +1,429 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    video_id TEXT,
+    simulated INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp);
+CREATE INDEX IF NOT EXISTS idx_alerts_severity ON alerts (severity);
+CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts (type);
+CREATE INDEX IF NOT EXISTS idx_alerts_video_id ON alerts (video_id);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    result_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    result TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);
+
+CREATE TABLE IF NOT EXISTS cameras (
+    id TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    worker INTEGER PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    snapshot TEXT NOT NULL
+);
+"""
+
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+ALERT_COLUMNS = ('id', 'type', 'message', 'timestamp', 'severity', 'video_id', 'camera_id', 'simulated',
+                 'revision')
+
+
+class AlertStore:
+    """SQLite storage for alerts, analysis results, jobs, cameras and metrics
+
+    The database runs in WAL mode so readers never wait for the writer.
+    Alerts are indexed on timestamp, severity, type and video_id, and
+    recent alerts are read from the primary key, so queries stay fast no
+    matter how many alerts have been recorded. Nothing is kept in memory
+    between requests, so several web worker processes can share one
+    database.
+    """
+
+    def __init__(self, path='urbansight.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.alert_listeners = []
+        self.analysis_listeners = []
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns missing from databases created by older versions"""
+        columns = {row['name'] for row in self.db.execute('PRAGMA table_info(alerts)')}
+        if 'camera_id' not in columns:
+            with self.db:
+                self.db.execute('ALTER TABLE alerts ADD COLUMN camera_id TEXT')
+        if 'revision' not in columns:
+            with self.db:
+                self.db.execute('ALTER TABLE alerts ADD COLUMN revision INTEGER')
+        self.db.execute('CREATE INDEX IF NOT EXISTS idx_alerts_camera_id ON alerts (camera_id)')
+        columns = {row['name'] for row in self.db.execute('PRAGMA table_info(analyses)')}
+        if 'cache_key' not in columns:
+            with self.db:
+                self.db.execute('ALTER TABLE analyses ADD COLUMN cache_key TEXT')
+        self.db.execute('CREATE INDEX IF NOT EXISTS idx_analyses_cache_key ON analyses (cache_key)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS idx_alerts_revision ON alerts (revision)')
+
+    def subscribe(self, on_alerts=None, on_analysis=None):
+        """Register callbacks for newly stored alerts and analyses
+
+        on_alerts receives the list of stored alerts, on_analysis the
+        result_id of an analysis stored for the first time.
+        """
+        if on_alerts:
+            self.alert_listeners.append(on_alerts)
+        if on_analysis:
+            self.analysis_listeners.append(on_analysis)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def data_version(self):
+        """Changes whenever another connection commits to the database"""
+        with self.lock:
+            return self.db.execute('PRAGMA data_version').fetchone()[0]
+
+    def _alert(self, row):
+        alert = {key: row[key] for key in ALERT_COLUMNS if row[key] is not None}
+        if 'simulated' in alert:
+            alert['simulated'] = bool(alert['simulated'])
+        return alert
+
+    # Alerts
+
+    def add_alerts(self, alerts):
+        """Insert alerts in one transaction, filling in their ids"""
+        with self.lock, self.db:
+            for alert in alerts:
+                alert.setdefault('timestamp', datetime.now().isoformat())
+                cursor = self.db.execute(
+                    'INSERT INTO alerts (type, message, timestamp, severity, video_id, camera_id, simulated) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        alert.get('type', 'unknown'),
+                        alert.get('message', ''),
+                        alert['timestamp'],
+                        alert.get('severity', 'medium'),
+                        alert.get('video_id'),
+                        alert.get('camera_id'),
+                        int(alert['simulated']) if 'simulated' in alert else None
+                    )
+                )
+                alert['id'] = cursor.lastrowid
+
+        for listener in self.alert_listeners:
+            listener(alerts)
+        return alerts
+
+    def add_alert(self, alert):
+        return self.add_alerts([alert])[0]
+
+    def update_alert_messages(self, alerts):
+        """Replace the message of stored alerts, each a dict with id and message
+
+        The alerts get a new revision, higher than that of any alert changed
+        before, and alert listeners receive their updated records.
+        """
+        if not alerts:
+            return []
+        ids = [alert['id'] for alert in alerts]
+        with self.lock, self.db:
+            revision = (self.db.execute('SELECT MAX(revision) FROM alerts').fetchone()[0] or 0) + 1
+            self.db.executemany(
+                'UPDATE alerts SET message = ?, revision = ? WHERE id = ?',
+                [(alert['message'], revision, alert['id']) for alert in alerts]
+            )
+            rows = self.db.execute(
+                f"SELECT * FROM alerts WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id", ids
+            ).fetchall()
+        updated = [self._alert(row) for row in rows]
+
+        for listener in self.alert_listeners:
+            listener(updated)
+        return updated
+
+    def recent_alerts(self, limit=10):
+        """Most recent alerts first"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT * FROM alerts ORDER BY id DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [self._alert(row) for row in rows]
+
+    def query_alerts(self, limit=10, before_id=None, after_id=None, alert_type=None,
+                     severity=None, video_id=None, camera_id=None, start=None, end=None):
+        """Alerts matching the filters, most recent first
+
+        Pages back through history with `before_id`. With `after_id` only
+        alerts newer than that id are returned, the `limit` oldest of them,
+        so a client can catch up page by page without gaps. `start` and
+        `end` bound the ISO timestamp (inclusive and exclusive). Returns
+        (alerts, has_more).
+        """
+        conditions = []
+        params = []
+        for condition, value in (
+            ('id < ?', before_id),
+            ('id > ?', after_id),
+            ('type = ?', alert_type),
+            ('severity = ?', severity),
+            ('video_id = ?', video_id),
+            ('camera_id = ?', camera_id),
+            ('timestamp >= ?', start),
+            ('timestamp < ?', end)
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'ASC' if after_id is not None else 'DESC'
+
+        # One extra row tells whether there is another page
+        with self.lock:
+            rows = self.db.execute(
+                f'SELECT * FROM alerts {where} ORDER BY id {order} LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+
+        has_more = len(rows) > limit
+        alerts = [self._alert(row) for row in rows[:limit]]
+        if after_id is not None:
+            alerts.reverse()
+        return alerts, has_more
+
+    def last_alert_id(self):
+        with self.lock:
+            return self.db.execute('SELECT MAX(id) FROM alerts').fetchone()[0] or 0
+
+    def last_alert_revision(self):
+        """Revision of the most recently changed alert, 0 if none were"""
+        with self.lock:
+            return self.db.execute('SELECT MAX(revision) FROM alerts').fetchone()[0] or 0
+
+    def count_alerts(self, since=None):
+        """Number of alerts, optionally only those at or after an ISO timestamp"""
+        with self.lock:
+            if since is None:
+                return self.db.execute('SELECT COUNT(*) FROM alerts').fetchone()[0]
+            return self.db.execute(
+                'SELECT COUNT(*) FROM alerts WHERE timestamp >= ?', (since,)
+            ).fetchone()[0]
+
+    def count_by(self, column):
+        """Alert counts grouped by severity or type"""
+        if column not in ('severity', 'type'):
+            raise ValueError(f"Cannot group alerts by {column}")
+
+        with self.lock:
+            rows = self.db.execute(
+                f'SELECT {column}, COUNT(*) FROM alerts GROUP BY {column}'
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def count_by_day(self, since):
+        """Alert counts per calendar day (YYYY-MM-DD) from a date on"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT substr(timestamp, 1, 10) AS day, COUNT(*) FROM alerts '
+                'WHERE timestamp >= ? GROUP BY day', (since,)
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    # Analyses
+
+    def save_analysis(self, result_id, result, cache_key=None):
+        """Insert or update an analysis, `cache_key` names the cache entry
+        that owns its processed video"""
+        with self.lock, self.db:
+            created = self.db.execute(
+                'SELECT 1 FROM analyses WHERE result_id = ?', (result_id,)
+            ).fetchone() is None
+            # An upsert keeps the rowid of a re-saved analysis, so rowids
+            # only grow with new analyses (see analyses_after)
+            self.db.execute(
+                'INSERT INTO analyses (result_id, created_at, result, cache_key) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (result_id) DO UPDATE SET result = excluded.result, '
+                'cache_key = COALESCE(excluded.cache_key, cache_key)',
+                (result_id, datetime.now().isoformat(), json.dumps(result, default=str), cache_key)
+            )
+
+        if created:
+            for listener in self.analysis_listeners:
+                listener(result_id)
+
+    def get_analysis(self, result_id):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT result FROM analyses WHERE result_id = ?', (result_id,)
+            ).fetchone()
+        return json.loads(row['result']) if row else None
+
+    def expire_processed_videos(self, cache_key):
+        """Unlink the processed video of analyses whose cache entry is gone
+
+        Their result keeps `processed_video_expired` instead of a dead link.
+        Returns the number of analyses changed.
+        """
+        with self.lock, self.db:
+            rows = self.db.execute(
+                'SELECT result_id, result FROM analyses WHERE cache_key = ?', (cache_key,)
+            ).fetchall()
+            for row in rows:
+                result = json.loads(row['result'])
+                if result.pop('processed_video', None):
+                    result['processed_video_expired'] = True
+                self.db.execute(
+                    'UPDATE analyses SET result = ?, cache_key = NULL WHERE result_id = ?',
+                    (json.dumps(result, default=str), row['result_id'])
+                )
+        return len(rows)
+
+    def analyses_after(self, rowid=0):
+        """(count, last rowid) of analyses stored after a rowid"""
+        with self.lock:
+            count, last = self.db.execute(
+                'SELECT COUNT(*), MAX(rowid) FROM analyses WHERE rowid > ?', (rowid,)
+            ).fetchone()
+        return count, last or rowid
+
+    # Jobs
+
+    def save_job(self, job):
+        """Insert or update a job record"""
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO jobs (id, status, created_at, record) VALUES (?, ?, ?, ?)',
+                (job['id'], job['status'], job['created_at'], json.dumps(job, default=str))
+            )
+
+    def get_job(self, job_id):
+        with self.lock:
+            row = self.db.execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row['record']) if row else None
+
+    def list_jobs(self, limit=100):
+        """Most recent jobs, oldest first"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT record FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [json.loads(row['record']) for row in reversed(rows)]
+
+    def active_jobs(self):
+        """Jobs queued or running in any process"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT record FROM jobs WHERE status IN (?, ?) ORDER BY created_at',
+                ACTIVE_JOB_STATUSES
+            ).fetchall()
+        return [json.loads(row['record']) for row in rows]
+
+    def count_jobs(self):
+        """Number of queued and running jobs in any process, by status"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status',
+                ACTIVE_JOB_STATUSES
+            ).fetchall()
+        counts = dict.fromkeys(ACTIVE_JOB_STATUSES, 0)
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def fail_interrupted_jobs(self):
+        """Mark jobs left queued or running by a stopped server as failed
+
+        Only call this while no web worker is running.
+        """
+        interrupted = self.active_jobs()
+        for job in interrupted:
+            job.update(status='failed', stage='failed', error='Server stopped before the job finished')
+            self.save_job(job)
+        return len(interrupted)
+
+    # Cameras
+
+    def save_camera(self, config):
+        """Insert or update the configuration of a camera, keeping its status"""
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT INTO cameras (id, config) VALUES (?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET config = excluded.config',
+                (config['id'], json.dumps(config))
+            )
+
+    def delete_camera(self, camera_id):
+        """Remove a camera, returns False if there was none"""
+        with self.lock, self.db:
+            cursor = self.db.execute('DELETE FROM cameras WHERE id = ?', (camera_id,))
+        return cursor.rowcount > 0
+
+    def list_cameras(self):
+        """Camera configurations, each with the last status its worker saved"""
+        with self.lock:
+            rows = self.db.execute('SELECT config, status FROM cameras ORDER BY id').fetchall()
+        return [
+            dict(json.loads(row['config']), status=json.loads(row['status']) if row['status'] else None)
+            for row in rows
+        ]
+
+    def save_camera_statuses(self, statuses):
+        """Update the status of running cameras, {camera id: status}
+
+        Cameras deleted in the meantime stay deleted.
+        """
+        with self.lock, self.db:
+            self.db.executemany(
+                'UPDATE cameras SET status = ? WHERE id = ?',
+                [(json.dumps(status), camera_id) for camera_id, status in statuses.items()]
+            )
+
+    # Metrics
+
+    def save_metrics(self, worker, snapshot):
+        """Replace the metrics snapshot of a web worker"""
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO metrics (worker, updated_at, snapshot) VALUES (?, ?, ?)',
+                (worker, time.time(), json.dumps(snapshot))
+            )
+
+    def load_metrics(self, exclude=None, max_age=60):
+        """Metrics snapshots of web workers saved in the last max_age seconds"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT worker, snapshot FROM metrics WHERE updated_at >= ?',
+                (time.time() - max_age,)
+            ).fetchall()
+        return [json.loads(row['snapshot']) for row in rows if row['worker'] != exclude]
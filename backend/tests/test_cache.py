@@ -0,0 +1,39 @@
+import os
+
+from cache import ResultCache
+
+
+def write_output(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return str(path)
+
+
+def test_evicted_entries_are_reported_to_listeners(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=3000)
+    removed = []
+    cache.subscribe(removed.append)
+
+    first = write_output(tmp_path / 'first.mp4', 2000)
+    cache.put('first', {'summary': {}}, [first])
+    second = write_output(tmp_path / 'second.mp4', 2000)
+    cache.put('second', {'summary': {}}, [second])
+
+    # The least recently used entry goes, together with its output
+    assert removed == ['first']
+    assert not os.path.exists(first)
+    assert cache.get('first') is None
+    assert cache.get('second') == {'summary': {}}
+
+
+def test_entry_with_missing_output_is_removed_on_get(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    removed = []
+    cache.subscribe(removed.append)
+
+    output = write_output(tmp_path / 'video.mp4', 100)
+    cache.put('key', {'summary': {}}, [output])
+    os.remove(output)
+
+    assert cache.get('key') is None
+    assert removed == ['key']
@@ -0,0 +1,173 @@
+from events import EventEngine, EventRule
+
+FPS = 10  # one frame per 0.1 s
+
+
+def crowd_engine(live=False, **options):
+    settings = dict(enter=8, exit=5, min_duration=0.5, cooldown=2.0)
+    settings.update(options)
+    return EventEngine([EventRule('crowd', **settings)], FPS, live=live)
+
+
+def feed(engine, values, first_frame=1, step=1):
+    """Run one crowd value per sample, return all alerts and finish()'s"""
+    alerts = []
+    frame = first_frame
+    for value in values:
+        alerts.extend(engine.update(frame, {'crowd': value}))
+        frame += step
+    return alerts, engine.finish()
+
+
+def test_incident_starts_above_enter_and_lasts_until_below_exit():
+    engine = crowd_engine(min_duration=0.0, cooldown=0.0)
+    # 6 and 7 are between exit and enter: they cannot start an incident
+    # but keep one going
+    alerts, remaining = feed(engine, [6, 7, 9, 7, 6, 6, 4, 0, 0])
+
+    assert remaining == []
+    assert len(alerts) == 1
+    alert = alerts[0]
+    assert alert['frame'] == 3
+    assert alert['end_frame'] == 6
+    assert alert['samples'] == 4
+    assert alert['peak'] == 9
+    assert alert['peak_frame'] == 3
+
+
+def test_value_at_enter_threshold_does_not_start_an_incident():
+    engine = crowd_engine()
+    alerts, remaining = feed(engine, [8] * 20)
+    assert alerts == [] and remaining == []
+    assert engine.stats()['triggered_samples'] == 0
+
+
+def test_restart_within_cooldown_is_merged():
+    engine = crowd_engine(cooldown=2.0)
+    # Above for 1 s, gone for 1 s, back for 1 s
+    alerts, remaining = feed(engine, [10] * 10 + [0] * 10 + [10] * 10)
+
+    assert alerts == []
+    assert len(remaining) == 1
+    alert = remaining[0]
+    assert alert['frame'] == 1
+    assert alert['end_frame'] == 30
+    assert alert['samples'] == 20
+    assert engine.stats()['incidents'] == 1
+
+
+def test_restart_after_cooldown_is_a_new_incident():
+    engine = crowd_engine(cooldown=0.5)
+    alerts, remaining = feed(engine, [10] * 10 + [0] * 10 + [10] * 10)
+
+    # The first incident is reported once its cooldown has passed
+    assert [alert['frame'] for alert in alerts] == [1]
+    assert [alert['frame'] for alert in remaining] == [21]
+    assert engine.stats()['incidents'] == 2
+
+
+def test_short_incident_is_dropped():
+    engine = crowd_engine(min_duration=0.5, cooldown=0.0)
+    # 0.3 s above the threshold
+    alerts, remaining = feed(engine, [0, 10, 10, 10, 10, 0, 0, 0])
+
+    assert alerts == [] and remaining == []
+    assert engine.stats() == {'triggered_samples': 4, 'incidents': 0, 'suppressed': 1}
+
+
+def test_finish_closes_active_and_ending_incidents():
+    engine = EventEngine([
+        EventRule('crowd', enter=8, exit=5, cooldown=5.0),
+        EventRule('violence', enter=100, cooldown=5.0)
+    ], FPS)
+    alerts = []
+    for frame in range(1, 21):
+        signals = {
+            'crowd': 10,  # still above at the end
+            'violence': 200 if frame <= 5 else 0  # over, waiting out its cooldown
+        }
+        alerts.extend(engine.update(frame, signals))
+
+    assert alerts == []
+    remaining = engine.finish()
+    assert sorted((alert['type'], alert['frame'], alert['end_frame']) for alert in remaining) == [
+        ('crowd', 1, 20),
+        ('violence', 1, 5)
+    ]
+    # Nothing is reported twice
+    assert engine.finish() == []
+
+
+def test_alert_fields():
+    rule = EventRule(
+        'crowd', enter=8, exit=5,
+        describe=lambda incident: (f"Peak of {incident.peak}", 'high')
+    )
+    engine = EventEngine([rule], 25)
+    alerts = []
+    for frame, value in ((50, 9), (55, 12), (60, 10), (65, 0)):
+        alerts.extend(engine.update(frame, {'crowd': value}))
+    assert engine.finish() == []
+    alert, = alerts
+
+    assert alert == {
+        'type': 'crowd',
+        'message': 'Peak of 12',
+        'severity': 'high',
+        'frame': 50,
+        'timestamp': 2.0,
+        'end_frame': 60,
+        'end_timestamp': 2.4,
+        'duration': 0.4,
+        'peak': 12,
+        'peak_frame': 55,
+        'samples': 3
+    }
+
+
+def test_zero_fps_falls_back_to_default():
+    engine = EventEngine([EventRule('crowd', enter=8)], 0)
+    engine.update(30, {'crowd': 10})
+    alert, = engine.finish()
+    assert alert['timestamp'] == 30 / engine.fps
+    assert engine.fps > 0
+
+
+def test_live_engine_alerts_once_min_duration_has_passed():
+    engine = crowd_engine(min_duration=0.5, live=True)
+    alerts = []
+    for frame in range(1, 6001):  # a crowd that stays for 10 minutes
+        alerts.extend(engine.update(frame, {'crowd': 12}))
+
+    started, = alerts
+    assert started['status'] == 'started'
+    assert started['frame'] == 1
+    assert started['end_frame'] == 6  # the first sample 0.5 s in
+
+
+def test_live_engine_reports_the_end_of_a_started_incident():
+    engine = crowd_engine(min_duration=0.5, cooldown=1.0, live=True)
+    alerts, remaining = feed(engine, [12] * 20 + [0] * 20)
+
+    assert [alert['status'] for alert in alerts] == ['started', 'ended']
+    ended = alerts[1]
+    assert ended['frame'] == 1
+    assert ended['end_frame'] == 20
+    assert remaining == []
+    assert engine.stats()['incidents'] == 1
+
+
+def test_live_engine_merges_restarts_without_a_second_start():
+    engine = crowd_engine(min_duration=0.5, cooldown=2.0, live=True)
+    alerts, remaining = feed(engine, [12] * 10 + [0] * 10 + [12] * 10)
+
+    assert [alert['status'] for alert in alerts] == ['started']
+    assert [(alert['status'], alert['end_frame']) for alert in remaining] == [('ended', 30)]
+
+
+def test_live_engine_drops_short_incidents():
+    engine = crowd_engine(min_duration=0.5, cooldown=0.0, live=True)
+    alerts, remaining = feed(engine, [0, 12, 12, 0, 0, 0])
+
+    assert alerts == [] and remaining == []
+    assert engine.stats()['suppressed'] == 1
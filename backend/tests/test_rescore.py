@@ -0,0 +1,48 @@
+from detections import DetectionLog
+from detector import VideoAnalyzer
+
+FPS = 10
+
+
+def crowd_log(people_counts):
+    """One sample per second with the given people counts, no movement"""
+    log = DetectionLog(fps=FPS, total_frames=len(people_counts) * FPS)
+    for second, people in enumerate(people_counts):
+        log.add(second * FPS, [], people, {})
+    return log
+
+
+def crowd_alerts(result):
+    return [alert for alert in result['alerts'] if alert['type'] == 'crowd']
+
+
+def test_crowd_threshold_sets_severity_of_the_same_incidents():
+    analyzer = VideoAnalyzer()
+    log = crowd_log([0] * 5 + [10] * 10 + [0] * 5)
+
+    large = crowd_alerts(analyzer.rescore(log))
+    moderate = crowd_alerts(analyzer.rescore(log, crowd_threshold=12))
+
+    assert len(large) == len(moderate) == 1
+    assert large[0]['severity'] == 'medium'
+    assert moderate[0]['severity'] == 'low'
+
+
+def test_rescore_can_move_the_threshold_that_opens_incidents():
+    analyzer = VideoAnalyzer()
+    log = crowd_log([0] * 5 + [4] * 10 + [0] * 5)
+
+    assert crowd_alerts(analyzer.rescore(log)) == []
+    assert len(crowd_alerts(analyzer.rescore(log, moderate_crowd_threshold=3))) == 1
+    # A crowd threshold below the moderate one opens incidents too
+    assert len(crowd_alerts(analyzer.rescore(log, crowd_threshold=3))) == 1
+
+
+def test_raising_both_crowd_thresholds_drops_incidents():
+    analyzer = VideoAnalyzer()
+    log = crowd_log([0] * 5 + [10] * 10 + [0] * 5)
+
+    result = analyzer.rescore(log, moderate_crowd_threshold=12, crowd_threshold=15)
+
+    assert result['thresholds'] == {'crowd': 15, 'moderate_crowd': 12, 'violence': 250}
+    assert crowd_alerts(result) == []
@@ -0,0 +1,64 @@
+from aggregates import AlertAggregates
+from store import AlertStore
+
+
+def test_updated_alert_gets_a_revision_and_is_published(tmp_path):
+    store = AlertStore(str(tmp_path / 'alerts.db'))
+    published = []
+    store.subscribe(on_alerts=published.append)
+
+    first, second = store.add_alerts([
+        {'type': 'crowd', 'message': 'Crowd started', 'camera_id': 'plaza'},
+        {'type': 'violence', 'message': 'Movement started', 'camera_id': 'plaza'}
+    ])
+    assert store.last_alert_revision() == 0
+
+    updated = store.update_alert_messages([{'id': first['id'], 'message': 'Crowd ended'}])
+
+    assert [alert['message'] for alert in updated] == ['Crowd ended']
+    assert updated[0]['revision'] == 1
+    assert published[-1] == updated
+    unchanged, _ = store.query_alerts(after_id=first['id'])
+    assert 'revision' not in unchanged[0]
+    assert store.last_alert_revision() == 1
+
+    store.update_alert_messages([{'id': second['id'], 'message': 'Movement ended'}])
+    assert store.last_alert_revision() == 2
+    store.close()
+
+
+def test_aggregates_follow_alert_revisions(tmp_path):
+    store = AlertStore(str(tmp_path / 'alerts.db'))
+    aggregates = AlertAggregates()
+    aggregates.rebuild(store)
+    store.subscribe(on_alerts=aggregates.invalidate)
+
+    alert = store.add_alert({'type': 'crowd', 'message': 'Crowd started'})
+    aggregates.sync(store)
+    assert (aggregates.last_id, aggregates.last_revision, aggregates.total) == (alert['id'], 0, 1)
+
+    store.update_alert_messages([{'id': alert['id'], 'message': 'Crowd ended'}])
+    aggregates.sync(store)
+    # An update changes the revision but is not a new alert
+    assert (aggregates.last_id, aggregates.last_revision, aggregates.total) == (alert['id'], 1, 1)
+    store.close()
+
+
+def test_expired_cache_entry_unlinks_processed_videos(tmp_path):
+    store = AlertStore(str(tmp_path / 'alerts.db'))
+    video = {'summary': {}, 'processed_video': '/static/processed/blurred_abc.mp4'}
+    store.save_analysis('first', dict(video), cache_key='abc')
+    store.save_analysis('repeat', dict(video), cache_key='abc')
+    store.save_analysis('other', dict(video), cache_key='def')
+    # Re-saving without a key keeps the analysis linked to its entry
+    store.save_analysis('first', dict(video))
+
+    assert store.expire_processed_videos('abc') == 2
+
+    for result_id in ('first', 'repeat'):
+        result = store.get_analysis(result_id)
+        assert 'processed_video' not in result
+        assert result['processed_video_expired'] is True
+    assert store.get_analysis('other')['processed_video'] == video['processed_video']
+    assert store.expire_processed_videos('abc') == 0
+    store.close()
@@ -0,0 +1,56 @@
+import numpy as np
+
+from tracker import MultiObjectTracker
+
+
+def walk(tracker, boxes_per_frame, fps=10):
+    """Update the tracker once per frame, return the ids of every frame"""
+    return [
+        list(tracker.update(boxes, frame / fps)[0])
+        for frame, boxes in enumerate(boxes_per_frame)
+    ]
+
+
+def test_single_person_keeps_one_id():
+    tracker = MultiObjectTracker()
+    frames = [[[100 + 5 * step, 50, 40, 100]] for step in range(6)]
+
+    ids = walk(tracker, frames)
+
+    assert ids == [[1]] * 6
+    assert list(tracker.ids) == [1]
+
+
+def test_velocity_is_reliable_after_two_matches():
+    tracker = MultiObjectTracker()
+    reliable = []
+    for step in range(4):
+        _, velocities, matched = tracker.update([[100 + 5 * step, 50, 40, 100]], step / 10)
+        reliable.append(bool(matched[0]))
+
+    assert reliable == [False, False, True, True]
+    # 5 px per 0.1 s
+    assert np.allclose(velocities[0], [50, 0])
+
+
+def test_two_people_keep_their_ids():
+    tracker = MultiObjectTracker()
+    frames = [
+        [[100 + 5 * step, 50, 40, 100], [400 - 5 * step, 60, 40, 100]]
+        for step in range(5)
+    ]
+
+    ids = walk(tracker, frames)
+
+    assert ids == [[1, 2]] * 5
+    assert sorted(tracker.ids) == [1, 2]
+
+
+def test_detection_too_far_for_elapsed_time_starts_a_new_track():
+    tracker = MultiObjectTracker()
+    tracker.update([[100, 50, 40, 100]], 0.0)
+    # 120 px (1.2 box heights) in 0.1 s is far faster than max_speed
+    ids, _, matched = tracker.update([[220, 50, 40, 100]], 0.1)
+
+    assert list(ids) == [2]
+    assert not matched[0]
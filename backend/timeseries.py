@@ -0,0 +1,160 @@
+import math
+import sqlite3
+import threading
+import time
+
+# Bucket width in seconds and number of buckets kept per series: an hour
+# of seconds, a day of minutes, 30 days of hours and a year of days
+RESOLUTIONS = {
+    'second': (1, 3600),
+    'minute': (60, 1440),
+    'hour': (3600, 720),
+    'day': (86400, 366)
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series_buckets (
+    series TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    start REAL NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (series, resolution, slot)
+);
+"""
+
+# Adds a bucket's samples to the row in its slot, or replaces the row if
+# it holds an older bucket that has wrapped around. SQLite evaluates every
+# SET expression against the old row.
+UPSERT = """
+INSERT INTO series_buckets (series, resolution, slot, start, count, sum, min, max)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (series, resolution, slot) DO UPDATE SET
+    count = CASE WHEN start = excluded.start THEN count + excluded.count ELSE excluded.count END,
+    sum = CASE WHEN start = excluded.start THEN sum + excluded.sum ELSE excluded.sum END,
+    min = CASE WHEN start = excluded.start THEN MIN(min, excluded.min) ELSE excluded.min END,
+    max = CASE WHEN start = excluded.start THEN MAX(max, excluded.max) ELSE excluded.max END,
+    start = excluded.start
+WHERE excluded.start >= start
+"""
+
+
+class TimeSeriesStore:
+    """Sampled values such as people counts, rolled up per second, minute,
+    hour and day
+
+    Every series keeps a fixed ring of buckets per resolution (see
+    RESOLUTIONS) with the count, sum, min and max of the samples that fell
+    in them; a bucket overwrites the one a full ring earlier. Storage per
+    series is therefore bounded no matter how long samples are recorded,
+    and a query reads at most one ring, picking the finest resolution
+    that covers the window in `max_points` buckets or fewer.
+
+    Timestamps are seconds: Unix time for live series, seconds into the
+    video for the series of an analysis. Buckets live in SQLite next to
+    the alerts so every web worker answers charts from the same data.
+    """
+
+    def __init__(self, path='urbansight.db'):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def add(self, samples):
+        """Record (series, timestamp, value) samples in one transaction"""
+        # Roll samples up in memory first, one row write per bucket
+        buckets = {}
+        for series, timestamp, value in samples:
+            value = float(value)
+            for width, slots in RESOLUTIONS.values():
+                index = math.floor(timestamp / width)
+                key = (series, width, index % slots, index * width)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = [1, value, value, value]
+                else:
+                    bucket[0] += 1
+                    bucket[1] += value
+                    bucket[2] = min(bucket[2], value)
+                    bucket[3] = max(bucket[3], value)
+
+        if not buckets:
+            return
+        with self.lock, self.db:
+            self.db.executemany(UPSERT, [key + tuple(bucket) for key, bucket in buckets.items()])
+
+    def delete(self, series):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM series_buckets WHERE series = ?', (series,))
+
+    def pick_resolution(self, start, end, max_points=60, now=None):
+        """Finest resolution name covering [start, end) in max_points buckets
+
+        `now` is the newest timestamp of the series; buckets older than a
+        full ring before it have been overwritten.
+        """
+        now = end if now is None else now
+        for name, (width, slots) in RESOLUTIONS.items():
+            if (end - start) / width > max_points:
+                continue
+            if now - start > width * slots:
+                continue
+            return name
+        return 'day'
+
+    def query(self, series, start, end, resolution=None, max_points=60, now=None):
+        """Buckets of a series between start and end, oldest first
+
+        Returns (resolution, points); every bucket in the window is listed,
+        empty ones with a count of 0 and None values.
+        """
+        resolution = resolution or self.pick_resolution(start, end, max_points, now)
+        width, slots = RESOLUTIONS[resolution]
+        first = math.floor(start / width) * width
+        # Never more points than the ring holds
+        first = max(first, math.floor(end / width) * width - (slots - 1) * width)
+
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT start, count, sum, min, max FROM series_buckets '
+                'WHERE series = ? AND resolution = ? AND start >= ? AND start < ?',
+                (series, width, first, end)
+            ).fetchall()
+        found = {row[0]: row for row in rows}
+
+        points = []
+        bucket = first
+        while bucket < end:
+            row = found.get(bucket)
+            if row is None:
+                points.append({'time': bucket, 'count': 0, 'mean': None, 'min': None, 'max': None})
+            else:
+                _, count, total, low, high = row
+                points.append({
+                    'time': bucket,
+                    'count': count,
+                    'mean': round(total / count, 2),
+                    'min': low,
+                    'max': high
+                })
+            bucket += width
+        return resolution, points
+
+    def recent(self, series, seconds, max_points=60):
+        """Buckets of a live series over the last `seconds`, ending with
+        the bucket that holds the current time
+        """
+        now = time.time()
+        resolution = self.pick_resolution(now - seconds, now, max_points, now)
+        width, _ = RESOLUTIONS[resolution]
+        end = (math.floor(now / width) + 1) * width
+        return self.query(series, end - seconds, end, resolution=resolution)
@@ -0,0 +1,175 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy comes with ultralytics but is not required
+    linear_sum_assignment = None
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) and (M, 4) arrays of x, y, w, h boxes"""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+
+    left = np.maximum(a[..., 0], b[..., 0])
+    top = np.maximum(a[..., 1], b[..., 1])
+    right = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    bottom = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def greedy_assignment(cost):
+    """Cheapest-first matching, used when scipy is not available"""
+    rows, cols = [], []
+    if cost.size == 0:
+        return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+    order = np.argsort(cost, axis=None)
+    used_rows = np.zeros(cost.shape[0], dtype=bool)
+    used_cols = np.zeros(cost.shape[1], dtype=bool)
+
+    for flat in order:
+        row, col = divmod(int(flat), cost.shape[1])
+        if used_rows[row] or used_cols[col]:
+            continue
+        used_rows[row] = used_cols[col] = True
+        rows.append(row)
+        cols.append(col)
+        if used_rows.all() or used_cols.all():
+            break
+
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+
+class MultiObjectTracker:
+    """Associates detections across frames and keeps persistent track ids
+
+    Tracks and detections are matched by linear assignment on a cost that
+    mixes box overlap (1 - IoU) with centroid distance relative to the
+    box size. Pairs that do not overlap are only matched if a person
+    moving at `max_speed` box heights per second could have covered the
+    distance since the track was last seen, and never beyond
+    `max_distance` box heights. Tracks that go unmatched for more than
+    `max_age` updates are dropped.
+
+    Velocities are averaged over consecutive matches, and only reported
+    as reliable once a track has been matched twice, so a single bad
+    match cannot produce a speed spike on its own.
+    """
+
+    def __init__(self, max_age=3, max_distance=1.5, distance_weight=0.5, max_speed=3.0,
+                 smoothing=0.5):
+        self.max_age = max_age
+        self.max_distance = max_distance  # in box heights
+        self.distance_weight = distance_weight
+        self.max_speed = max_speed  # box heights per second, a fast run
+        self.smoothing = smoothing  # weight of the newest velocity
+        self.reset()
+
+    def reset(self):
+        self.ids = np.zeros(0, dtype=int)
+        self.boxes = np.zeros((0, 4), dtype=float)
+        self.velocities = np.zeros((0, 2), dtype=float)  # px/s
+        self.last_seen = np.zeros(0, dtype=float)
+        self.misses = np.zeros(0, dtype=int)
+        self.hits = np.zeros(0, dtype=int)
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cost(self, boxes, timestamp):
+        overlap = iou_matrix(self.boxes, boxes)
+
+        centers_t = self.boxes[:, :2] + self.boxes[:, 2:] / 2
+        centers_d = boxes[:, :2] + boxes[:, 2:] / 2
+        distance = np.linalg.norm(centers_t[:, None, :] - centers_d[None, :, :], axis=2)
+        scale = np.maximum(self.boxes[:, 3:4], 1.0)
+        distance = distance / scale
+
+        elapsed = np.maximum(timestamp - self.last_seen, 0.0)[:, None]
+        reach = np.minimum(self.max_distance, self.max_speed * elapsed)
+
+        cost = (1.0 - overlap) + self.distance_weight * distance
+        cost[(overlap <= 0) & (distance > reach)] = np.inf
+        return cost
+
+    def update(self, boxes, timestamp):
+        """Match detections to tracks
+
+        Returns (track_ids, velocities, matched): the track id of every
+        detection, its velocity in px/s and whether that velocity is
+        reliable, which takes a track matched at least twice (new tracks
+        have zero velocity).
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        count = len(boxes)
+
+        track_ids = np.zeros(count, dtype=int)
+        velocities = np.zeros((count, 2), dtype=float)
+        matched = np.zeros(count, dtype=bool)
+        assigned = np.zeros(count, dtype=bool)
+
+        rows = cols = np.zeros(0, dtype=int)
+        if len(self.ids) and count:
+            cost = self._cost(boxes, timestamp)
+            finite = np.isfinite(cost)
+            if finite.any():
+                solvable = np.where(finite, cost, 1e6)
+                if linear_sum_assignment is not None:
+                    rows, cols = linear_sum_assignment(solvable)
+                else:
+                    rows, cols = greedy_assignment(solvable)
+                keep = finite[rows, cols]
+                rows, cols = rows[keep], cols[keep]
+
+        # Continue matched tracks
+        if len(rows):
+            dt = np.maximum(timestamp - self.last_seen[rows], 1e-6)[:, None]
+            old_centers = self.boxes[rows, :2] + self.boxes[rows, 2:] / 2
+            new_centers = boxes[cols, :2] + boxes[cols, 2:] / 2
+            velocity = (new_centers - old_centers) / dt
+            # The first match of a track sets its velocity, later ones average in
+            first = (self.hits[rows] < 2)[:, None]
+            smoothed = self.smoothing * velocity + (1 - self.smoothing) * self.velocities[rows]
+            self.velocities[rows] = np.where(first, velocity, smoothed)
+            self.boxes[rows] = boxes[cols]
+            self.last_seen[rows] = timestamp
+            self.misses[rows] = 0
+            self.hits[rows] += 1
+
+            track_ids[cols] = self.ids[rows]
+            velocities[cols] = self.velocities[rows]
+            matched[cols] = self.hits[rows] > 2
+            assigned[cols] = True
+
+        # Age out tracks that were not seen
+        unmatched_tracks = np.ones(len(self.ids), dtype=bool)
+        unmatched_tracks[rows] = False
+        self.misses[unmatched_tracks] += 1
+        alive = self.misses <= self.max_age
+        self.ids = self.ids[alive]
+        self.boxes = self.boxes[alive]
+        self.velocities = self.velocities[alive]
+        self.last_seen = self.last_seen[alive]
+        self.misses = self.misses[alive]
+        self.hits = self.hits[alive]
+
+        # Start tracks for new detections
+        new = np.flatnonzero(~assigned)
+        if len(new):
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            track_ids[new] = new_ids
+
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.boxes = np.concatenate([self.boxes, boxes[new]])
+            self.velocities = np.concatenate([self.velocities, np.zeros((len(new), 2))])
+            self.last_seen = np.concatenate([self.last_seen, np.full(len(new), float(timestamp))])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=int)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=int)])
+
+        return track_ids, velocities, matched
@@ -6,18 +6,11 @@ let charts = {};
 // Initialize dashboard
 async function loadDashboardData() {
     try {
-        // Load system status
-        const statusResponse = await fetch('/api/status');
-        const statusData = await statusResponse.json();
-        
-        // Update status display
-        document.getElementById('activeCameras').textContent = 
-            statusData.analyses_count || 0;
-        
         // Load stats
         const statsResponse = await fetch('/api/stats');
         const statsData = await statsResponse.json();
         
+        document.getElementById('activeCameras').textContent = statsData.active_cameras || 0;
         document.getElementById('todayAlerts').textContent = statsData.today_alerts;
         document.getElementById('totalAnalyses').textContent = statsData.total_analyses;
         
@@ -121,15 +114,46 @@ function initializeCharts() {
             }
         }
     });
+    
+    loadCharts();
+}
+
+// Replace chart data with data from the chart API
+function setChartData(chart, data) {
+    chart.data.labels = data.labels;
+    // Keep the styling set up in initializeCharts
+    data.datasets.forEach((dataset, i) => {
+        chart.data.datasets[i] = Object.assign(chart.data.datasets[i] || {}, dataset);
+    });
+    chart.update();
+}
+
+// Load chart data
+async function loadCharts() {
+    try {
+        const [crowd, alerts, timeline] = await Promise.all(
+            ['crowd', 'alerts', 'timeline'].map(name =>
+                fetch(`/api/charts/${name}`).then(response => response.json())
+            )
+        );
+        setChartData(charts.crowd, crowd);
+        setChartData(charts.alert, alerts);
+        setChartData(charts.timeline, timeline);
+    } catch (error) {
+        console.error('Error loading charts:', error);
+    }
 }
 
 // Setup WebSocket connection
 function setupWebSocket() {
-    socket = io();
+    // WebSocket only: with several web workers the polling transport
+    // would spread one session over workers that do not know it
+    socket = io({ transports: ['websocket'] });
     
     socket.on('connect', function() {
         console.log('Connected to WebSocket');
         updateStatusIndicator(true);
+        socket.emit('subscribe_alerts', alertSubscription());
     });
     
     socket.on('disconnect', function() {
@@ -137,10 +161,28 @@ function setupWebSocket() {
         updateStatusIndicator(false);
     });
     
-    socket.on('alert', function(alert) {
-        console.log('New alert received:', alert);
-        addAlertToDashboard(alert);
-        showAlertNotification(alert);
+    // Alerts arrive in small batches, oldest first. Alerts we already
+    // show come again when their message is updated.
+    socket.on('alerts_batch', function(batch) {
+        batch.alerts.filter(alert => alert.revision && shownAlertIds.has(alert.id))
+            .forEach(updateAlertOnDashboard);
+        
+        const fresh = batch.alerts.filter(alert => !shownAlertIds.has(alert.id));
+        if (!fresh.length) return;
+        
+        console.log(`${fresh.length} new alert(s) received`);
+        fresh.forEach(addAlertToDashboard);
+        showAlertNotification(fresh[fresh.length - 1]);
+    });
+    
+    // Sent after the server skipped alerts because we fell behind
+    socket.on('alerts_summary', function(summary) {
+        console.log(`Missed ${summary.missed} alert(s), catching up`);
+        loadAlerts();
+    });
+    
+    socket.on('job_progress', function(job) {
+        console.log('Job progress:', job.job_id, job.status, job.progress + '%');
     });
     
     socket.on('analysis_complete', function(data) {
@@ -160,19 +202,83 @@ function updateStatusIndicator(isConnected) {
     }
 }
 
-// Load alerts
-async function loadAlerts() {
-    try {
-        const response = await fetch('/api/alerts?limit=5');
-        const raw = await response.text();
-console.log("RAW RESPONSE:", raw);
+// Newest alert the dashboard has shown; polls only ask for newer ones
+let latestAlertId = 0;
+const shownAlertIds = new Set();
+const MAX_DASHBOARD_ALERTS = 20;
 
-if (!raw) {
-    throw new Error("Empty response from backend");
+// Last ETag per URL, so unchanged polls come back as an empty 304
+const etags = {};
+
+async function fetchIfChanged(url) {
+    const headers = etags[url] ? { 'If-None-Match': etags[url] } : {};
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    
+    if (response.status === 304) {
+        return null;
+    }
+    if (!response.ok) {
+        throw new Error(`${url} returned ${response.status}`);
+    }
+    
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        etags[url] = etag;
+    }
+    return response.json();
 }
 
-const data = JSON.parse(raw);
+function alertItemHTML(alert) {
+    const time = new Date(alert.timestamp).toLocaleTimeString([], { 
+        hour: '2-digit', 
+        minute: '2-digit' 
+    });
+    
+    return `
+        <div class="alert-item ${alert.type}" data-alert-id="${alert.id || ''}">
+            <div class="alert-header">
+                <div class="alert-type">
+                    <i class="fas fa-${getAlertIcon(alert.type)}"></i>
+                    ${getAlertTitle(alert.type)}
+                </div>
+                <div class="alert-time">${time}</div>
+            </div>
+            <div class="alert-message">${alert.message}</div>
+            <div class="alert-severity severity-${alert.severity}">
+                ${alert.severity.toUpperCase()}
+            </div>
+        </div>
+    `;
+}
+
+// Alert rooms to join, e.g. index.html?severity=high&video_id=...
+function alertSubscription() {
+    const params = new URLSearchParams(window.location.search);
+    const subscription = {};
+    ['severity', 'video_id', 'camera_id'].forEach(key => {
+        const values = params.getAll(key);
+        if (values.length) {
+            subscription[key] = values;
+        }
+    });
+    return subscription;
+}
 
+// Load alerts
+async function loadAlerts() {
+    try {
+        if (latestAlertId) {
+            // Only alerts stored since the last poll, oldest first so the
+            // newest ends up on top
+            const data = await fetchIfChanged(`/api/alerts?after_id=${latestAlertId}&limit=${MAX_DASHBOARD_ALERTS}`);
+            if (data) {
+                data.alerts.slice().reverse().forEach(addAlertToDashboard);
+            }
+            return;
+        }
+        
+        const data = await fetchIfChanged('/api/alerts?limit=5');
+        if (!data) return;
         
         const container = document.getElementById('alertsContainer');
         
@@ -186,31 +292,9 @@ const data = JSON.parse(raw);
             return;
         }
         
-        let alertsHTML = '';
-        data.alerts.forEach(alert => {
-            const time = new Date(alert.timestamp).toLocaleTimeString([], { 
-                hour: '2-digit', 
-                minute: '2-digit' 
-            });
-            
-            alertsHTML += `
-                <div class="alert-item ${alert.type}">
-                    <div class="alert-header">
-                        <div class="alert-type">
-                            <i class="fas fa-${getAlertIcon(alert.type)}"></i>
-                            ${getAlertTitle(alert.type)}
-                        </div>
-                        <div class="alert-time">${time}</div>
-                    </div>
-                    <div class="alert-message">${alert.message}</div>
-                    <div class="alert-severity severity-${alert.severity}">
-                        ${alert.severity.toUpperCase()}
-                    </div>
-                </div>
-            `;
-        });
-        
-        container.innerHTML = alertsHTML;
+        data.alerts.forEach(alert => shownAlertIds.add(alert.id));
+        latestAlertId = data.latest_id;
+        container.innerHTML = data.alerts.map(alertItemHTML).join('');
         
     } catch (error) {
         console.error('Error loading alerts:', error);
@@ -237,6 +321,13 @@ function getAlertTitle(type) {
 
 // Add new alert to dashboard
 function addAlertToDashboard(alert) {
+    // Alerts can arrive over the socket and from a poll
+    if (alert.id) {
+        if (shownAlertIds.has(alert.id)) return;
+        shownAlertIds.add(alert.id);
+        latestAlertId = Math.max(latestAlertId, alert.id);
+    }
+    
     const container = document.getElementById('alertsContainer');
     const placeholder = container.querySelector('.alert-placeholder');
     
@@ -244,33 +335,24 @@ function addAlertToDashboard(alert) {
         container.innerHTML = '';
     }
     
-    const time = new Date(alert.timestamp).toLocaleTimeString([], { 
-        hour: '2-digit', 
-        minute: '2-digit' 
-    });
-    
-    const alertHTML = `
-        <div class="alert-item ${alert.type}">
-            <div class="alert-header">
-                <div class="alert-type">
-                    <i class="fas fa-${getAlertIcon(alert.type)}"></i>
-                    ${getAlertTitle(alert.type)}
-                </div>
-                <div class="alert-time">${time}</div>
-            </div>
-            <div class="alert-message">${alert.message}</div>
-            <div class="alert-severity severity-${alert.severity}">
-                ${alert.severity.toUpperCase()}
-            </div>
-        </div>
-    `;
+    container.insertAdjacentHTML('afterbegin', alertItemHTML(alert));
     
-    container.insertAdjacentHTML('afterbegin', alertHTML);
+    while (container.children.length > MAX_DASHBOARD_ALERTS) {
+        container.lastElementChild.remove();
+    }
     
     // Update charts
     updateChartsWithAlert(alert);
 }
 
+// Show the new message of an alert already on the dashboard
+function updateAlertOnDashboard(alert) {
+    const item = document.querySelector(`.alert-item[data-alert-id="${alert.id}"]`);
+    if (item) {
+        item.querySelector('.alert-message').textContent = alert.message;
+    }
+}
+
 function updateChartsWithAlert(alert) {
     if (!charts.alert || !charts.timeline) return;
     
@@ -281,9 +363,9 @@ function updateChartsWithAlert(alert) {
         charts.alert.update();
     }
     
-    // Update timeline chart (simplified)
-    const today = new Date().getDay();
-    charts.timeline.data.datasets[0].data[today]++;
+    // Update timeline chart, the last bar is today
+    const timelineData = charts.timeline.data.datasets[0].data;
+    timelineData[timelineData.length - 1]++;
     charts.timeline.update();
 }
 
@@ -304,13 +386,13 @@ function showAlertNotification(alert) {
 // Load recent activity
 async function loadRecentActivity() {
     try {
-        const response = await fetch('/api/alerts?limit=10');
-        const data = await response.json();
+        const activities = await fetchIfChanged('/api/activity?limit=10');
+        if (!activities) return;
         
         const container = document.getElementById('activityList');
         let activityHTML = '';
         
-        data.alerts.forEach(alert => {
+        activities.forEach(alert => {
             const time = new Date(alert.timestamp).toLocaleTimeString([], { 
                 hour: '2-digit', 
                 minute: '2-digit' 
@@ -339,6 +421,10 @@ async function loadRecentActivity() {
 async function analyzeVideo() {
     const videoInput = document.getElementById('videoInput');
     const privacyMode = document.getElementById('privacyMode').checked;
+    const parallelInput = document.getElementById('parallelMode');
+    const parallelMode = parallelInput ? parallelInput.checked : false;
+    const profileInput = document.getElementById('detectionProfile');
+    const anonymizeInput = document.getElementById('anonymizeMethod');
     const analyzeBtn = document.getElementById('analyzeBtn');
     const resultsContainer = document.getElementById('resultsContainer');
     const progressContainer = document.getElementById('progressContainer');
@@ -364,58 +450,40 @@ async function analyzeVideo() {
     progressContainer.style.display = 'block';
     alertSummary.style.display = 'none';
     
-    // Update progress
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-        progress += 10;
-        if (progress > 90) progress = 90;
-        
-        document.getElementById('progressFill').style.width = progress + '%';
-        document.getElementById('progressText').textContent = progress + '%';
-        
-        const stages = [
-            'Uploading video...',
-            'Initializing AI models...',
-            'Extracting frames...',
-            'Detecting objects...',
-            'Analyzing movement...',
-            'Checking for alerts...',
-            'Finalizing results...'
-        ];
-        
-        const stageIndex = Math.floor(progress / 15);
-        if (stageIndex < stages.length) {
-            document.getElementById('progressDetails').textContent = stages[stageIndex];
-        }
-    }, 500);
+    setProgress(0, 'Uploading video...');
     
     try {
         // Prepare form data
         const formData = new FormData();
         formData.append('video', videoInput.files[0]);
         formData.append('privacy_mode', privacyMode);
+        formData.append('parallel', parallelMode);
+        if (profileInput) {
+            formData.append('profile', profileInput.value);
+        }
+        if (anonymizeInput) {
+            formData.append('anonymize', anonymizeInput.value);
+        }
         
-        // Send to backend
+        // Send to backend, analysis runs as a background job
         const response = await fetch('/api/upload', {
             method: 'POST',
             body: formData
         });
         
-        clearInterval(progressInterval);
+        const job = await response.json();
+        if (!job.success) {
+            throw new Error(job.error || 'Upload failed');
+        }
         
-        // Complete progress
-        document.getElementById('progressFill').style.width = '100%';
-        document.getElementById('progressText').textContent = '100%';
-        document.getElementById('progressDetails').textContent = 'Analysis complete!';
+        // Repeat uploads of a clip are answered from the cache right away
+        const data = job.cached ? job : await waitForJob(job.job_id);
         
-        const data = await response.json();
+        // Complete progress
+        setProgress(100, 'Analysis complete!');
         
-        if (data.success) {
-            currentAnalysis = data;
-            showAnalysisResults(data);
-        } else {
-            throw new Error(data.error || 'Analysis failed');
-        }
+        currentAnalysis = data;
+        showAnalysisResults(data);
         
     } catch (error) {
         console.error('Error analyzing video:', error);
@@ -437,6 +505,37 @@ async function analyzeVideo() {
     }
 }
 
+function setProgress(progress, details) {
+    document.getElementById('progressFill').style.width = progress + '%';
+    document.getElementById('progressText').textContent = progress + '%';
+    document.getElementById('progressDetails').textContent = details;
+}
+
+// Poll an analysis job until it finishes
+async function waitForJob(jobId) {
+    const stages = {
+        'queued': 'Waiting for a free analysis worker...',
+        'analyzing': 'Detecting people and analyzing movement...',
+        'blurring': 'Blurring faces for privacy...',
+        'finalizing': 'Finalizing results...'
+    };
+    
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (job.status === 'completed') {
+            return { success: true, ...job };
+        }
+        if (job.status === 'failed' || job.error) {
+            throw new Error(job.error || 'Analysis failed');
+        }
+        
+        setProgress(job.progress, stages[job.stage] || 'Processing video...');
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 function showAnalysisResults(data) {
     const resultsContainer = document.getElementById('resultsContainer');
     const alertSummary = document.getElementById('alertSummary');
@@ -478,6 +577,15 @@ function showAnalysisResults(data) {
                 <h5>Analysis Summary</h5>
                 <p>${data.summary.description || 'Video analysis completed successfully.'}</p>
             </div>
+            
+            ${data.processed_video ? `
+            <div class="result-details">
+                <h5>Privacy-Protected Video</h5>
+                ${data.processed_video.endsWith('.m3u8')
+                    ? `<p><a href="${data.processed_video}" target="_blank">Open HLS playlist</a></p>`
+                    : `<video src="${data.processed_video}" controls preload="metadata" style="width: 100%;"></video>`}
+            </div>
+            ` : ''}
         </div>
     `;
     
@@ -503,6 +611,10 @@ function showAnalysisResults(data) {
                         <div class="summary-count">${alert.severity.toUpperCase()}</div>
                     </div>
                     <div class="summary-details">${alert.message}</div>
+                    ${alert.end_timestamp !== undefined ? `
+                    <div class="summary-details">
+                        ${alert.timestamp.toFixed(1)}s – ${alert.end_timestamp.toFixed(1)}s
+                    </div>` : ''}
                 </div>
             `;
         });
@@ -615,6 +727,7 @@ function startLiveUpdates() {
     // Update dashboard every 30 seconds
     setInterval(() => {
         loadDashboardData();
+        loadCharts();
     }, 30000);
     
     // Simulate occasional alerts for demo